@@ -0,0 +1,44 @@
+"""add hot path indexes
+
+Indexes are built CONCURRENTLY, so the tables stay writable while they build.
+
+Revision ID: 39b460164299
+Revises: c808b0efc890
+Create Date: 2026-10-17 19:11:01.821894
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '39b460164299'
+down_revision: Union[str, None] = 'c808b0efc890'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    with op.get_context().autocommit_block():
+        op.create_index('ix_cards_user_id', 'cards', ['user_id'], unique=False, postgresql_concurrently=True)
+        op.create_index('ix_services_business_id', 'services', ['business_id'], unique=False, postgresql_concurrently=True)
+        op.create_index('ix_services_active_created_at', 'services', ['created_at', 'service_id'], unique=False, postgresql_where=sa.text("status = 'active'"), postgresql_concurrently=True)
+        op.create_index('ix_services_active_price', 'services', ['price', 'service_id'], unique=False, postgresql_where=sa.text("status = 'active'"), postgresql_concurrently=True)
+        op.create_index('ix_subscriptions_user_id_service_id', 'subscriptions', ['user_id', 'service_id'], unique=False, postgresql_concurrently=True)
+        op.create_index('ix_subscriptions_service_id_status', 'subscriptions', ['service_id', 'status'], unique=False, postgresql_concurrently=True)
+        op.create_index('ix_transactions_subscription_id_created_at', 'transactions', ['subscription_id', 'created_at'], unique=False, postgresql_concurrently=True)
+        op.create_index('ix_transactions_pending', 'transactions', ['subscription_id'], unique=False, postgresql_where=sa.text("status = 'Pending'"), postgresql_concurrently=True)
+
+
+def downgrade() -> None:
+    with op.get_context().autocommit_block():
+        op.drop_index('ix_transactions_pending', table_name='transactions', postgresql_concurrently=True)
+        op.drop_index('ix_transactions_subscription_id_created_at', table_name='transactions', postgresql_concurrently=True)
+        op.drop_index('ix_subscriptions_service_id_status', table_name='subscriptions', postgresql_concurrently=True)
+        op.drop_index('ix_subscriptions_user_id_service_id', table_name='subscriptions', postgresql_concurrently=True)
+        op.drop_index('ix_services_active_price', table_name='services', postgresql_concurrently=True)
+        op.drop_index('ix_services_active_created_at', table_name='services', postgresql_concurrently=True)
+        op.drop_index('ix_services_business_id', table_name='services', postgresql_concurrently=True)
+        op.drop_index('ix_cards_user_id', table_name='cards', postgresql_concurrently=True)
@@ -0,0 +1,48 @@
+"""add next_billing_at
+
+Revision ID: 3a4008355956
+Revises: d9023fbb6346
+Create Date: 2026-10-17 11:03:27.530818
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '3a4008355956'
+down_revision: Union[str, None] = 'd9023fbb6346'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+BACKFILL_BATCH_SIZE = 10000
+
+
+def upgrade() -> None:
+    op.add_column('subscriptions', sa.Column('next_billing_at', sa.TIMESTAMP(timezone=True), nullable=True))
+
+    # Backfill in batches: first 30-day cycle boundary after subscription_date that is not in the past
+    connection = op.get_bind()
+    while True:
+        result = connection.execute(sa.text("""
+            UPDATE subscriptions
+            SET next_billing_at = subscription_date + make_interval(days => 30 * GREATEST(1, CEIL(
+                EXTRACT(EPOCH FROM now() - subscription_date) / 2592000
+            ))::int)
+            WHERE subscription_id IN (
+                SELECT subscription_id FROM subscriptions
+                WHERE next_billing_at IS NULL
+                LIMIT :batch_size
+            )
+        """), {"batch_size": BACKFILL_BATCH_SIZE})
+        if result.rowcount < BACKFILL_BATCH_SIZE:
+            break
+
+    op.create_index(op.f('ix_subscriptions_next_billing_at'), 'subscriptions', ['next_billing_at'], unique=False)
+
+
+def downgrade() -> None:
+    op.drop_index(op.f('ix_subscriptions_next_billing_at'), table_name='subscriptions')
+    op.drop_column('subscriptions', 'next_billing_at')
@@ -0,0 +1,40 @@
+"""add business_daily_stats
+
+Populate after upgrading with: python -m app.worker rebuild-stats
+
+Revision ID: 675410688203
+Revises: 3a4008355956
+Create Date: 2026-10-17 12:21:54.902114
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '675410688203'
+down_revision: Union[str, None] = '3a4008355956'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.create_table('business_daily_stats',
+    sa.Column('business_id', sa.Integer(), nullable=False),
+    sa.Column('day', sa.Date(), nullable=False),
+    sa.Column('service_id', sa.Integer(), nullable=False),
+    sa.Column('new_subscribers', sa.Integer(), server_default=sa.text('0'), nullable=False),
+    sa.Column('revenue', sa.Float(), server_default=sa.text('0'), nullable=False),
+    sa.Column('active_subscriptions', sa.Integer(), server_default=sa.text('0'), nullable=False),
+    sa.ForeignKeyConstraint(['business_id'], ['businesses.business_id'], ondelete='CASCADE'),
+    sa.ForeignKeyConstraint(['service_id'], ['services.service_id'], ondelete='CASCADE'),
+    sa.PrimaryKeyConstraint('business_id', 'day', 'service_id')
+    )
+    op.create_index('ix_business_daily_stats_service_id_day', 'business_daily_stats', ['service_id', 'day'], unique=False)
+
+
+def downgrade() -> None:
+    op.drop_index('ix_business_daily_stats_service_id_day', table_name='business_daily_stats')
+    op.drop_table('business_daily_stats')
@@ -0,0 +1,44 @@
+"""add services search_vector
+
+Revision ID: 92b47a5082b1
+Revises: 675410688203
+Create Date: 2026-10-17 14:08:41.263517
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+
+# revision identifiers, used by Alembic.
+revision: str = '92b47a5082b1'
+down_revision: Union[str, None] = '675410688203'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.add_column('services', sa.Column('search_vector', postgresql.TSVECTOR(), nullable=True))
+
+    # Backfill with the same weights as app/fulltext.py: name A, category B, city C, description D
+    op.execute("""
+        UPDATE services
+        SET search_vector =
+            setweight(to_tsvector('simple', coalesce(services.name, '')), 'A') ||
+            setweight(to_tsvector('simple', coalesce((
+                SELECT categories.name FROM categories WHERE categories.category_id = services.category_id
+            ), '')), 'B') ||
+            setweight(to_tsvector('simple', coalesce(businesses.city, '')), 'C') ||
+            setweight(to_tsvector('simple', coalesce(services.description, '')), 'D')
+        FROM businesses
+        WHERE services.business_id = businesses.business_id
+    """)
+
+    op.create_index('ix_services_search_vector', 'services', ['search_vector'], unique=False, postgresql_using='gin')
+
+
+def downgrade() -> None:
+    op.drop_index('ix_services_search_vector', table_name='services', postgresql_using='gin')
+    op.drop_column('services', 'search_vector')
@@ -0,0 +1,28 @@
+"""add categories ranking index
+
+Populate after upgrading with: python -m app.worker rank-categories
+
+Revision ID: c808b0efc890
+Revises: e656ecaa6f70
+Create Date: 2026-10-17 15:41:27.905126
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'c808b0efc890'
+down_revision: Union[str, None] = 'e656ecaa6f70'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.create_index('ix_categories_ranking', 'categories', ['ranking', 'category_id'], unique=False)
+
+
+def downgrade() -> None:
+    op.drop_index('ix_categories_ranking', table_name='categories')
@@ -0,0 +1,54 @@
+"""add archive tables
+
+Revision ID: d9023fbb6346
+Revises: c30819048e79
+Create Date: 2026-10-17 10:12:48.214305
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'd9023fbb6346'
+down_revision: Union[str, None] = 'c30819048e79'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.create_table('subscriptions_archive',
+    sa.Column('subscription_id', sa.Integer(), autoincrement=False, nullable=False),
+    sa.Column('subscription_date', sa.TIMESTAMP(timezone=True), nullable=False),
+    sa.Column('expiry_date', sa.Date(), nullable=True),
+    sa.Column('status', sa.String(), nullable=True),
+    sa.Column('total_days_left', sa.Integer(), nullable=True),
+    sa.Column('days_till_next_payment', sa.Integer(), nullable=True),
+    sa.Column('user_id', sa.Integer(), nullable=False),
+    sa.Column('service_id', sa.Integer(), nullable=False),
+    sa.Column('archived_at', sa.TIMESTAMP(timezone=True), server_default=sa.text('now()'), nullable=False),
+    sa.PrimaryKeyConstraint('subscription_id')
+    )
+    op.create_index(op.f('ix_subscriptions_archive_user_id'), 'subscriptions_archive', ['user_id'], unique=False)
+    op.create_index(op.f('ix_subscriptions_archive_service_id'), 'subscriptions_archive', ['service_id'], unique=False)
+    op.create_table('transactions_archive',
+    sa.Column('transaction_id', sa.Integer(), autoincrement=False, nullable=False),
+    sa.Column('amount', sa.Float(), nullable=False),
+    sa.Column('created_at', sa.TIMESTAMP(timezone=True), nullable=False),
+    sa.Column('status', sa.String(), nullable=False),
+    sa.Column('card_brand', sa.String(), nullable=False),
+    sa.Column('subscription_id', sa.Integer(), nullable=False),
+    sa.Column('archived_at', sa.TIMESTAMP(timezone=True), server_default=sa.text('now()'), nullable=False),
+    sa.PrimaryKeyConstraint('transaction_id')
+    )
+    op.create_index(op.f('ix_transactions_archive_subscription_id'), 'transactions_archive', ['subscription_id'], unique=False)
+
+
+def downgrade() -> None:
+    op.drop_index(op.f('ix_transactions_archive_subscription_id'), table_name='transactions_archive')
+    op.drop_table('transactions_archive')
+    op.drop_index(op.f('ix_subscriptions_archive_service_id'), table_name='subscriptions_archive')
+    op.drop_index(op.f('ix_subscriptions_archive_user_id'), table_name='subscriptions_archive')
+    op.drop_table('subscriptions_archive')
@@ -0,0 +1,30 @@
+"""add updated_at to services, businesses and categories
+
+Revision ID: e656ecaa6f70
+Revises: 92b47a5082b1
+Create Date: 2026-10-17 15:02:13.418960
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'e656ecaa6f70'
+down_revision: Union[str, None] = '92b47a5082b1'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.add_column('businesses', sa.Column('updated_at', sa.TIMESTAMP(timezone=True), server_default=sa.text('now()'), nullable=False))
+    op.add_column('categories', sa.Column('updated_at', sa.TIMESTAMP(timezone=True), server_default=sa.text('now()'), nullable=False))
+    op.add_column('services', sa.Column('updated_at', sa.TIMESTAMP(timezone=True), server_default=sa.text('now()'), nullable=False))
+
+
+def downgrade() -> None:
+    op.drop_column('services', 'updated_at')
+    op.drop_column('categories', 'updated_at')
+    op.drop_column('businesses', 'updated_at')
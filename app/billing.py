@@ -0,0 +1,175 @@
+from sqlalchemy import insert, update, select, literal, and_
+from sqlalchemy.orm import Session
+from sqlalchemy.sql import func
+from datetime import datetime, timedelta
+from pytz import UTC
+from .config import settings
+from . import models, billing_cycle, stats, cache
+import logging
+import time
+
+logger = logging.getLogger(__name__)
+
+# A pending transaction is opened this many days before the payment date
+PENDING_DAYS_BEFORE_PAYMENT = 5
+
+
+# Billing engine: owns creation and completion of recurring transactions.
+# Runs from the scheduled worker (python -m app.worker), never from a request.
+# Due subscriptions are found through the index on next_billing_at, so each pass only
+# touches rows that are due; work is done in chunks with one commit per chunk.
+#
+# Policy: a due subscription is charged at most once per run, then every due subscription
+# (paid or not) moves to its next future payment date. Missed cycles, e.g. after the
+# worker was down, are not back-billed. Subscriptions without a card get no pending
+# transaction; their cycle is advanced unpaid and logged as skipped.
+def process_transactions(db: Session, chunk_size: int = None):
+    chunk_size = chunk_size or settings.billing_chunk_size
+    now = datetime.utcnow().replace(tzinfo=UTC)
+    started = time.perf_counter()
+
+    totals = {
+        "scheduled": run_in_chunks(db, schedule_subscriptions, chunk_size, now),
+        "created": run_in_chunks(db, create_pending_transactions, chunk_size, now),
+        "completed": run_in_chunks(db, complete_pending_transactions, chunk_size, now),
+        "advanced": run_in_chunks(db, advance_due_subscriptions, chunk_size, now),
+    }
+
+    elapsed = time.perf_counter() - started
+    rows = sum(totals.values())
+    logger.info(
+        f"Billing run: {totals['scheduled']} scheduled, {totals['created']} created, "
+        f"{totals['completed']} completed, {totals['advanced']} advanced in {elapsed:.2f}s ({rows / elapsed if elapsed else 0:.0f} rows/s)"
+    )
+    return totals
+
+
+def run_in_chunks(db: Session, step, chunk_size: int, now: datetime) -> int:
+    # Repeat a step until it handles less than a full chunk; each step excludes the rows it already handled
+    total = 0
+    while True:
+        chunk_started = time.perf_counter()
+        rows = step(db, chunk_size, now)
+        db.commit()
+
+        total += rows
+        elapsed = time.perf_counter() - chunk_started
+        logger.info(f"Billing {step.__name__}: {rows} rows ({rows / elapsed if elapsed else 0:.0f} rows/s)")
+        if rows < chunk_size:
+            return total
+
+
+def due_subscriptions(now: datetime, within: timedelta = timedelta(0)):
+    # Index range scan on next_billing_at, over live subscriptions only: billing runs before
+    # the expiry sweep, so subscriptions past their expiry date may still be in the table
+    return and_(
+        models.Subscription.next_billing_at <= now + within,
+        models.Subscription.status == "active",
+        models.Subscription.expiry_date >= now.date()
+    )
+
+
+def schedule_subscriptions(db: Session, chunk_size: int, now: datetime) -> int:
+    # Backfill next_billing_at for rows created without one
+    unscheduled = (
+        select(models.Subscription.subscription_id)
+        .where(models.Subscription.next_billing_at.is_(None))
+        .limit(chunk_size)
+    )
+    stmt = (
+        update(models.Subscription)
+        .where(models.Subscription.subscription_id.in_(unscheduled))
+        .values(next_billing_at=billing_cycle.next_payment_date_expr(models.Subscription.subscription_date, now))
+        .execution_options(synchronize_session=False)
+    )
+    return db.execute(stmt).rowcount
+
+
+def create_pending_transactions(db: Session, chunk_size: int, now: datetime) -> int:
+    # INSERT ... SELECT a pending transaction for every subscription due within the next 5 days
+    card_brand = (
+        select(models.Card.card_brand)
+        .where(models.Card.user_id == models.Subscription.user_id)
+        .order_by(models.Card.card_id)
+        .limit(1)
+        .scalar_subquery()
+    )
+    pending_exists = (
+        select(models.Transaction.transaction_id)
+        .where(
+            models.Transaction.subscription_id == models.Subscription.subscription_id,
+            models.Transaction.status == "Pending"
+        )
+        .exists()
+    )
+    due = (
+        select(
+            models.Service.price,
+            literal("Pending"),
+            models.Subscription.subscription_id,
+            card_brand
+        )
+        .join(models.Service, models.Service.service_id == models.Subscription.service_id)
+        .where(
+            due_subscriptions(now, timedelta(days=PENDING_DAYS_BEFORE_PAYMENT)),
+            ~pending_exists,
+            card_brand.isnot(None)
+        )
+        .limit(chunk_size)
+    )
+    stmt = insert(models.Transaction).from_select(
+        ["amount", "status", "subscription_id", "card_brand"], due
+    )
+    return db.execute(stmt).rowcount
+
+
+def complete_pending_transactions(db: Session, chunk_size: int, now: datetime) -> int:
+    # One UPDATE per chunk: settle pending transactions whose payment date has arrived
+    pending = (
+        select(models.Transaction.transaction_id)
+        .join(models.Subscription, models.Subscription.subscription_id == models.Transaction.subscription_id)
+        .where(models.Transaction.status == "Pending", due_subscriptions(now))
+        .limit(chunk_size)
+    )
+    stmt = (
+        update(models.Transaction)
+        .where(models.Transaction.transaction_id.in_(pending))
+        .values(status="Complete", created_at=func.now())
+        .returning(models.Transaction.transaction_id, models.Transaction.subscription_id)
+        .execution_options(synchronize_session=False)
+    )
+    completed = db.execute(stmt).all()
+    if completed:
+        stats.record_completed_transactions(db, [row.transaction_id for row in completed])
+    return len(completed)
+
+
+def advance_due_subscriptions(db: Session, chunk_size: int, now: datetime) -> int:
+    # Move every due subscription to its next future payment date; runs after completion,
+    # so this cycle's payment (if any) has already been taken
+    has_card = (
+        select(models.Card.card_id)
+        .where(models.Card.user_id == models.Subscription.user_id)
+        .exists()
+    )
+    due = (
+        select(models.Subscription.subscription_id)
+        .where(due_subscriptions(now))
+        .limit(chunk_size)
+    )
+    stmt = (
+        update(models.Subscription)
+        .where(models.Subscription.subscription_id.in_(due))
+        .values(next_billing_at=billing_cycle.catch_up_expr(models.Subscription.next_billing_at, now))
+        .returning(models.Subscription.subscription_id, models.Subscription.user_id, has_card.label("has_card"))
+        .execution_options(synchronize_session=False)
+    )
+    advanced = db.execute(stmt).all()
+    # Commit before bumping the tags, so a page rebuilt in between isn't cached as current
+    db.commit()
+    cache.catalog.invalidate(*sorted({f"user:{row.user_id}" for row in advanced}))
+
+    skipped = [row.subscription_id for row in advanced if not row.has_card]
+    if skipped:
+        logger.warning(f"Billing skipped {len(skipped)} due subscriptions without a card: {skipped[:20]}")
+    return len(advanced)
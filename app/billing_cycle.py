@@ -0,0 +1,68 @@
+from datetime import datetime, timedelta
+from sqlalchemy import Integer, cast, literal
+from sqlalchemy.sql import func
+from pytz import UTC
+
+# Payments occur every 30 days, counted from the subscription date
+BILLING_PERIOD = timedelta(days=30)
+
+_PERIOD_US = BILLING_PERIOD // timedelta(microseconds=1)
+
+
+def _as_utc(value: datetime) -> datetime:
+    if value.tzinfo is None:
+        return value.replace(tzinfo=UTC)
+    return value.astimezone(UTC)
+
+
+# Closed form of "add 30 days until the date is no longer in the past": the next payment
+# is the first whole period (at least one) after the subscription date that is >= now.
+def next_payment_date(subscription_date: datetime, now: datetime = None) -> datetime:
+    now = _as_utc(now or datetime.utcnow())
+    subscription_date = _as_utc(subscription_date)
+
+    elapsed_us = (now - subscription_date) // timedelta(microseconds=1)
+    periods = max(1, -(-elapsed_us // _PERIOD_US))
+    return subscription_date + periods * BILLING_PERIOD
+
+
+def days_till_next_payment(subscription_date: datetime, now: datetime = None) -> int:
+    now = _as_utc(now or datetime.utcnow())
+    return (next_payment_date(subscription_date, now) - now).days
+
+
+# Whole days left until a known payment date (0 once it is due)
+def days_until(payment_date: datetime, now: datetime = None) -> int:
+    now = _as_utc(now or datetime.utcnow())
+    return max(0, (_as_utc(payment_date) - now).days)
+
+
+# SQL forms of the above, for set-based queries over subscriptions
+def next_payment_date_expr(subscription_date, now: datetime = None):
+    now = literal(_as_utc(now or datetime.utcnow()))
+    period_seconds = BILLING_PERIOD.total_seconds()
+    elapsed = func.extract("epoch", now - subscription_date)
+    periods = func.greatest(1, func.ceil(elapsed / period_seconds))
+    return subscription_date + func.make_interval(0, 0, 0, cast(periods * BILLING_PERIOD.days, Integer))
+
+
+def days_till_next_payment_expr(subscription_date, now: datetime = None):
+    now = literal(_as_utc(now or datetime.utcnow()))
+    period_seconds = BILLING_PERIOD.total_seconds()
+    elapsed = func.extract("epoch", now - subscription_date)
+    periods = func.greatest(1, func.ceil(elapsed / period_seconds))
+    return cast(func.floor((periods * period_seconds - elapsed) / 86400), Integer)
+
+
+def catch_up_expr(payment_date, now: datetime = None):
+    # First date after now on the cycle of a payment date that has passed: a subscription
+    # that missed several cycles moves straight to its next future payment date
+    now = literal(_as_utc(now or datetime.utcnow()))
+    period_seconds = BILLING_PERIOD.total_seconds()
+    periods = func.floor(func.extract("epoch", now - payment_date) / period_seconds) + 1
+    return payment_date + func.make_interval(0, 0, 0, cast(periods * BILLING_PERIOD.days, Integer))
+
+
+def days_until_expr(payment_date, now: datetime = None):
+    now = literal(_as_utc(now or datetime.utcnow()))
+    return cast(func.greatest(0, func.floor(func.extract("epoch", payment_date - now) / 86400)), Integer)
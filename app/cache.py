@@ -0,0 +1,315 @@
+from collections import OrderedDict
+from threading import Lock
+from fastapi import Response
+from pydantic import TypeAdapter
+from .config import settings
+import asyncio
+import logging
+import math
+import pickle
+import re
+import time
+
+logger = logging.getLogger(__name__)
+
+_MISSING = object()
+
+
+# Small in-process cache with a per-entry time to live. Each worker process holds its
+# own copy, so entries written by other processes are only bounded by the TTL.
+class TTLCache:
+    def __init__(self, ttl: float, maxsize: int = 10000):
+        self.ttl = ttl
+        self.maxsize = maxsize
+        self._entries = {}
+        self._lock = Lock()
+
+    def get(self, key, default=None):
+        with self._lock:
+            entry = self._entries.get(key, _MISSING)
+            if entry is _MISSING:
+                return default
+            expires_at, value = entry
+            if expires_at <= time.monotonic():
+                del self._entries[key]
+                return default
+            return value
+
+    def set(self, key, value):
+        if self.ttl <= 0:
+            return
+        with self._lock:
+            if len(self._entries) >= self.maxsize and key not in self._entries:
+                self._evict_expired()
+                if len(self._entries) >= self.maxsize:
+                    # Still full: drop the oldest insertion
+                    del self._entries[next(iter(self._entries))]
+            self._entries[key] = (time.monotonic() + self.ttl, value)
+
+    def delete(self, key):
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def _evict_expired(self):
+        now = time.monotonic()
+        for key in [key for key, (expires_at, _) in self._entries.items() if expires_at <= now]:
+            del self._entries[key]
+
+
+# Bounded least-recently-used mapping without expiry
+class LRUCache:
+    def __init__(self, maxsize: int):
+        self.maxsize = maxsize
+        self._entries = OrderedDict()
+        self._lock = Lock()
+
+    def get(self, key, default=None):
+        with self._lock:
+            value = self._entries.get(key, _MISSING)
+            if value is _MISSING:
+                return default
+            self._entries.move_to_end(key)
+            return value
+
+    def set(self, key, value):
+        if self.maxsize <= 0:
+            return
+        with self._lock:
+            self._entries[key] = value
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+# Business dashboard metrics, keyed by business_id
+business_metrics = TTLCache(settings.metrics_cache_ttl_seconds)
+
+
+def invalidate_business_metrics(business_id: int):
+    business_metrics.delete(business_id)
+
+
+# Catalog cache: serialized responses tagged with the entities they were built from.
+# Invalidating a tag bumps its version; entries remember the versions of their tags
+# when built and are ignored once any of them has moved on.
+class LocalBackend:
+    blocking = False
+
+    def __init__(self, max_bytes: int, max_tags: int = 100000):
+        self.max_bytes = max_bytes
+        self.max_tags = max_tags
+        self._entries = OrderedDict()
+        self._bytes = 0
+        self._versions = {}
+        self._epoch = 0
+        self._lock = Lock()
+
+    def get(self, key):
+        with self._lock:
+            item = self._entries.get(key)
+            if item is None:
+                return None
+            expires_at, size, entry = item
+            if expires_at <= time.monotonic():
+                self._pop(key)
+                return None
+            self._entries.move_to_end(key)
+            return entry
+
+    def set(self, key, entry, size: int, ttl: float):
+        if size > self.max_bytes:
+            return
+        with self._lock:
+            self._pop(key)
+            # Least recently used entries go first
+            while self._entries and self._bytes + size > self.max_bytes:
+                self._pop(next(iter(self._entries)))
+            self._entries[key] = (time.monotonic() + ttl, size, entry)
+            self._bytes += size
+
+    def versions(self, tags):
+        with self._lock:
+            return (self._epoch, *(self._versions.get(tag, 0) for tag in tags))
+
+    def bump(self, tags):
+        with self._lock:
+            if len(self._versions) + len(tags) > self.max_tags:
+                # Forgetting versions could revive stale entries, so start a new epoch instead
+                self._versions.clear()
+                self._epoch += 1
+            for tag in tags:
+                self._versions[tag] = self._versions.get(tag, 0) + 1
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+            self._epoch += 1
+
+    def _pop(self, key):
+        item = self._entries.pop(key, None)
+        if item is not None:
+            self._bytes -= item[1]
+
+
+class RedisBackend:
+    # Shared between processes and workers; memory is bounded by the server's maxmemory policy
+    blocking = True
+
+    def __init__(self, url: str, prefix: str = "semprefy:cache:"):
+        import redis
+
+        self._redis = redis.Redis.from_url(url)
+        self.prefix = prefix
+
+    def get(self, key):
+        raw = self._redis.get(self.prefix + key)
+        return pickle.loads(raw) if raw is not None else None
+
+    def set(self, key, entry, size: int, ttl: float):
+        self._redis.set(self.prefix + key, pickle.dumps(entry), ex=max(1, math.ceil(ttl)))
+
+    def versions(self, tags):
+        if not tags:
+            return ()
+        return tuple(int(v or 0) for v in self._redis.mget([self.prefix + "tag:" + tag for tag in tags]))
+
+    def bump(self, tags):
+        pipeline = self._redis.pipeline()
+        for tag in tags:
+            pipeline.incr(self.prefix + "tag:" + tag)
+        pipeline.execute()
+
+    def clear(self):
+        for key in self._redis.scan_iter(self.prefix + "*"):
+            self._redis.delete(key)
+
+
+class TaggedCache:
+    def __init__(self, backend, ttl: float):
+        self.backend = backend
+        self.ttl = ttl
+
+    def cached(self, key: str, tags, build, store: bool = True):
+        # build() returns (value, extra_tags); value must be picklable bytes-like data.
+        # store=False still serves hits but doesn't keep the built value.
+        if self.ttl <= 0:
+            return build()[0]
+        hit, versions = self.lookup(key, tags)
+        if hit is not None:
+            return hit
+        value, extra_tags = build()
+        if store:
+            self.store(key, tags, versions, value, extra_tags)
+        return value
+
+    async def cached_async(self, key: str, tags, build, store: bool = True):
+        # Same as cached() with an async build(). A blocking backend (Redis) is called from
+        # a worker thread so its round trips don't stall the event loop.
+        if self.ttl <= 0:
+            return (await build())[0]
+        hit, versions = await self._call(self.lookup, key, tags)
+        if hit is not None:
+            return hit
+        value, extra_tags = await build()
+        if store:
+            await self._call(self.store, key, tags, versions, value, extra_tags)
+        return value
+
+    async def _call(self, func, *args):
+        if self.backend.blocking:
+            return await asyncio.to_thread(func, *args)
+        return func(*args)
+
+    def lookup(self, key: str, tags):
+        # (value, None) on a hit; (None, versions of tags) on a miss, taken before the build
+        try:
+            entry = self.backend.get(key)
+            if entry is not None:
+                entry_tags, versions, value = entry
+                if self.backend.versions(entry_tags) == versions:
+                    return value, None
+            return None, self.backend.versions(tags)
+        except Exception:
+            logger.exception("Catalog cache read failed")
+            return None, None
+
+    def store(self, key: str, tags, versions, value, extra_tags):
+        if versions is None:
+            return
+        try:
+            if extra_tags:
+                tags = [*tags, *extra_tags]
+                versions = (*versions, *self.backend.versions(extra_tags)[-len(extra_tags):])
+            self.backend.set(key, (list(tags), versions, value), entry_size(value), self.ttl)
+        except Exception:
+            logger.exception("Catalog cache write failed")
+
+    def invalidate(self, *tags):
+        try:
+            self.backend.bump(tags)
+        except Exception:
+            logger.exception(f"Catalog cache invalidation failed for {tags}")
+
+    def clear(self):
+        self.backend.clear()
+
+
+def entry_size(value) -> int:
+    body, headers = value
+    return len(body) + sum(len(k) + len(v) for k, v in headers.items())
+
+
+def catalog_backend():
+    if settings.cache_redis_url:
+        return RedisBackend(settings.cache_redis_url)
+    return LocalBackend(settings.catalog_cache_max_bytes)
+
+
+catalog = TaggedCache(catalog_backend(), settings.catalog_cache_ttl_seconds)
+
+
+# /services/all pages are tagged with the businesses they show, which service and business
+# edits bump, and with the scope new services can enter them from: "catalog" for
+# unfiltered and search pages, otherwise the category and city they filter on. Filters
+# match word prefixes (fulltext.prefix_query), so a filter is tagged by the first
+# SCOPE_PREFIX letters of its first word, and a service that may enter lists bumps every
+# such prefix of the words of its category and city.
+SCOPE_PREFIX = 3
+
+
+def words(value: str):
+    return re.findall(r"\w+", (value or "").lower())
+
+
+def list_scope_tags(category: str = None, city: str = None, search: str = None):
+    tags = [f"{kind}:{words(value)[0][:SCOPE_PREFIX]}" for kind, value in (("category", category), ("city", city)) if words(value)]
+    if not tags or words(search):
+        return ["catalog"]
+    return tags
+
+
+def entry_scope_tags(category: str = None, city: str = None):
+    # Scopes a service in this category and city enters when created, activated or edited
+    tags = ["catalog"]
+    for kind, value in (("category", category), ("city", city)):
+        tags += sorted({f"{kind}:{word[:n]}" for word in words(value) for n in range(1, min(len(word), SCOPE_PREFIX) + 1)})
+    return tags
+
+
+def json_response(adapter: TypeAdapter, value, headers: dict = None):
+    # Serialize through the response schema once, so cache hits can be returned as-is
+    return adapter.dump_json(adapter.validate_python(value, from_attributes=True)), headers or {}
+
+
+def to_response(value) -> Response:
+    body, headers = value
+    return Response(content=body, media_type="application/json", headers=headers)
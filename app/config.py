@@ -1,4 +1,6 @@
+from pydantic import PositiveFloat, PositiveInt
 from pydantic_settings import BaseSettings
+from typing import Optional
 
 
 # After setting env variables in the system(YT FastAPI Sanjeev video 8:50-9:20), validation and accessing is below
@@ -11,6 +13,29 @@ class Settings(BaseSettings):
     secret_key: str
     algorithm: str
     access_token_expire_minutes: int
+    async_db_pool: bool = True
+    
+    # Connection pool settings (per engine, per process); the db_* pool applies to the oltp workload
+    db_pool_size: int = 5
+    db_max_overflow: int = 10
+    db_pool_timeout: float = 30  # seconds to wait for a connection before failing
+    db_pool_recycle: int = 1800  # replace connections older than this many seconds
+    db_pool_pre_ping: bool = True  # test connections on checkout, so stale ones are replaced
+    db_statement_timeout_ms: int = 10000  # 0 disables
+    
+    # Separate pools for dashboard aggregates and background jobs, so they can't starve oltp
+    db_analytics_pool_size: int = 3
+    db_analytics_max_overflow: int = 2
+    db_analytics_pool_timeout: float = 3  # fail fast rather than hold request threads
+    db_analytics_statement_timeout_ms: int = 30000
+    db_batch_pool_size: int = 2
+    db_batch_max_overflow: int = 0
+    db_batch_pool_timeout: float = 30
+    db_batch_statement_timeout_ms: int = 0
+    
+    # Read replica (postgresql:// URL); read-only routes use it when set
+    database_replica_url: Optional[str] = None
+    database_replica_retry_seconds: float = 30  # read from the primary this long after a replica failure
     
     # AWS settings
     aws_access_key_id: str
@@ -18,6 +43,36 @@ class Settings(BaseSettings):
     aws_bucket_name: str
     aws_region: str
     
+    # Billing worker settings
+    billing_chunk_size: int = 10000
+    expiry_batch_size: int = 1000
+    
+    # Cache settings
+    metrics_cache_ttl_seconds: int = 30
+    token_cache_size: int = 10000
+    principal_cache_ttl_seconds: int = 30
+    suggest_index_refresh_seconds: int = 300
+    catalog_cache_ttl_seconds: int = 60
+    catalog_cache_max_bytes: int = 64 * 1024 * 1024
+    cache_redis_url: Optional[str] = None  # share the catalog cache between processes
+    
+    # Password hashing settings
+    bcrypt_rounds: int = 12
+    password_pool_size: int = 2  # worker processes; 0 hashes inline
+    password_max_pending: int = 16
+    
+    # Login throttling (token buckets: burst size and refill per minute)
+    login_ip_burst: PositiveInt = 30
+    login_ip_per_minute: PositiveFloat = 30
+    login_account_burst: PositiveInt = 5
+    login_account_per_minute: PositiveFloat = 5
+    login_throttle_max_keys: int = 100000
+    throttle_redis_url: Optional[str] = None  # share buckets between processes
+    trusted_proxy_hops: int = 0  # proxies in front of the app appending to X-Forwarded-For (1 behind the Heroku router)
+    
+    # Bearer token for scraping /metrics; the endpoint answers 404 while unset
+    metrics_token: Optional[str] = None
+    
     class Config: #for dev env we are using .env file, for production -> need to set up in the system
         env_file = ".env"
     
@@ -1,12 +1,151 @@
-from sqlalchemy import create_engine
+from fastapi import Request
+from sqlalchemy import create_engine, event, exc, make_url
+from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import NullPool, QueuePool, AsyncAdaptedQueuePool
 from .config import settings
+from . import metrics
+import logging
+import time
+
+logger = logging.getLogger(__name__)
 
 SQLALCHEMY_DATABASE_URL = f"postgresql://{settings.database_username}:{settings.database_password}@{settings.database_hostname}:{settings.database_port}/{settings.database_name}"
+ASYNC_DATABASE_URL = f"postgresql+asyncpg://{settings.database_username}:{settings.database_password}@{settings.database_hostname}:{settings.database_port}/{settings.database_name}"
+
+
+# Pools that report how long each checkout waited (including pre-ping and opening new
+# connections) and how many gave up after pool_timeout
+class TimedPool:
+    def connect(self):
+        labels = {"pool": self.logging_name}
+        started = time.perf_counter()
+        try:
+            return super().connect()
+        except exc.TimeoutError:
+            metrics.inc("db_pool_timeouts_total", labels=labels)
+            raise
+        finally:
+            metrics.observe("db_pool_wait_seconds", time.perf_counter() - started, labels)
+
+
+class TimedQueuePool(TimedPool, QueuePool):
+    pass
+
+
+class TimedAsyncQueuePool(TimedPool, AsyncAdaptedQueuePool):
+    pass
+
+
+# Workload classes: (pool_size, max_overflow, pool_timeout, statement_timeout_ms). Each
+# has its own pools, so exhausting one never delays checkouts in another.
+WORKLOADS = {
+    "oltp": (settings.db_pool_size, settings.db_max_overflow, settings.db_pool_timeout, settings.db_statement_timeout_ms),
+    "analytics": (settings.db_analytics_pool_size, settings.db_analytics_max_overflow, settings.db_analytics_pool_timeout, settings.db_analytics_statement_timeout_ms),
+    "batch": (settings.db_batch_pool_size, settings.db_batch_max_overflow, settings.db_batch_pool_timeout, settings.db_batch_statement_timeout_ms),
+}
+
+
+def pool_options(workload: str, poolclass):
+    pool_size, max_overflow, pool_timeout, _ = WORKLOADS[workload]
+    return {
+        "poolclass": poolclass,
+        "pool_size": pool_size,
+        "max_overflow": max_overflow,
+        "pool_timeout": pool_timeout,
+        "pool_recycle": settings.db_pool_recycle,
+        "pool_pre_ping": settings.db_pool_pre_ping,
+    }
+
+
+def instrument_pool(engine, name: str):
+    # Live checked-out and overflow gauges, plus connect/invalidate counters, from pool
+    # events. Checkin fires before the pool updates its own counters, so the gauges are
+    # kept from the events themselves.
+    labels = {"pool": name}
+    size = engine.pool.size() if isinstance(engine.pool, QueuePool) else 0
+
+    def update_gauges(change: int):
+        metrics.add_gauge("db_pool_checked_out", change, labels)
+        if size:
+            in_use = metrics.get("db_pool_checked_out", labels)
+            metrics.set_gauge("db_pool_overflow", max(0, in_use - size), labels)
+
+    def checked_out(*args):
+        update_gauges(1)
+
+    def returned(*args):
+        update_gauges(-1)
+
+    def connected(*args):
+        metrics.inc("db_pool_connections_total", labels=labels)
+
+    def invalidated(*args):
+        metrics.inc("db_pool_invalidated_total", labels=labels)
+
+    event.listen(engine, "checkout", checked_out)
+    event.listen(engine, "checkin", returned)
+    event.listen(engine, "detach", returned)
+    event.listen(engine, "connect", connected)
+    event.listen(engine, "invalidate", invalidated)
+    metrics.set_gauge("db_pool_size", size, labels)
+    update_gauges(0)
+
+
+def workload_engine(url, workload: str, name: str):
+    statement_timeout = WORKLOADS[workload][3]
+    engine = create_engine(
+        url,
+        pool_logging_name=name,
+        connect_args={"options": f"-c statement_timeout={statement_timeout}"} if statement_timeout else {},
+        **pool_options(workload, TimedQueuePool)
+    )
+    instrument_pool(engine, name)
+    return engine
+
+
+def async_workload_engine(url, workload: str, name: str):
+    # Pooled asyncpg connections belong to the event loop that opened them, so
+    # async_db_pool = False (NullPool) is needed when every request runs on a new loop,
+    # as with a TestClient used outside a with block. The pools are disposed on shutdown.
+    statement_timeout = WORKLOADS[workload][3]
+    engine = create_async_engine(
+        url,
+        pool_logging_name=name,
+        connect_args={"server_settings": {"statement_timeout": str(statement_timeout)}} if statement_timeout else {},
+        **(pool_options(workload, TimedAsyncQueuePool) if settings.async_db_pool else {"poolclass": NullPool})
+    )
+    instrument_pool(engine.sync_engine, name)
+    return engine
+
 
-engine = create_engine(SQLALCHEMY_DATABASE_URL)
-SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+engines = {workload: workload_engine(SQLALCHEMY_DATABASE_URL, workload, workload) for workload in WORKLOADS}
+sessions = {workload: sessionmaker(autocommit=False, autoflush=False, bind=engine) for workload, engine in engines.items()}
+engine = engines["oltp"]
+SessionLocal = sessions["oltp"]
+
+# Async path for the high-traffic routes
+async_engine = async_workload_engine(ASYNC_DATABASE_URL, "oltp", "oltp-async")
+AsyncSessionLocal = async_sessionmaker(async_engine, autoflush=False, expire_on_commit=False)
+async_engines = [async_engine]
+
+# Optional read replica for read-only routes (read_db / get_async_read_db). Replication
+# lag means these routes may briefly miss a write just made on the primary; clients that
+# need to read their own writes send PRIMARY_HEADER.
+read_sessions = {}
+AsyncReadSessionLocal = None
+if settings.database_replica_url:
+    for workload in ("oltp", "analytics"):
+        replica_engine = workload_engine(settings.database_replica_url, workload, f"{workload}-replica")
+        read_sessions[workload] = sessionmaker(autocommit=False, autoflush=False, bind=replica_engine)
+
+    async_replica_url = make_url(settings.database_replica_url).set(drivername="postgresql+asyncpg")
+    async_engines.append(async_workload_engine(async_replica_url, "oltp", "oltp-replica-async"))
+    AsyncReadSessionLocal = async_sessionmaker(async_engines[-1], autoflush=False, expire_on_commit=False)
+
+PRIMARY_HEADER = "X-Read-Primary"
+_replica_down_until = 0.0
 
 Base = declarative_base()
 
@@ -17,4 +156,94 @@ def get_db():
     try:
         yield db
     finally:
-        db.close()
\ No newline at end of file
+        db.close()
+
+
+async def dispose_async_engines():
+    # Close pooled asyncpg connections while their event loop is still running
+    for pooled in async_engines:
+        await pooled.dispose()
+
+
+async def get_async_db():
+    async with AsyncSessionLocal() as db:
+        yield db
+
+
+def use_replica(request: Request, session_factory) -> bool:
+    if session_factory is None or time.monotonic() < _replica_down_until:
+        return False
+    return request.headers.get(PRIMARY_HEADER, "").lower() not in ("1", "true", "yes")
+
+
+def on_replica(db) -> bool:
+    # Whether a read_db / get_async_read_db session is served by the replica
+    return db.info.get("replica", False)
+
+
+def replica_failed(error: Exception):
+    # Stop trying the replica for a while, so an outage costs one failed connect per interval
+    global _replica_down_until
+    _replica_down_until = time.monotonic() + settings.database_replica_retry_seconds
+    metrics.inc("db_replica_fallback_total")
+    logger.warning(f"Read replica unavailable, reading from the primary: {error}")
+
+
+def workload_db(workload: str):
+    # Dependency factory for routes that run on another workload's pool
+    def get_workload_db():
+        db = sessions[workload]()
+        try:
+            yield db
+        finally:
+            db.close()
+    return get_workload_db
+
+
+def read_db(workload: str = "oltp"):
+    # Dependency factory like workload_db, but served by the replica when one is
+    # configured and reachable
+    def get_read_db(request: Request):
+        db = None
+        if use_replica(request, read_sessions.get(workload)):
+            db = read_sessions[workload]()
+            try:
+                db.connection()
+            except (exc.DBAPIError, OSError) as error:
+                db.close()
+                db = None
+                replica_failed(error)
+        if db is None:
+            db = sessions[workload]()
+            metrics.inc("db_read_sessions_total", labels={"target": "primary"})
+        else:
+            db.info["replica"] = True
+            metrics.inc("db_read_sessions_total", labels={"target": "replica"})
+        try:
+            yield db
+        finally:
+            db.close()
+    return get_read_db
+
+
+get_read_db = read_db("oltp")
+
+
+async def get_async_read_db(request: Request):
+    db = None
+    if use_replica(request, AsyncReadSessionLocal):
+        db = AsyncReadSessionLocal()
+        try:
+            await db.connection()
+        except (exc.DBAPIError, OSError) as error:
+            await db.close()
+            db = None
+            replica_failed(error)
+    if db is None:
+        db = AsyncSessionLocal()
+        metrics.inc("db_read_sessions_total", labels={"target": "primary"})
+    else:
+        db.info["replica"] = True
+        metrics.inc("db_read_sessions_total", labels={"target": "replica"})
+    async with db:
+        yield db
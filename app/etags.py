@@ -0,0 +1,26 @@
+from fastapi import Request, Response, status
+import hashlib
+
+
+# Strong ETags derived from version markers (updated_at columns) that are cheap to read,
+# so a conditional GET can be answered before the body is loaded or serialized
+def etag(*versions) -> str:
+    return '"' + hashlib.sha1("|".join(map(str, versions)).encode()).hexdigest() + '"'
+
+
+def matches(request: Request, tag: str) -> bool:
+    if_none_match = request.headers.get("if-none-match")
+    if not if_none_match:
+        return False
+    candidates = [candidate.strip() for candidate in if_none_match.split(",")]
+    # If-None-Match uses the weak comparison, so a W/ prefix still matches
+    return "*" in candidates or any(candidate.removeprefix("W/") == tag for candidate in candidates)
+
+
+def not_modified(tag: str) -> Response:
+    return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers={"ETag": tag})
+
+
+def with_etag(response: Response, tag: str) -> Response:
+    response.headers["ETag"] = tag
+    return response
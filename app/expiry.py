@@ -0,0 +1,68 @@
+from sqlalchemy import delete, insert, select
+from sqlalchemy.orm import Session
+from datetime import datetime
+from .config import settings
+from . import models, stats, cache
+import logging
+import time
+
+logger = logging.getLogger(__name__)
+
+ARCHIVED_SUBSCRIPTION_COLUMNS = [
+    "subscription_id", "subscription_date", "expiry_date", "status",
+    "total_days_left", "days_till_next_payment", "user_id", "service_id",
+]
+ARCHIVED_TRANSACTION_COLUMNS = [
+    "transaction_id", "amount", "created_at", "status", "card_brand", "subscription_id",
+]
+
+
+# Expiry sweeper: moves subscriptions past their expiry date, together with their
+# transactions, into the archive tables in bounded batches (one commit per batch).
+# Runs from the scheduled worker (python -m app.worker), never from a request.
+def expire_subscriptions(db: Session, batch_size: int = None):
+    batch_size = batch_size or settings.expiry_batch_size
+    today = datetime.utcnow().date()
+    started = time.perf_counter()
+    total = 0
+
+    while True:
+        expired = db.execute(
+            select(models.Subscription.subscription_id, models.Subscription.user_id)
+            .where(models.Subscription.expiry_date < today)
+            .order_by(models.Subscription.subscription_id)
+            .limit(batch_size)
+            .with_for_update(skip_locked=True)
+        ).all()
+        if not expired:
+            break
+        subscription_ids = [row.subscription_id for row in expired]
+
+        stats.record_expired_subscriptions(db, subscription_ids, today)
+        # Transactions first, so the subscription delete has nothing left to cascade to
+        move_rows(db, models.Transaction, models.TransactionArchive, ARCHIVED_TRANSACTION_COLUMNS,
+                  models.Transaction.subscription_id.in_(subscription_ids))
+        move_rows(db, models.Subscription, models.SubscriptionArchive, ARCHIVED_SUBSCRIPTION_COLUMNS,
+                  models.Subscription.subscription_id.in_(subscription_ids))
+        db.commit()
+        # The services go back on these users' /services/all pages
+        cache.catalog.invalidate(*sorted({f"user:{row.user_id}" for row in expired}))
+
+        total += len(subscription_ids)
+        if len(subscription_ids) < batch_size:
+            break
+
+    logger.info(f"Archived {total} expired subscriptions in {time.perf_counter() - started:.2f}s")
+    return total
+
+
+def move_rows(db: Session, model, archive_model, columns, criteria) -> int:
+    # DELETE ... RETURNING feeding INSERT ... SELECT, as a single statement
+    moved = (
+        delete(model)
+        .where(criteria)
+        .returning(*[getattr(model, column) for column in columns])
+        .cte("moved")
+    )
+    stmt = insert(archive_model).from_select(columns, select(*[moved.c[column] for column in columns]))
+    return db.execute(stmt).rowcount
@@ -0,0 +1,65 @@
+from sqlalchemy import update, select
+from sqlalchemy.orm import Session
+from sqlalchemy.sql import func
+from . import models
+import re
+
+# The 'simple' configuration lowercases without stemming, so prefix queries behave like
+# the ilike matching they replace for names, categories and cities in any language
+TS_CONFIG = "simple"
+
+# Weight labels of each source in services.search_vector
+NAME, CATEGORY, CITY, DESCRIPTION = "A", "B", "C", "D"
+
+
+def weighted(value, weight: str):
+    return func.setweight(func.to_tsvector(TS_CONFIG, func.coalesce(value, "")), weight)
+
+
+def search_vector_expr():
+    category_name = (
+        select(models.Category.name)
+        .where(models.Category.category_id == models.Service.category_id)
+        .scalar_subquery()
+    )
+    return (
+        weighted(models.Service.name, NAME)
+        .op("||")(weighted(category_name, CATEGORY))
+        .op("||")(weighted(models.Business.city, CITY))
+        .op("||")(weighted(models.Service.description, DESCRIPTION))
+    )
+
+
+# services.search_vector is maintained by the application: call this after any write to
+# a service's name, description or category, or to its business's city, before committing
+def refresh_search_vectors(db: Session, *criteria):
+    stmt = (
+        update(models.Service)
+        .where(models.Service.business_id == models.Business.business_id, *criteria)
+        .values(search_vector=search_vector_expr())
+        .execution_options(synchronize_session=False)
+    )
+    return db.execute(stmt).rowcount
+
+
+def prefix_query(term: str, weights: str = ""):
+    # Every word of the term must match the start of a lexeme, optionally restricted to
+    # the given weights. Only word characters reach to_tsquery, so user input can't
+    # inject tsquery operators.
+    words = re.findall(r"\w+", term.lower())
+    if not words:
+        return None
+    return " & ".join(f"{word}:*{weights}" for word in words)
+
+
+def match_query(search: str = None, category: str = None, city: str = None):
+    # Combine the free-text search and the category and city filters into one tsquery
+    parts = [
+        prefix_query(search or ""),
+        prefix_query(category or "", CATEGORY),
+        prefix_query(city or "", CITY),
+    ]
+    parts = [f"({part})" for part in parts if part]
+    if not parts:
+        return None
+    return func.to_tsquery(TS_CONFIG, " & ".join(parts))
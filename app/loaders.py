@@ -0,0 +1,25 @@
+from sqlalchemy.orm import joinedload
+from . import models
+
+
+# Loader options matching the nested response schemas, so a list serializes without
+# lazy loads. Every nested relationship is many-to-one, so a joinedload adds columns
+# to the same query instead of multiplying rows.
+def service_out(path=None):
+    # schemas.ServiceOut: business and category
+    if path is None:
+        return [joinedload(models.Service.business), joinedload(models.Service.category)]
+    return [path.joinedload(models.Service.business), path.joinedload(models.Service.category)]
+
+
+def subscription_out(path=None):
+    # schemas.Subscription: user and service (with its business and category)
+    user = joinedload(models.Subscription.user) if path is None else path.joinedload(models.Subscription.user)
+    service = joinedload(models.Subscription.service) if path is None else path.joinedload(models.Subscription.service)
+    return [user, *service_out(service)]
+
+
+def transaction_out(subscription=None):
+    # schemas.Transaction: subscription (with everything schemas.Subscription nests).
+    # Pass contains_eager(models.Transaction.subscription) when the query already joins it.
+    return subscription_out(subscription if subscription is not None else joinedload(models.Transaction.subscription))
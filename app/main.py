@@ -1,14 +1,39 @@
-from fastapi import FastAPI
+from fastapi import FastAPI, Request, Header, HTTPException, status
+from fastapi.responses import JSONResponse, PlainTextResponse
+from sqlalchemy import exc
 from .database import engine
-from . import models
+from . import models, suggest, passwords, metrics, database
 from .routers import user, auth, business, service, category, subscription, transaction
-from .config import Settings
+from .config import Settings, settings
+from typing import Optional
+import secrets
 from fastapi.middleware.cors import CORSMiddleware
 
 models.Base.metadata.create_all(bind = engine)
 
 app = FastAPI()
 
+@app.on_event("startup")
+def load_suggest_index():
+    suggest.load_index()
+
+@app.on_event("shutdown")
+def stop_password_pool():
+    passwords.shutdown()
+
+@app.on_event("shutdown")
+async def close_async_pools():
+    await database.dispose_async_engines()
+
+@app.exception_handler(exc.TimeoutError)
+def database_busy(request: Request, error: exc.TimeoutError):
+    # A workload's connection pool stayed exhausted for its whole pool_timeout
+    return JSONResponse(
+        status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+        content={"detail": "Service is busy, please retry later"},
+        headers={"Retry-After": "1"}
+    )
+
 origins = ["*"]
 
 app.add_middleware(
@@ -30,3 +55,12 @@ app.include_router(transaction.router)
 @app.get("/")
 async def root():
     return {"message": "Hello World"}
+
+@app.get("/metrics", response_class=PlainTextResponse, include_in_schema=False)
+def get_metrics(authorization: Optional[str] = Header(None)):
+    # Scrapers send the metrics_token as a bearer token; without one configured the endpoint is off
+    if not settings.metrics_token:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Not Found")
+    if not secrets.compare_digest((authorization or "").encode(), f"Bearer {settings.metrics_token}".encode()):
+        raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Invalid metrics token", headers={"WWW-Authenticate": "Bearer"})
+    return metrics.render()
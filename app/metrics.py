@@ -0,0 +1,55 @@
+from threading import Lock
+
+# Minimal in-process metrics registry, exposed in the Prometheus text format at /metrics.
+# Each process reports its own values.
+_lock = Lock()
+_types = {}
+_values = {}
+
+
+def _key(name: str, labels: dict):
+    return name, tuple(sorted((labels or {}).items()))
+
+
+def inc(name: str, value: float = 1, labels: dict = None):
+    with _lock:
+        _types.setdefault(name, "counter")
+        key = _key(name, labels)
+        _values[key] = _values.get(key, 0) + value
+
+
+def set_gauge(name: str, value: float, labels: dict = None):
+    with _lock:
+        _types.setdefault(name, "gauge")
+        _values[_key(name, labels)] = value
+
+
+def add_gauge(name: str, value: float, labels: dict = None):
+    with _lock:
+        _types.setdefault(name, "gauge")
+        key = _key(name, labels)
+        _values[key] = _values.get(key, 0) + value
+
+
+def observe(name: str, seconds: float, labels: dict = None):
+    # Summary without quantiles: <name>_sum and <name>_count
+    inc(f"{name}_sum", seconds, labels)
+    inc(f"{name}_count", 1, labels)
+
+
+def get(name: str, labels: dict = None) -> float:
+    with _lock:
+        return _values.get(_key(name, labels), 0)
+
+
+def render() -> str:
+    lines = []
+    with _lock:
+        for name, metric_type in sorted(_types.items()):
+            lines.append(f"# TYPE {name} {metric_type}")
+            for (key_name, labels), value in sorted(_values.items()):
+                if key_name != name:
+                    continue
+                label_text = ",".join(f'{label}="{label_value}"' for label, label_value in labels)
+                lines.append(f"{name}{{{label_text}}} {value}" if label_text else f"{name} {value}")
+    return "\n".join(lines) + "\n"
@@ -1,10 +1,13 @@
 from .database import Base
-from sqlalchemy import Boolean, Column, ForeignKey, Integer, String, DateTime, Date, CheckConstraint, Float
-from sqlalchemy.orm import relationship, validates
+from . import billing_cycle
+from sqlalchemy import Boolean, Column, ForeignKey, Integer, String, DateTime, Date, CheckConstraint, Float, Numeric, cast, case, Index
+from sqlalchemy.orm import relationship, validates, deferred
 from sqlalchemy.sql.sqltypes import TIMESTAMP
 from sqlalchemy.sql.expression import text
+from sqlalchemy.sql import func
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.ext.hybrid import hybrid_property
+from sqlalchemy.dialects.postgresql import TSVECTOR
 
 class User(Base):
     __tablename__ = "users"
@@ -32,6 +35,10 @@ class Card(Base):
     
     user = relationship("User", back_populates="cards")
     
+    __table_args__ = (
+        Index("ix_cards_user_id", "user_id"),
+    )
+    
     
 class Business(Base):
     __tablename__ = "businesses"
@@ -50,6 +57,7 @@ class Business(Base):
     bank_account = Column(String, nullable=False)
     bank_account_name = Column(String, nullable=False)
     bank_name = Column(String, nullable=False)
+    updated_at = Column(TIMESTAMP(timezone=True), nullable=False, server_default=text('now()'), onupdate=func.now())
     
     services = relationship("Service", back_populates="business")    
 
@@ -65,10 +73,20 @@ class Service(Base):
     category_id = Column(Integer, ForeignKey("categories.category_id"), nullable=True)
     duration = Column(Integer, nullable=False, default=12)  # duration in months
     status = Column(String, nullable=True, default="active")
+    search_vector = deferred(Column(TSVECTOR, nullable=True))  # maintained by app/fulltext.py
+    updated_at = Column(TIMESTAMP(timezone=True), nullable=False, server_default=text('now()'), onupdate=func.now())
     
     category = relationship("Category", back_populates="services")
     business = relationship("Business", back_populates="services")
     subscription = relationship("Subscription", back_populates="service")
+    
+    __table_args__ = (
+        Index("ix_services_search_vector", "search_vector", postgresql_using="gin"),
+        Index("ix_services_business_id", "business_id"),
+        # Keyset orderings of /services/all, over active services only
+        Index("ix_services_active_created_at", "created_at", "service_id", postgresql_where=text("status = 'active'")),
+        Index("ix_services_active_price", "price", "service_id", postgresql_where=text("status = 'active'")),
+    )
 
 class Subscription(Base):
     __tablename__ = "subscriptions"
@@ -79,6 +97,7 @@ class Subscription(Base):
     status = Column(String, nullable=True)
     total_days_left = Column(Integer, nullable=True)
     days_till_next_payment = Column(Integer, nullable=True)
+    next_billing_at = Column(TIMESTAMP(timezone=True), nullable=True, index=True)  # advanced by the billing engine
     user_id = Column(Integer, ForeignKey("users.user_id" ,ondelete="CASCADE"), nullable=False)
     service_id = Column(Integer, ForeignKey("services.service_id", ondelete="CASCADE"), nullable=False)
     
@@ -87,13 +106,42 @@ class Subscription(Base):
     user = relationship("User", back_populates="subscriptions")
     transactions = relationship("Transaction", back_populates="subscription")
     
+    __table_args__ = (
+        # A user's subscriptions, and the "already subscribed" checks
+        Index("ix_subscriptions_user_id_service_id", "user_id", "service_id"),
+        # Subscribers of a service (business dashboards, cascades from services)
+        Index("ix_subscriptions_service_id_status", "service_id", "status"),
+    )
+    
+    # Computed at read time from next_billing_at (or subscription_date for rows the
+    # billing engine has not scheduled yet), in Python or in SQL
+    @hybrid_property
+    def days_left(self):
+        if self.next_billing_at is not None:
+            return billing_cycle.days_until(self.next_billing_at)
+        if self.subscription_date is not None:
+            return billing_cycle.days_till_next_payment(self.subscription_date)
+        return None
+
+    @days_left.expression
+    def days_left(cls):
+        return case(
+            (cls.next_billing_at.isnot(None), billing_cycle.days_until_expr(cls.next_billing_at)),
+            else_=billing_cycle.days_till_next_payment_expr(cls.subscription_date)
+        )
+
     @hybrid_property
     def progress_bar_next_payment(self):
-        if self.days_till_next_payment is not None:
-            progress = (30 - self.days_till_next_payment) / 30
+        days_left = self.days_left
+        if days_left is not None:
+            progress = (30 - days_left) / 30
             return round(progress, 1)  # Round to 1 decimal
         return None
 
+    @progress_bar_next_payment.expression
+    def progress_bar_next_payment(cls):
+        return func.round(cast((30 - cls.days_left) / 30.0, Numeric), 1)
+
 class Category(Base):
     __tablename__ = "categories"
     
@@ -101,10 +149,15 @@ class Category(Base):
     description = Column(String, nullable=True)
     name = Column(String, nullable=False)
     category_image = Column(String, nullable=True)
-    ranking = Column(Integer, nullable=True)
+    ranking = Column(Integer, nullable=True)  # 1 = most active subscriptions, set by app/ranking.py
+    updated_at = Column(TIMESTAMP(timezone=True), nullable=False, server_default=text('now()'), onupdate=func.now())
     
     services = relationship("Service", back_populates="category")
     
+    __table_args__ = (
+        Index("ix_categories_ranking", "ranking", "category_id"),
+    )
+    
 class Transaction(Base):
     __tablename__ = "transactions"
     
@@ -116,4 +169,55 @@ class Transaction(Base):
     subscription_id = Column(Integer, ForeignKey("subscriptions.subscription_id", ondelete="CASCADE"), nullable=False)
     
     subscription = relationship("Subscription", back_populates="transactions")
-    
\ No newline at end of file
+    
+    __table_args__ = (
+        Index("ix_transactions_subscription_id_created_at", "subscription_id", "created_at"),
+        # Open transactions the billing engine settles
+        Index("ix_transactions_pending", "subscription_id", postgresql_where=text("status = 'Pending'")),
+    )
+    
+
+    
+# Archive tables: expired subscriptions and their transactions are moved here by the
+# expiry sweeper, keeping the hot tables small while preserving the ledger history.
+class SubscriptionArchive(Base):
+    __tablename__ = "subscriptions_archive"
+    
+    subscription_id = Column(Integer, primary_key=True, autoincrement=False)
+    subscription_date = Column(TIMESTAMP(timezone=True), nullable=False)
+    expiry_date = Column(Date, nullable=True)
+    status = Column(String, nullable=True)
+    total_days_left = Column(Integer, nullable=True)
+    days_till_next_payment = Column(Integer, nullable=True)
+    user_id = Column(Integer, nullable=False, index=True)
+    service_id = Column(Integer, nullable=False, index=True)
+    archived_at = Column(TIMESTAMP(timezone=True), nullable=False, server_default=text('now()'))
+
+
+class TransactionArchive(Base):
+    __tablename__ = "transactions_archive"
+    
+    transaction_id = Column(Integer, primary_key=True, autoincrement=False)
+    amount = Column(Float, nullable=False)
+    created_at = Column(TIMESTAMP(timezone=True), nullable=False)
+    status = Column(String, nullable=False)
+    card_brand = Column(String, nullable=False)
+    subscription_id = Column(Integer, nullable=False, index=True)
+    archived_at = Column(TIMESTAMP(timezone=True), nullable=False, server_default=text('now()'))
+
+
+
+# Daily rollup for business dashboards, maintained incrementally by app/stats.py
+class BusinessDailyStats(Base):
+    __tablename__ = "business_daily_stats"
+    
+    business_id = Column(Integer, ForeignKey("businesses.business_id", ondelete="CASCADE"), primary_key=True)
+    day = Column(Date, primary_key=True)  # UTC day
+    service_id = Column(Integer, ForeignKey("services.service_id", ondelete="CASCADE"), primary_key=True)
+    new_subscribers = Column(Integer, nullable=False, server_default=text('0'))
+    revenue = Column(Float, nullable=False, server_default=text('0'))  # completed transactions
+    active_subscriptions = Column(Integer, nullable=False, server_default=text('0'))  # as of the end of the day
+    
+    __table_args__ = (
+        Index("ix_business_daily_stats_service_id_day", "service_id", "day"),
+    )
@@ -1,11 +1,14 @@
 from jose import JWTError, jwt
 from datetime import datetime, timedelta
-from . import schemas, models
+from . import schemas, models, cache
 from fastapi import Depends, status, HTTPException
 from fastapi.security import OAuth2PasswordBearer
-from .database import get_db
+from .database import get_db, get_async_db, on_replica
 from sqlalchemy.orm import Session
+from sqlalchemy.ext.asyncio import AsyncSession
 from .config import settings
+import hashlib
+import time
 
 user_oauth2_scheme = OAuth2PasswordBearer(tokenUrl="login")
 business_oauth2_scheme = OAuth2PasswordBearer(tokenUrl="login/business")
@@ -25,20 +28,73 @@ def create_access_token(data: dict):
     
     return encoded_jwt
 
+# Decoded claims keyed by a hash of the token, so repeat requests skip signature checks
+token_claims = cache.LRUCache(settings.token_cache_size)
+# Detached User/Business rows keyed by (role, id); invalidate_principal on profile updates
+principals = cache.TTLCache(settings.principal_cache_ttl_seconds)
+
+
 def verify_access_token(token: str, credentials_exception):
-    try:
-        payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
-    
-        id: str = payload.get("id") #TRY user_id and business_id in separate verify functions = if doesnt work
-        role: str = payload.get("role")
-    
-        if id is None:
+    key = hashlib.sha256(token.encode()).hexdigest()
+    claims = token_claims.get(key)
+    if claims is None:
+        try:
+            payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
+        
+            id: str = payload.get("id") #TRY user_id and business_id in separate verify functions = if doesnt work
+            role: str = payload.get("role")
+        
+            if id is None:
+                raise credentials_exception
+            token_data = schemas.TokenData(id=id, role=role)
+        except JWTError:
             raise credentials_exception
-        token_data = schemas.TokenData(id=id, role=role)
-    except JWTError:
+        claims = (payload.get("exp"), token_data)
+        token_claims.set(key, claims)
+
+    expires_at, token_data = claims
+    if expires_at is not None and expires_at <= time.time():
         raise credentials_exception
-    
     return token_data
+
+
+def unknown_principal():
+    # The token is for an account that no longer exists, or isn't on the replica yet
+    return HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Could not validate credentials", headers={"WWW-Authenticate": "Bearer"})
+
+
+def load_principal(db: Session, model, role: str, id: int):
+    key = (role, id)
+    principal = principals.get(key)
+    if principal is None:
+        principal = db.get(model, id)
+        if principal is None:
+            raise unknown_principal()
+        # Detach so the cached copy can be shared between requests; routes that write
+        # to it use db.merge(principal, load=False). A replica may be behind the last
+        # profile update, so only rows read on the primary are cached.
+        db.expunge(principal)
+        if not on_replica(db):
+            principals.set(key, principal)
+    return principal
+
+
+async def load_principal_async(db: AsyncSession, model, role: str, id: int):
+    key = (role, id)
+    principal = principals.get(key)
+    if principal is None:
+        principal = await db.get(model, id)
+        if principal is None:
+            raise unknown_principal()
+        db.expunge(principal)
+        if not on_replica(db):
+            principals.set(key, principal)
+    return principal
+
+
+def invalidate_principal(role: str, id: int):
+    principals.delete((role, id))
+
     
 def get_current_user(token: str = Depends(user_oauth2_scheme), db : Session = Depends(get_db)):
     credentials_exception = HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail=f"Could not validate credentials", headers={"WWW-Authenticate": "Bearer"})
@@ -47,17 +103,43 @@ def get_current_user(token: str = Depends(user_oauth2_scheme), db : Session = De
     if token_data.role != "user":
         raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Could not validate credentials")
     
-    user = db.query(models.User).filter(models.User.user_id == token_data.id).first()
+    user = load_principal(db, models.User, "user", token_data.id)
     
     return user
 
-def get_current_business(token: str = Depends(business_oauth2_scheme), db : Session = Depends(get_db)):
+def current_business(session_dependency=get_db):
+    # Dependency factory: the business is loaded on the route's own session dependency, so
+    # a route on another workload's pool doesn't also hold an oltp connection
+    def get_current_business(token: str = Depends(business_oauth2_scheme), db : Session = Depends(session_dependency)):
+        credentials_exception = HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail=f"Could not validate credentials", headers={"WWW-Authenticate": "Bearer"})
+        
+        token_data = verify_access_token(token, credentials_exception)
+        if token_data.role != "business":
+            raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Could not validate credentials")
+        
+        business = load_principal(db, models.Business, "business", token_data.id)
+        
+        return business
+    return get_current_business
+
+get_current_business = current_business(get_db)
+
+
+# Async variants for async routes
+async def get_current_user_async(token: str = Depends(user_oauth2_scheme), db: AsyncSession = Depends(get_async_db)):
     credentials_exception = HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail=f"Could not validate credentials", headers={"WWW-Authenticate": "Bearer"})
     
     token_data = verify_access_token(token, credentials_exception)
-    if token_data.role != "business":
+    if token_data.role != "user":
         raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Could not validate credentials")
     
-    business = db.query(models.Business).filter(models.Business.business_id == token_data.id).first()
+    return await load_principal_async(db, models.User, "user", token_data.id)
+
+async def get_current_business_async(token: str = Depends(business_oauth2_scheme), db: AsyncSession = Depends(get_async_db)):
+    credentials_exception = HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail=f"Could not validate credentials", headers={"WWW-Authenticate": "Bearer"})
+    
+    token_data = verify_access_token(token, credentials_exception)
+    if token_data.role != "business":
+        raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Could not validate credentials")
     
-    return business
\ No newline at end of file
+    return await load_principal_async(db, models.Business, "business", token_data.id)
@@ -0,0 +1,105 @@
+from concurrent.futures import ProcessPoolExecutor
+from threading import BoundedSemaphore, Lock
+from fastapi import HTTPException, status
+from passlib.context import CryptContext
+from .config import settings
+from . import metrics
+import asyncio
+import multiprocessing
+import time
+
+# bcrypt policy. Hashes made under another cost factor still verify and are flagged by
+# verify_and_update so callers can store the rehash.
+pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto", bcrypt__rounds=settings.bcrypt_rounds)
+
+
+# Run in the pool's worker processes
+def _hash(password: str) -> str:
+    return pwd_context.hash(password)
+
+
+def _verify_and_update(password: str, hashed_password: str):
+    return pwd_context.verify_and_update(password, hashed_password)
+
+
+# bcrypt runs in a dedicated process pool so a burst of logins uses at most
+# password_pool_size cores. At most password_max_pending calls wait for it (sync callers
+# hold a request thread while waiting); beyond that, requests are rejected with 503 at
+# once instead of queueing without bound. password_pool_size = 0 runs bcrypt inline.
+_pool = None
+_pool_lock = Lock()
+_pending = BoundedSemaphore(settings.password_max_pending)
+
+
+def pool():
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            _pool = ProcessPoolExecutor(
+                max_workers=settings.password_pool_size,
+                mp_context=multiprocessing.get_context("spawn")
+            )
+        return _pool
+
+
+def reject(operation: str):
+    metrics.inc("password_pool_rejected_total", labels={"operation": operation})
+    raise HTTPException(status_code=status.HTTP_503_SERVICE_UNAVAILABLE, detail="Server busy, please retry")
+
+
+def run(operation: str, func, *args):
+    if not _pending.acquire(blocking=False):
+        reject(operation)
+
+    metrics.add_gauge("password_pool_queue_depth", 1)
+    started = time.perf_counter()
+    try:
+        if settings.password_pool_size <= 0:
+            return func(*args)
+        return pool().submit(func, *args).result()
+    finally:
+        _pending.release()
+        metrics.add_gauge("password_pool_queue_depth", -1)
+        metrics.observe("password_pool_seconds", time.perf_counter() - started, labels={"operation": operation})
+
+
+async def run_async(operation: str, func, *args):
+    # Async routes wait on the pool without holding a thread
+    if not _pending.acquire(blocking=False):
+        reject(operation)
+
+    metrics.add_gauge("password_pool_queue_depth", 1)
+    started = time.perf_counter()
+    try:
+        if settings.password_pool_size <= 0:
+            return await asyncio.to_thread(func, *args)
+        return await asyncio.wrap_future(pool().submit(func, *args))
+    finally:
+        _pending.release()
+        metrics.add_gauge("password_pool_queue_depth", -1)
+        metrics.observe("password_pool_seconds", time.perf_counter() - started, labels={"operation": operation})
+
+
+def hash(password: str) -> str:
+    return run("hash", _hash, password)
+
+
+def verify_and_update(password: str, hashed_password: str):
+    # (valid, new_hash); new_hash is set when the stored hash predates the current policy
+    return run("verify", _verify_and_update, password, hashed_password)
+
+
+async def verify_and_update_async(password: str, hashed_password: str):
+    return await run_async("verify", _verify_and_update, password, hashed_password)
+
+
+def verify(password: str, hashed_password: str) -> bool:
+    return verify_and_update(password, hashed_password)[0]
+
+
+def shutdown():
+    global _pool
+    with _pool_lock:
+        if _pool is not None:
+            _pool.shutdown(wait=False, cancel_futures=True)
+            _pool = None
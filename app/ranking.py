@@ -0,0 +1,46 @@
+from sqlalchemy import select, update, and_
+from sqlalchemy.orm import Session
+from sqlalchemy.sql import func
+from . import models, cache
+import logging
+import time
+
+logger = logging.getLogger(__name__)
+
+
+# Category ranking: 1 is the category with the most active subscriptions. Runs from the
+# scheduled worker (python -m app.worker), so /categories/top only reads the indexed
+# ranking column. One UPDATE; rows whose rank is unchanged are left alone so their
+# updated_at (and ETag) stay stable.
+def rank_categories(db: Session):
+    started = time.perf_counter()
+    active_subscriptions = func.count(models.Subscription.subscription_id)
+    ranked = (
+        select(
+            models.Category.category_id,
+            func.row_number().over(order_by=[active_subscriptions.desc(), models.Category.category_id]).label("ranking")
+        )
+        .outerjoin(models.Service, models.Service.category_id == models.Category.category_id)
+        .outerjoin(models.Subscription, and_(
+            models.Subscription.service_id == models.Service.service_id,
+            models.Subscription.status == "active"
+        ))
+        .group_by(models.Category.category_id)
+        .subquery("ranked")
+    )
+    stmt = (
+        update(models.Category)
+        .where(
+            models.Category.category_id == ranked.c.category_id,
+            models.Category.ranking.is_distinct_from(ranked.c.ranking)
+        )
+        .values(ranking=ranked.c.ranking)
+        .execution_options(synchronize_session=False)
+    )
+    rows = db.execute(stmt).rowcount
+    db.commit()
+    if rows:
+        cache.catalog.invalidate("categories")
+
+    logger.info(f"Ranked categories: {rows} changed in {time.perf_counter() - started:.2f}s")
+    return rows
@@ -1,8 +1,9 @@
-from fastapi import APIRouter, Depends, status, HTTPException, Response
+from fastapi import APIRouter, Depends, status, HTTPException, Request, Response
 from fastapi.security.oauth2 import OAuth2PasswordRequestForm
-from sqlalchemy.orm import Session
-from ..database import get_db
-from .. import schemas, models, utils, oauth2
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy import select
+from ..database import get_async_db
+from .. import schemas, models, utils, oauth2, passwords, throttle
 
 
 router = APIRouter(
@@ -12,29 +13,40 @@ router = APIRouter(
 
 #LOGIN A USER
 @router.post("/user", response_model=schemas.Token)
-def login(user_credentials: OAuth2PasswordRequestForm = Depends() , db: Session = Depends(get_db)):
+async def login(request: Request, user_credentials: OAuth2PasswordRequestForm = Depends() , db: AsyncSession = Depends(get_async_db)):
+    await throttle.check_login(request, "user", user_credentials.username)
     
-    user = db.query(models.User).filter(models.User.email == user_credentials.username).first() # because OAuth2PasswordRequestForm stores in dict {"username": "smth", "password": "smth"}
+    user = (await db.execute(select(models.User).filter(models.User.email == user_credentials.username))).scalars().first() # because OAuth2PasswordRequestForm stores in dict {"username": "smth", "password": "smth"}
     
     if not user:
         raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail=f"Invalid Credentials")
     
-    if not utils.verify(user_credentials.password, user.password):
+    valid, new_hash = await passwords.verify_and_update_async(user_credentials.password, user.password)
+    if not valid:
         raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail=f"Invalid Credentials")
+    if new_hash:
+        # Stored hash predates the current bcrypt policy
+        user.password = new_hash
+        await db.commit()
     
     access_token = oauth2.create_access_token(data = {"id": user.user_id, "role": "user"})
     return {"access_token" : access_token, "token_type" : "bearer"}
 
 #LOGIN A BUSINESS
 @router.post("/business", response_model=schemas.Token)
-def login_business(user_credentials: OAuth2PasswordRequestForm = Depends(), db: Session = Depends(get_db)):
+async def login_business(request: Request, user_credentials: OAuth2PasswordRequestForm = Depends(), db: AsyncSession = Depends(get_async_db)):
+    await throttle.check_login(request, "business", user_credentials.username)
     
-    business = db.query(models.Business).filter(models.Business.email == user_credentials.username).first()
+    business = (await db.execute(select(models.Business).filter(models.Business.email == user_credentials.username))).scalars().first()
     
     if not business:
         raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail=f"Invalid Credentials")
-    if not utils.verify(user_credentials.password, business.password):
+    valid, new_hash = await passwords.verify_and_update_async(user_credentials.password, business.password)
+    if not valid:
         raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail=f"Invalid Credentials")
+    if new_hash:
+        business.password = new_hash
+        await db.commit()
     
     access_token = oauth2.create_access_token(data={"id": business.business_id, "role": "business"})
     return {"access_token" : access_token, "token_type" : "bearer"}
\ No newline at end of file
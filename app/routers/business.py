@@ -1,14 +1,16 @@
-from fastapi import FastAPI, Response, status, HTTPException, Depends, APIRouter, UploadFile, File, Query
-from ..database import engine, get_db
+from fastapi import FastAPI, Request, Response, status, HTTPException, Depends, APIRouter, UploadFile, File, Query
+from ..database import engine, get_db, get_read_db, read_db
 import psycopg2
-from .. import models, schemas, utils, oauth2
+from .. import models, schemas, utils, oauth2, cache, fulltext, suggest, etags
 from sqlalchemy.orm import Session, joinedload, aliased
-from pydantic import BaseModel, EmailStr
-from typing import List, Optional
+from pydantic import BaseModel, EmailStr, TypeAdapter
+from typing import List, Optional, Literal
 from ..config import settings
 from sqlalchemy.sql import func, extract
 from datetime import date, datetime, timedelta
-from sqlalchemy import desc
+from dateutil.relativedelta import relativedelta
+from sqlalchemy import desc, select, cast, literal_column
+from sqlalchemy.dialects.postgresql import INTERVAL, TIMESTAMP
 
 
 
@@ -17,6 +19,12 @@ router = APIRouter(
     tags=["Businesses"]
 )
 
+BUSINESS = TypeAdapter(schemas.BusinessOut)
+
+# Dashboard aggregates run on the analytics pool, so slow ones can't starve logins and checkouts
+get_analytics_db = read_db("analytics")
+get_analytics_business = oauth2.current_business(get_analytics_db)
+
 #CREATE A BUSINESS
 @router.post("/create", response_model=schemas.BusinessOut)
 def create_business(
@@ -95,6 +103,7 @@ def create_business(
     db.add(new_business)
     db.commit()
     db.refresh(new_business)
+    suggest.business_changed(new_business)
     
     return new_business
 
@@ -114,14 +123,13 @@ def update_current_business(
     db: Session = Depends(get_db),
     current_business: models.Business = Depends(oauth2.get_current_business),
 ):
-    # Fetch the current business from the database
-    business = db.query(models.Business).filter(models.Business.business_id == current_business.business_id).first()
-    
-    if not business:
+    if not current_business:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND, 
-            detail=f"Business with ID {current_business.business_id} does not exist"
+            detail=f"Business does not exist"
         )
+    # Attach the authenticated business to this session without reloading it
+    business = db.merge(current_business, load=False)
 
     # Update fields if provided
     if email:
@@ -155,129 +163,156 @@ def update_current_business(
                 detail=f"Failed to upload profile image: {str(e)}"
             )
 
+    # The business city is part of its services' search vectors
+    if city:
+        db.flush()
+        fulltext.refresh_search_vectors(db, models.Service.business_id == business.business_id)
+
     # Commit updates to the database
     db.commit()
+    oauth2.invalidate_principal("business", business.business_id)
     db.refresh(business)
+    # Services nest their business, so list pages showing them carry its tag; a new city
+    # also brings its services onto lists filtered or searched by that city
+    cache.catalog.invalidate(f"business:{business.business_id}", *(cache.entry_scope_tags(city=business.city) if city else []))
+    if name:
+        suggest.business_changed(business)
 
     return business
 
 
 #GET CURRENT BUSINESS
 @router.get("/current", response_model=schemas.BusinessOut)
-def get_current_business(db: Session = Depends(get_db), current_business: int = Depends(oauth2.get_current_business)):
-    business = db.query(models.Business).filter(models.Business.business_id == current_business.business_id).first()
-    
-    if not business:
-        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail=f"Business with id: {current_business.business_id} does not exist")
+def get_current_business(current_business: int = Depends(oauth2.get_current_business)):
+    if not current_business:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail=f"Business does not exist")
     
-    return business
+    return current_business
 
 #GET BUSINESS BY ID
 @router.get("/id/{id}", response_model=schemas.BusinessOut)
-def get_business(id: int, db: Session = Depends(get_db)):
-    business = db.query(models.Business).filter(models.Business.business_id == id).first()
-    
-    if not business:
+def get_business(id: int, request: Request, db: Session = Depends(get_read_db)):
+    updated_at = db.query(models.Business.updated_at).filter(models.Business.business_id == id).scalar()
+    if updated_at is None:
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail=f"Business with id: {id} does not exist")
+    tag = etags.etag("business", id, updated_at)
+    if etags.matches(request, tag):
+        return etags.not_modified(tag)
+
+    def build():
+        business = db.query(models.Business).filter(models.Business.business_id == id).first()
+        
+        if not business:
+            raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail=f"Business with id: {id} does not exist")
+        
+        return cache.json_response(BUSINESS, business), None
     
-    return business
+    response = cache.to_response(cache.catalog.cached(f"businesses:{id}:{tag}", [f"business:{id}"], build))
+    return etags.with_etag(response, tag)
 
 
 @router.get("/current/metrics")
 def get_business_metrics(
-    db: Session = Depends(get_db), 
-    current_business: int = Depends(oauth2.get_current_business)
+    db: Session = Depends(get_analytics_db), 
+    current_business: int = Depends(get_analytics_business)
 ):
     business_id = current_business.business_id
 
-    # 1. MRR (Monthly Recurring Revenue)
-    mrr = (
-        db.query(func.sum(models.Service.price))
-        .join(models.Subscription, models.Service.service_id == models.Subscription.service_id)
-        .filter(
-            models.Service.business_id == business_id,
-            models.Subscription.status == "active"  # Filter for active subscriptions
-        )
-        .scalar() or 0
-    )
+    # Served from memory while fresh; invalidated when the business's services or subscriptions change
+    metrics = cache.business_metrics.get(business_id)
+    if metrics is not None:
+        return metrics
 
-    # 2. Active Users
-    active_users = (
-        db.query(func.count(models.Subscription.user_id.distinct()))
-        .join(models.Service, models.Service.service_id == models.Subscription.service_id)
-        .filter(
-            models.Service.business_id == business_id,
-            models.Subscription.status == "active"
-        )
-        .scalar() or 0
-    )
-
-    # 3. New Users (this calendar month)
+    # This calendar month as a range on subscription_date, so the filter can use an index
     current_date = date.today()
-    new_users = (
-        db.query(func.count(models.Subscription.user_id.distinct()))
+    month_start = current_date.replace(day=1)
+    next_month_start = month_start + relativedelta(months=1)
+
+    # Active subscriptions to the business's services, shared by the first three metrics
+    active = (
+        select(models.Subscription.user_id, models.Subscription.subscription_date, models.Service.price)
         .join(models.Service, models.Service.service_id == models.Subscription.service_id)
-        .filter(
+        .where(
             models.Service.business_id == business_id,
-            models.Subscription.status == "active",
-            extract("year", models.Subscription.subscription_date) == current_date.year,
-            extract("month", models.Subscription.subscription_date) == current_date.month
+            models.Subscription.status == "active"
         )
-        .scalar() or 0
+        .cte("active")
     )
-
-    # 4. Service Count
     service_count = (
-        db.query(func.count(models.Service.service_id))
-        .filter(models.Service.business_id == business_id)
-        .scalar() or 0
+        select(func.count(models.Service.service_id))
+        .where(models.Service.business_id == business_id)
+        .scalar_subquery()
     )
 
+    row = db.execute(
+        select(
+            # 1. MRR (Monthly Recurring Revenue)
+            func.coalesce(func.sum(active.c.price), 0).label("mrr"),
+            # 2. Active Users
+            func.count(active.c.user_id.distinct()).label("active_users"),
+            # 3. New Users (this calendar month)
+            func.count(active.c.user_id.distinct()).filter(
+                active.c.subscription_date >= cast(month_start, TIMESTAMP(timezone=True)),
+                active.c.subscription_date < cast(next_month_start, TIMESTAMP(timezone=True))
+            ).label("new_users"),
+            # 4. Service Count
+            service_count.label("service_count")
+        )
+    ).one()
+
     # Response
-    return {
-        "MRR": mrr,
-        "active_users": active_users,
-        "new_users": new_users,
-        "service_count": service_count
+    metrics = {
+        "MRR": row.mrr,
+        "active_users": row.active_users,
+        "new_users": row.new_users,
+        "service_count": row.service_count
     }
+    cache.business_metrics.set(business_id, metrics)
+    return metrics
     
     
 @router.get("/current/services")
 def get_current_business_services(
     db: Session = Depends(get_db),
     current_business: int = Depends(oauth2.get_current_business),
+    skip: int = Query(0, ge=0, description="Number of services to skip"),
+    limit: Optional[int] = Query(None, ge=1, le=1000, description="Maximum number of services to return"),
 ):
-    # Query the services for the current business
-    services = db.query(models.Service).filter(
-        models.Service.business_id == current_business.business_id
-    ).all()
-
-    if not services:
-        return []
-
-    service_data = []
-    for service in services:
-        # Calculate MRR for the service
-        mrr = (
-            db.query(func.sum(models.Service.price))
-            .join(models.Subscription, models.Service.service_id == models.Subscription.service_id)
-            .filter(
-                models.Service.service_id == service.service_id,
-                models.Subscription.status == "active"
-            )
-            .scalar() or 0
+    # Active subscription counts per service, aggregated once for the whole business
+    active = (
+        db.query(
+            models.Subscription.service_id,
+            func.count(models.Subscription.subscription_id).label("subscriptions"),
+            func.count(models.Subscription.user_id.distinct()).label("active_users")
+        )
+        .join(models.Service, models.Service.service_id == models.Subscription.service_id)
+        .filter(
+            models.Service.business_id == current_business.business_id,
+            models.Subscription.status == "active"
         )
+        .group_by(models.Subscription.service_id)
+        .subquery()
+    )
 
-        # Calculate active users for the service
-        active_users = (
-            db.query(func.count(models.Subscription.user_id.distinct()))
-            .filter(
-                models.Subscription.service_id == service.service_id,
-                models.Subscription.status == "active"
-            )
-            .scalar() or 0
+    # Services with their metrics and eagerly loaded business/category, in a single query
+    query = (
+        db.query(
+            models.Service,
+            (models.Service.price * func.coalesce(active.c.subscriptions, 0)).label("mrr"),
+            func.coalesce(active.c.active_users, 0).label("active_users")
         )
+        .outerjoin(active, active.c.service_id == models.Service.service_id)
+        .options(joinedload(models.Service.business), joinedload(models.Service.category))
+        .filter(models.Service.business_id == current_business.business_id)
+        .order_by(models.Service.service_id)
+        .offset(skip)
+    )
+    if limit is not None:
+        query = query.limit(limit)
+    rows = query.all()
 
+    service_data = []
+    for service, mrr, active_users in rows:
         # Attach metrics to the service dictionary
         service_dict = schemas.ServiceOut.from_orm(service).dict()
         service_dict.update({"mrr": mrr, "active_users": active_users})
@@ -287,53 +322,76 @@ def get_current_business_services(
     return service_data if service_data else []
 
 
+# Longest range /current/graph-data returns per bucket size, so a request can't make the
+# server build hundreds of thousands of points
+GRAPH_MAX_SPAN = {"day": timedelta(days=2 * 366), "week": timedelta(weeks=5 * 53), "month": timedelta(days=10 * 366)}
+
+
 @router.get("/current/graph-data")
 def get_current_business_graph_data(
-    db: Session = Depends(get_db), 
-    current_business: int = Depends(oauth2.get_current_business)
+    db: Session = Depends(get_analytics_db), 
+    current_business: int = Depends(get_analytics_business),
+    from_date: Optional[date] = Query(None, alias="from", description="First day to include (default: start of this month)"),
+    to_date: Optional[date] = Query(None, alias="to", description="Last day to include (default: today)"),
+    bucket: Literal["day", "week", "month"] = Query("day", description="Group by 'day', 'week' or 'month'")
 ):
     business_id = current_business.business_id
 
-    # Get the first and last days of the current month
-    today = date.today()
-    start_of_month = today.replace(day=1)
+    # Default range: the current month up to today
+    to_date = to_date or date.today()
+    from_date = from_date or to_date.replace(day=1)
+    if from_date > to_date:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="'from' must not be after 'to'")
+    if to_date - from_date > GRAPH_MAX_SPAN[bucket]:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"Range too long for bucket '{bucket}': at most {GRAPH_MAX_SPAN[bucket].days} days"
+        )
 
-    # Prepare the response structure
-    graph_data = []
-    
-    # Iterate over each day in the current month up to today
-    for single_date in (start_of_month + timedelta(days=i) for i in range((today - start_of_month).days + 1)):
-        day_int = int(single_date.strftime("%d"))  # Extract the day and convert it to an integer
-        
-        # Count new users who created subscriptions with services owned by the current business on this day
-        new_users_count = (
-            db.query(func.count(models.Subscription.user_id.distinct()))
-            .join(models.Service, models.Service.service_id == models.Subscription.service_id)
-            .filter(
-                models.Service.business_id == business_id,
-                func.date(models.Subscription.subscription_date) == single_date
-            )
-            .scalar() or 0
+    # Read from the daily rollup (app/stats.py): cost depends on the days requested, not on history size
+    unit = literal_column(f"'{bucket}'")  # inlined so grouped and selected expressions match
+    step = cast(f"1 {bucket}", INTERVAL)
+
+    # Every bucket in the range, so periods without activity still appear with zeros
+    buckets = select(
+        func.generate_series(func.date_trunc(unit, cast(from_date, TIMESTAMP)), cast(to_date, TIMESTAMP), step).label("bucket")
+    ).subquery("buckets")
+
+    stats_bucket = func.date_trunc(unit, cast(models.BusinessDailyStats.day, TIMESTAMP))
+    totals = (
+        select(
+            stats_bucket.label("bucket"),
+            func.sum(models.BusinessDailyStats.new_subscribers).label("new_users"),
+            func.sum(models.BusinessDailyStats.revenue).label("total_transaction_amount")
         )
+        .where(
+            models.BusinessDailyStats.business_id == business_id,
+            models.BusinessDailyStats.day >= from_date,
+            models.BusinessDailyStats.day <= to_date
+        )
+        .group_by(stats_bucket)
+        .subquery("totals")
+    )
 
-        # Calculate the total amount of transactions linked to the current business's services on this day
-        total_transaction_amount = (
-            db.query(func.sum(models.Transaction.amount))
-            .join(models.Subscription, models.Subscription.subscription_id == models.Transaction.subscription_id)
-            .join(models.Service, models.Service.service_id == models.Subscription.service_id)
-            .filter(
-                models.Service.business_id == business_id,
-                func.date(models.Transaction.created_at) == single_date
-            )
-            .scalar() or 0.0
+    rows = db.execute(
+        select(
+            buckets.c.bucket,
+            func.coalesce(totals.c.new_users, 0).label("new_users"),
+            func.coalesce(totals.c.total_transaction_amount, 0.0).label("total_transaction_amount")
         )
+        .outerjoin(totals, totals.c.bucket == buckets.c.bucket)
+        .order_by(buckets.c.bucket)
+    ).all()
 
-        # Append the day's data to the response
-        graph_data.append({
-            "day": day_int,  # Use the integer day
-            "new_users": new_users_count,
-            "total_transaction_amount": total_transaction_amount
-        })
+    graph_data = [
+        {
+            "day": row.bucket.day,  # Day of the month the bucket starts on
+            "date": row.bucket.date().isoformat(),
+            "new_users": row.new_users,
+            "total_transaction_amount": row.total_transaction_amount
+        }
+        for row in rows
+    ]
 
     return {"graph_data": graph_data}
 
@@ -343,8 +401,8 @@ def get_current_business_graph_data(
 
 @router.get("/current/payouts")
 def get_current_business_payouts(
-    db: Session = Depends(get_db),
-    current_business: int = Depends(oauth2.get_current_business)
+    db: Session = Depends(get_analytics_db),
+    current_business: int = Depends(get_analytics_business)
 ):
     business_id = current_business.business_id
 
@@ -385,8 +443,8 @@ def get_current_business_payouts(
 
 @router.get("/current/users", response_model=List[schemas.UserSubscriptionOut])
 def get_users_with_subscriptions(
-    current_business: models.Business = Depends(oauth2.get_current_business),
-    db: Session = Depends(get_db),
+    current_business: models.Business = Depends(get_analytics_business),
+    db: Session = Depends(get_analytics_db),
     search: Optional[str] = Query(None, description="Search by user name")
 ):
     # Base query to fetch subscriptions
@@ -1,24 +1,51 @@
-from fastapi import FastAPI, Response, status, HTTPException, Depends, APIRouter
-from ..database import engine, get_db
+from fastapi import FastAPI, Request, Response, status, HTTPException, Depends, APIRouter
+from ..database import engine, get_db, get_read_db
 import psycopg2
-from .. import models, schemas, utils, oauth2
+from .. import models, schemas, utils, oauth2, cache, etags
 from sqlalchemy.orm import Session
-from pydantic import BaseModel
+from pydantic import BaseModel, TypeAdapter
 from typing import List
+from sqlalchemy.sql import func
 
 router = APIRouter(
     prefix = "/categories",
     tags=["Categories"]
 )
 
+CATEGORY_LIST = TypeAdapter(List[schemas.CategoryOut])
+
+
+def categories_version(db: Session):
+    # Any insert, update or delete changes the count or the latest updated_at
+    return tuple(db.query(func.count(models.Category.category_id), func.max(models.Category.updated_at)).one())
+
 #GET All CATEGORIES
 @router.get("/all", response_model=List[schemas.CategoryOut])
-def categories(db: Session = Depends(get_db)):
-    categories = db.query(models.Category).all()
-    return categories if categories else []
+def categories(request: Request, db: Session = Depends(get_read_db)):
+    tag = etags.etag("categories", *categories_version(db))
+    if etags.matches(request, tag):
+        return etags.not_modified(tag)
+
+    def build():
+        categories = db.query(models.Category).all()
+        return cache.json_response(CATEGORY_LIST, categories), None
+
+    response = cache.to_response(cache.catalog.cached(f"categories:all:{tag}", ["categories"], build))
+    return etags.with_etag(response, tag)
 
 #GET TOP CATEGORIES
 @router.get("/top", response_model=List[schemas.CategoryOut])
-def categories(db: Session = Depends(get_db), limit: int = 10):
-    categories = db.query(models.Category).limit(limit).all()
+def categories(request: Request, response: Response, db: Session = Depends(get_read_db), limit: int = 10):
+    tag = etags.etag("categories:top", limit, *categories_version(db))
+    if etags.matches(request, tag):
+        return etags.not_modified(tag)
+
+    # Ranked by app/ranking.py; unranked categories last
+    categories = (
+        db.query(models.Category)
+        .order_by(models.Category.ranking.asc().nulls_last(), models.Category.category_id)
+        .limit(limit)
+        .all()
+    )
+    response.headers["ETag"] = tag
     return categories
\ No newline at end of file
@@ -1,12 +1,15 @@
-from fastapi import FastAPI, Response, status, HTTPException, Depends, APIRouter, Query
-from ..database import engine, get_db
+from fastapi import FastAPI, Request, Response, status, HTTPException, Depends, APIRouter, Query, BackgroundTasks
+from ..database import engine, get_db, get_async_db, get_async_read_db, on_replica
 import psycopg2
-from .. import models, schemas, utils, oauth2
+from .. import models, schemas, utils, oauth2, cache, loaders, fulltext, suggest, etags
 from sqlalchemy.orm import Session
-from pydantic import BaseModel
-from typing import List, Optional
+from sqlalchemy.ext.asyncio import AsyncSession
+from pydantic import BaseModel, TypeAdapter
+from typing import List, Optional, Literal
 from . import auth
-from sqlalchemy import func, asc, desc
+from sqlalchemy import func, asc, desc, exists, tuple_, select
+from datetime import datetime
+import base64
 import json
 
 router = APIRouter(
@@ -14,48 +17,135 @@ router = APIRouter(
     tags=["Services"]
 )
 
+SERVICE = TypeAdapter(schemas.ServiceOut)
+SERVICE_LIST = TypeAdapter(List[schemas.ServiceOut])
+
+DEFAULT_PAGE_SIZE = 50
+
+# Keyset orderings for /all: sort direction; service_id breaks ties
+SORT_ORDERS = {
+    "relevance": "desc",
+    "price_asc": "asc",
+    "price_desc": "desc",
+    "newest": "desc",
+}
+
+
+def sort_key(sort_by: str, tsquery):
+    if sort_by == "relevance":
+        return func.ts_rank(models.Service.search_vector, tsquery)
+    if sort_by == "newest":
+        return models.Service.created_at
+    return models.Service.price
+
+
+def encode_cursor(sort_by: str, value, service_id: int) -> str:
+    if isinstance(value, datetime):
+        value = value.isoformat()
+    payload = json.dumps([sort_by, value, service_id]).encode()
+    return base64.urlsafe_b64encode(payload).decode()
+
+
+def decode_cursor(sort_by: str, cursor: str):
+    try:
+        cursor_sort_by, value, service_id = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+        if cursor_sort_by != sort_by:
+            raise ValueError("cursor belongs to a different sort order")
+        if sort_by == "newest":
+            value = datetime.fromisoformat(value)
+        else:
+            value = float(value)
+        return value, int(service_id)
+    except (ValueError, TypeError):
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Invalid cursor")
+
+
 @router.get("/all", response_model=List[schemas.ServiceOut])
-def get_all_services(
-    db: Session = Depends(get_db),
-    current_user: int = Depends(oauth2.get_current_user),
+async def get_all_services(
+    db: AsyncSession = Depends(get_async_read_db),
+    current_user: int = Depends(oauth2.get_current_user_async),
     category: Optional[str] = Query(None, description="Filter by category name"),
     city: Optional[str] = Query(None, description="Filter by business city"),
-    sort_by: Optional[str] = Query(None, description="Sort by 'price_asc' or 'price_desc'"),
-    search: Optional[str] = ""
+    sort_by: Optional[Literal["relevance", "price_asc", "price_desc", "newest"]] = Query(None, description="Sort by 'relevance' (default when searching), 'price_asc', 'price_desc' or 'newest' (default otherwise)"),
+    search: Optional[str] = "",
+    cursor: Optional[str] = Query(None, description="Value of the X-Next-Cursor header from the previous page"),
+    limit: Optional[int] = Query(None, ge=1, le=200, description="Page size; without limit or cursor the whole catalog is returned")
 ):
+    # Clients that predate pagination send neither and still get every service
+    if cursor is not None and limit is None:
+        limit = DEFAULT_PAGE_SIZE
+
+    # Pages depend on their filters' scope, the businesses they show and the user's subscriptions
+    key = "services:all:" + json.dumps([current_user.user_id, category, city, sort_by, search, cursor, limit])
+    tags = [*cache.list_scope_tags(category, city, search), f"user:{current_user.user_id}"]
+
+    async def build():
+        services, next_cursor = await query_services_page(db, current_user.user_id, category, city, sort_by, search, cursor, limit)
+        headers = {"X-Next-Cursor": next_cursor} if next_cursor else {}
+        return cache.json_response(SERVICE_LIST, services, headers), sorted({f"business:{service.business_id}" for service in services})
+
+    # A lagging replica may still miss a write that has already bumped these tags, and its
+    # page would then be cached as current; detail routes are safe as their keys carry
+    # the versions read on the same session
+    return cache.to_response(await cache.catalog.cached_async(key, tags, build, store=not on_replica(db)))
+
+
+async def query_services_page(db: AsyncSession, user_id: int, category, city, sort_by, search, cursor, limit: Optional[int]):
+    # Search and the category and city filters match services.search_vector (GIN index)
+    tsquery = fulltext.match_query(search, category, city)
+    if sort_by is None or (sort_by == "relevance" and tsquery is None):
+        sort_by = "relevance" if tsquery is not None else "newest"
+    key = sort_key(sort_by, tsquery)
+
     # Base query with active status filter
-    query = db.query(models.Service).filter(models.Service.status == "active")
-    
-    # Join with Category to filter by category name
-    if category:
-        query = query.join(models.Category).filter(models.Category.name.ilike(f"%{category}%"))
+    query = (
+        select(models.Service, key)
+        .options(*loaders.service_out())
+        .filter(models.Service.status == "active")
+    )
+    if tsquery is not None:
+        query = query.filter(models.Service.search_vector.op("@@")(tsquery))
     
-    # Join with Business to filter by city
-    if city:
-        query = query.join(models.Business).filter(models.Business.city.ilike(f"%{city}%"))
-    
-    # Filter by search term in service name
-    if search:
-        query = query.filter(models.Service.name.ilike(f"%{search}%"))
-    
-    # Sorting by price
-    if sort_by == "price_asc":
-        query = query.order_by(asc(models.Service.price))
-    elif sort_by == "price_desc":
-        query = query.order_by(desc(models.Service.price))
-    
-    # Get subscribed service IDs for the current user
-    subscribed_service_ids = db.query(models.Subscription.service_id).filter(models.Subscription.user_id == current_user.user_id).all()
-    subscribed_service_ids = [service_id[0] for service_id in subscribed_service_ids]
+    # Exclude services the user is already subscribed to (anti-join)
+    query = query.filter(
+        ~exists().where(
+            models.Subscription.service_id == models.Service.service_id,
+            models.Subscription.user_id == user_id
+        )
+    )
     
-    # Exclude services the user is already subscribed to
-    if subscribed_service_ids:
-        query = query.filter(models.Service.service_id.notin_(subscribed_service_ids))
+    # Keyset pagination: continue strictly after the last row of the previous page
+    direction = SORT_ORDERS[sort_by]
+    if cursor:
+        value, service_id = decode_cursor(sort_by, cursor)
+        keys, after = tuple_(key, models.Service.service_id), tuple_(value, service_id)
+        query = query.filter(keys > after if direction == "asc" else keys < after)
+    if direction == "asc":
+        query = query.order_by(asc(key), asc(models.Service.service_id))
+    else:
+        query = query.order_by(desc(key), desc(models.Service.service_id))
     
-    # Execute query and fetch all results
-    services = query.all()
+    if limit is None:
+        return [service for service, _ in (await db.execute(query)).all()], None
 
-    return services if services else []
+    # Fetch one extra row to know whether there is a next page
+    rows = (await db.execute(query.limit(limit + 1))).all()
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        last_service, last_key = rows[-1]
+        next_cursor = encode_cursor(sort_by, last_key, last_service.service_id)
+
+    return [service for service, _ in rows], next_cursor
+
+
+def invalidate_service(service: models.Service, entering: bool):
+    # Pages showing the service carry its business tag. entering: it may now belong on
+    # lists it was not on, so the scopes of its category and city are bumped too.
+    tags = [f"service:{service.service_id}", f"business:{service.business_id}"]
+    if entering and service.status == "active":
+        tags += cache.entry_scope_tags(service.category.name if service.category else None, service.business.city)
+    cache.catalog.invalidate(*tags)
 
 
 #CREATE A SERVICE
@@ -76,8 +166,13 @@ def create_service(service: schemas.ServiceCreate, category: Optional[str] = Non
     else:
         new_service = models.Service(business_id = current_business.business_id, **service.dict())
     db.add(new_service)
+    db.flush()
+    fulltext.refresh_search_vectors(db, models.Service.service_id == new_service.service_id)
     db.commit()
     db.refresh(new_service)
+    cache.invalidate_business_metrics(current_business.business_id)
+    invalidate_service(new_service, entering=True)
+    suggest.service_changed(new_service)
     
     return new_service
 
@@ -87,18 +182,49 @@ def create_service(service: schemas.ServiceCreate, category: Optional[str] = Non
 
 #GET MY SERVICES
 @router.get("/my_services", response_model=List[schemas.ServiceOut])
-def get_my_services(db: Session = Depends(get_db), current_business: int = Depends(oauth2.get_current_business)):
-    my_services = db.query(models.Service).filter(models.Service.business_id == current_business.business_id).all()
+async def get_my_services(db: AsyncSession = Depends(get_async_db), current_business: int = Depends(oauth2.get_current_business_async)):
+    my_services = (await db.execute(select(models.Service).options(*loaders.service_out()).filter(models.Service.business_id == current_business.business_id))).scalars().all()
     return my_services if my_services else []
+
+#AUTOCOMPLETE SERVICE AND BUSINESS NAMES
+@router.get("/suggest")
+async def suggest_names(
+    background_tasks: BackgroundTasks,
+    q: str = Query(..., min_length=1, description="Prefix typed so far"),
+    limit: int = Query(10, ge=1, le=50)
+):
+    # Answered from the in-process prefix index (app/suggest.py), not the database. A stale
+    # index is rebuilt after the response, in the threadpool, and served as is meanwhile.
+    if suggest.index.claim_refresh():
+        background_tasks.add_task(suggest.refresh_index)
+    return suggest.index.search(q, limit)
+
 #GET SERVICE BY ID
 @router.get("/{id}", response_model=schemas.ServiceOut)
-def get_service(id: int, db: Session = Depends(get_db)):
-    service = db.query(models.Service).filter(models.Service.service_id == id).first()
-    
-    if not service:
+async def get_service(id: int, request: Request, db: AsyncSession = Depends(get_async_read_db)):
+    # The response nests the business and category, so all three versions make up the ETag
+    versions = (await db.execute(
+        select(models.Service.updated_at, models.Business.updated_at, models.Category.updated_at)
+        .join(models.Business, models.Business.business_id == models.Service.business_id)
+        .outerjoin(models.Category, models.Category.category_id == models.Service.category_id)
+        .filter(models.Service.service_id == id)
+    )).first()
+    if not versions:
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail=f"Service with id: {id} does not exist")
+    tag = etags.etag("service", id, *versions)
+    if etags.matches(request, tag):
+        return etags.not_modified(tag)
+
+    async def build():
+        service = (await db.execute(select(models.Service).options(*loaders.service_out()).filter(models.Service.service_id == id))).scalars().first()
+        
+        if not service:
+            raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail=f"Service with id: {id} does not exist")
+        
+        return cache.json_response(SERVICE, service), [f"business:{service.business_id}", f"category:{service.category_id}"]
     
-    return service
+    response = cache.to_response(await cache.catalog.cached_async(f"services:{id}:{tag}", [f"service:{id}"], build))
+    return etags.with_etag(response, tag)
 
 #DELETE A SERVICE
 @router.delete("/delete/{service_id}", status_code=status.HTTP_204_NO_CONTENT)
@@ -113,6 +239,9 @@ def delete_service(service_id: int, db: Session = Depends(get_db), current_busin
         raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Not authorised to perfom the requested action")
     service_query.delete(synchronize_session=False)
     db.commit()
+    cache.invalidate_business_metrics(current_business.business_id)
+    cache.catalog.invalidate(f"service:{service_id}", f"business:{current_business.business_id}")
+    suggest.service_deleted(service_id)
     
     return Response(status_code=status.HTTP_204_NO_CONTENT)
 
@@ -167,9 +296,17 @@ def update_service(
             )
         service.category_id = category_obj.category_id
 
+    if name is not None or description is not None or category is not None:
+        db.flush()
+        fulltext.refresh_search_vectors(db, models.Service.service_id == service.service_id)
+
     # Commit updates to the database
     db.commit()
     db.refresh(service)
+    cache.invalidate_business_metrics(current_business.business_id)
+    # Price and searchable text decide which lists the service is on; duration does not
+    invalidate_service(service, entering=any(value is not None for value in (price, name, description, category)))
+    suggest.service_changed(service)
 
     return service
     
@@ -204,5 +341,8 @@ def toggle_service_status(
     # Commit the change to the database
     db.commit()
     db.refresh(service)
+    cache.invalidate_business_metrics(current_business.business_id)
+    invalidate_service(service, entering=service.status == "active")
+    suggest.service_changed(service)
 
     return service
@@ -1,8 +1,10 @@
 from fastapi import FastAPI, Response, status, HTTPException, Depends, APIRouter
-from ..database import engine, get_db
+from ..database import engine, get_db, get_async_db
 import psycopg2
-from .. import models, schemas, utils, oauth2
+from .. import models, schemas, utils, oauth2, billing_cycle, stats, cache, loaders
 from sqlalchemy.orm import Session
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy import select
 from pydantic import BaseModel
 from typing import List, Optional
 from . import auth
@@ -42,9 +44,9 @@ def create_subscription(service_id: int, db: Session = Depends(get_db), current_
     subscription_date = datetime.utcnow()
     expiry_date = subscription_date + relativedelta(months=service.duration)
     
-    # Calculate `days_till_next_payment`
-    next_payment_date = subscription_date + timedelta(days=30)  # Payments occur every 30 days
-    days_till_next_payment = (next_payment_date - subscription_date).days
+    # Calculate the first payment date; the billing engine advances it after each payment
+    next_billing_at = billing_cycle.next_payment_date(subscription_date, now=subscription_date)
+    days_till_next_payment = billing_cycle.days_until(next_billing_at, now=subscription_date)
     
     # Create a new subscription
     new_subscription = models.Subscription(
@@ -53,7 +55,8 @@ def create_subscription(service_id: int, db: Session = Depends(get_db), current_
         subscription_date=subscription_date,
         expiry_date=expiry_date,
         status="active",
-        days_till_next_payment=days_till_next_payment
+        days_till_next_payment=days_till_next_payment,
+        next_billing_at=next_billing_at
     )
     db.add(new_subscription)
     db.commit()
@@ -67,67 +70,41 @@ def create_subscription(service_id: int, db: Session = Depends(get_db), current_
         card_brand=user_card.card_brand  # Assign the user's card brand
     )
     db.add(first_transaction)
+    stats.record_subscription(db, service, subscription_date, first_payment=service.price)
     db.commit()
+    cache.invalidate_business_metrics(service.business_id)
+    # The service drops out of this user's /services/all pages
+    cache.catalog.invalidate(f"user:{current_user.user_id}")
 
     return {"message": "Successfully added subscription", "subscription_id": new_subscription.subscription_id}
 
 #GET MY SUBSCRIPTIONS
 @router.get("/my_subscriptions", response_model=List[schemas.Subscription])
-def get_my_subscriptions(db: Session = Depends(get_db), current_user: int = Depends(oauth2.get_current_user)):
-    subscriptions = db.query(models.Subscription).filter(models.Subscription.user_id == current_user.user_id).all()
-    
-    if not subscriptions:
-        return []
-    
-    for subscription in subscriptions:
-        update_days_till_next_payment(subscription)
-        
-        
-        if subscription.expiry_date < datetime.utcnow().date():
-            delete_expired(subscription, db)
-        else:
-            db.commit()
-        db.commit()
+async def get_my_subscriptions(db: AsyncSession = Depends(get_async_db), current_user: int = Depends(oauth2.get_current_user_async)):
+    # Read-only: days left and progress are computed on serialization, and expired
+    # subscriptions are removed by the expiry sweeper (app/expiry.py)
+    subscriptions = (await db.execute(
+        select(models.Subscription)
+        .options(*loaders.subscription_out())
+        .filter(
+            models.Subscription.user_id == current_user.user_id,
+            models.Subscription.expiry_date >= datetime.utcnow().date()
+        )
+    )).scalars().all()
     
     return subscriptions if subscriptions else []
 
 @router.get("/my_subscriptions_amount", response_model=dict)
-def get_my_subscriptions_amount(db: Session = Depends(get_db), current_user: int = Depends(oauth2.get_current_user)):
+async def get_my_subscriptions_amount(db: AsyncSession = Depends(get_async_db), current_user: int = Depends(oauth2.get_current_user_async)):
     
-    total_amount = (
-        db.query(func.sum(models.Service.price))
+    total_amount = (await db.execute(
+        select(func.sum(models.Service.price))
         .join(models.Subscription, models.Service.service_id == models.Subscription.service_id)
         .filter(models.Subscription.user_id == current_user.user_id)
         .filter(models.Subscription.status == 'active')  # Adjust this condition as needed
-        .scalar()
-    )
+    )).scalar()
 
     if total_amount is None:
         total_amount = 0  # Default to 0 if no subscriptions are found
 
     return {"monthly_payable": total_amount}
-
-
-
-
-def update_days_till_next_payment(subscription: models.Subscription):
-    # Ensure both dates are offset-aware
-    today = datetime.utcnow().replace(tzinfo=UTC)
-    subscription_date = subscription.subscription_date
-
-    if subscription_date.tzinfo is None:
-        subscription_date = subscription_date.replace(tzinfo=UTC)
-
-    next_payment_date = subscription_date + timedelta(days=30)
-
-    # If the next payment date has passed, calculate the next cycle
-    while next_payment_date < today:
-        next_payment_date += timedelta(days=30)
-    
-    subscription.days_till_next_payment = (next_payment_date - today).days
-    
-    
-    
-def delete_expired(subscription: models.Subscription, db: Session):
-    db.delete(subscription)
-    db.commit()
\ No newline at end of file
@@ -112,10 +112,10 @@ def create_user(
 #GET CURRENT USER
 @router.get("/current", response_model=schemas.UserOut)
 def get_current_user(db: Session = Depends(get_db), current_user: int = Depends(oauth2.get_current_user)):
-    user = db.query(models.User).filter(models.User.user_id == current_user.user_id).first()
+    user = current_user
     
     if not user:
-        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail=f"User with id: {current_user.user_id} does not exist")
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail=f"User does not exist")
     card = db.query(models.Card).filter(models.Card.user_id == current_user.user_id).first()
     
     number_of_subscriptions = db.query(models.Subscription).filter(models.Subscription.user_id == current_user.user_id).count()
@@ -155,11 +155,10 @@ def update_user(
     db: Session = Depends(get_db),  # Database session
     current_user: int = Depends(oauth2.get_current_user)  # Current logged-in user
 ):
-    # Fetch the current user from the database
-    user = db.query(models.User).filter(models.User.user_id == current_user.user_id).first()
-    
-    if not user:
-        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail=f"User with id: {current_user.user_id} does not exist")
+    if not current_user:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail=f"User does not exist")
+    # Attach the authenticated user to this session without reloading it
+    user = db.merge(current_user, load=False)
 
     # Update user fields if provided
     if name:
@@ -188,6 +187,7 @@ def update_user(
 
     # Commit changes to the user record
     db.commit()
+    oauth2.invalidate_principal("user", user.user_id)
 
     # If card information is provided, update the card    
     if card_number and card_expiry and card_cvc:
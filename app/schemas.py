@@ -99,7 +99,7 @@ class ServiceOut(ServiceBase):
 class Subscription(BaseModel):
     user_id: int
     service_id: int
-    days_till_next_payment: int
+    days_till_next_payment: int = Field(validation_alias="days_left")  # Days until next_billing_at (or the subscription_date cycle before it is set)
     subscription_date: datetime
     expiry_date: datetime
     status: str
@@ -0,0 +1,152 @@
+from sqlalchemy import select, update, literal, cast, Date, Float, Integer, text
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlalchemy.orm import Session
+from sqlalchemy.sql import func
+from datetime import datetime
+from . import models
+import logging
+import time
+
+logger = logging.getLogger(__name__)
+
+Stats = models.BusinessDailyStats
+
+
+# Incremental maintenance of business_daily_stats. Every write path passes a select of
+# (business_id, service_id, day, new_subscribers, revenue, active_delta), one row per
+# service and day; the caller commits together with its own write.
+def apply_daily_deltas(db: Session, deltas):
+    deltas = deltas.subquery("deltas")
+
+    # Create missing rows, carrying the active count forward from the service's last row
+    previous_active = (
+        select(Stats.active_subscriptions)
+        .where(Stats.service_id == deltas.c.service_id, Stats.day < deltas.c.day)
+        .order_by(Stats.day.desc())
+        .limit(1)
+        .scalar_subquery()
+    )
+    db.execute(
+        pg_insert(Stats)
+        .from_select(
+            ["business_id", "service_id", "day", "active_subscriptions"],
+            select(deltas.c.business_id, deltas.c.service_id, deltas.c.day, func.coalesce(previous_active, 0))
+        )
+        .on_conflict_do_nothing()
+    )
+
+    db.execute(
+        update(Stats)
+        .where(
+            Stats.business_id == deltas.c.business_id,
+            Stats.service_id == deltas.c.service_id,
+            Stats.day == deltas.c.day
+        )
+        .values(
+            new_subscribers=Stats.new_subscribers + deltas.c.new_subscribers,
+            revenue=Stats.revenue + deltas.c.revenue,
+            active_subscriptions=Stats.active_subscriptions + deltas.c.active_delta
+        )
+        .execution_options(synchronize_session=False)
+    )
+
+
+def utc_day(column):
+    return cast(func.timezone("UTC", column), Date)
+
+
+def record_subscription(db: Session, service: models.Service, subscribed_at: datetime, first_payment: float):
+    apply_daily_deltas(db, select(
+        literal(service.business_id, Integer).label("business_id"),
+        literal(service.service_id, Integer).label("service_id"),
+        literal(subscribed_at.date(), Date).label("day"),
+        literal(1, Integer).label("new_subscribers"),
+        literal(first_payment, Float).label("revenue"),
+        literal(1, Integer).label("active_delta")
+    ))
+
+
+def record_completed_transactions(db: Session, transaction_ids):
+    day = utc_day(models.Transaction.created_at)
+    apply_daily_deltas(db, (
+        select(
+            models.Service.business_id,
+            models.Service.service_id,
+            day.label("day"),
+            literal(0, Integer).label("new_subscribers"),
+            func.sum(models.Transaction.amount).label("revenue"),
+            literal(0, Integer).label("active_delta")
+        )
+        .join(models.Subscription, models.Subscription.subscription_id == models.Transaction.subscription_id)
+        .join(models.Service, models.Service.service_id == models.Subscription.service_id)
+        .where(models.Transaction.transaction_id.in_(transaction_ids))
+        .group_by(models.Service.business_id, models.Service.service_id, day)
+    ))
+
+
+def record_expired_subscriptions(db: Session, subscription_ids, expired_on):
+    apply_daily_deltas(db, (
+        select(
+            models.Service.business_id,
+            models.Service.service_id,
+            literal(expired_on, Date).label("day"),
+            literal(0, Integer).label("new_subscribers"),
+            literal(0.0, Float).label("revenue"),
+            (-func.count(models.Subscription.subscription_id)).label("active_delta")
+        )
+        .join(models.Service, models.Service.service_id == models.Subscription.service_id)
+        .where(
+            models.Subscription.subscription_id.in_(subscription_ids),
+            models.Subscription.status == "active"
+        )
+        .group_by(models.Service.business_id, models.Service.service_id)
+    ))
+
+
+# Full recompute from live and archived history, in one transaction
+REBUILD_DAILY_STATS = text("""
+    WITH subs AS (
+        SELECT subscription_id, service_id, subscription_date, NULL::timestamptz AS archived_at, status
+        FROM subscriptions
+        UNION ALL
+        SELECT subscription_id, service_id, subscription_date, archived_at, status
+        FROM subscriptions_archive
+    ),
+    completed AS (
+        SELECT subscription_id, amount, created_at FROM transactions WHERE status = 'Complete'
+        UNION ALL
+        SELECT subscription_id, amount, created_at FROM transactions_archive WHERE status = 'Complete'
+    ),
+    events AS (
+        SELECT service_id, (subscription_date AT TIME ZONE 'UTC')::date AS day,
+               1 AS new_subscribers, 0::float AS revenue, CASE WHEN status = 'active' THEN 1 ELSE 0 END AS active_delta
+        FROM subs
+        UNION ALL
+        SELECT service_id, (archived_at AT TIME ZONE 'UTC')::date, 0, 0::float, -1
+        FROM subs WHERE archived_at IS NOT NULL AND status = 'active'
+        UNION ALL
+        SELECT subs.service_id, (completed.created_at AT TIME ZONE 'UTC')::date, 0, completed.amount, 0
+        FROM completed JOIN subs ON subs.subscription_id = completed.subscription_id
+    ),
+    daily AS (
+        SELECT service_id, day, SUM(new_subscribers) AS new_subscribers,
+               SUM(revenue) AS revenue, SUM(active_delta) AS active_delta
+        FROM events
+        GROUP BY service_id, day
+    )
+    INSERT INTO business_daily_stats (business_id, service_id, day, new_subscribers, revenue, active_subscriptions)
+    SELECT services.business_id, daily.service_id, daily.day, daily.new_subscribers, daily.revenue,
+           SUM(daily.active_delta) OVER (PARTITION BY daily.service_id ORDER BY daily.day)
+    FROM daily JOIN services ON services.service_id = daily.service_id
+""")
+
+
+def rebuild_daily_stats(db: Session):
+    started = time.perf_counter()
+    db.execute(text("LOCK TABLE business_daily_stats IN EXCLUSIVE MODE"))
+    db.execute(text("DELETE FROM business_daily_stats"))
+    rows = db.execute(REBUILD_DAILY_STATS).rowcount
+    db.commit()
+
+    logger.info(f"Rebuilt {rows} business_daily_stats rows in {time.perf_counter() - started:.2f}s")
+    return rows
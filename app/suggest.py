@@ -0,0 +1,154 @@
+from bisect import bisect_left, insort
+from threading import Lock
+from sqlalchemy.orm import Session
+from .config import settings
+from .database import SessionLocal
+from . import models
+import logging
+import re
+import time
+
+logger = logging.getLogger(__name__)
+
+
+def tokens(name: str):
+    # Every word suffix of the name, so "Best Gym Tashkent" is found by "gym" and "tash"
+    words = re.findall(r"\w+", name.casefold())
+    return [" ".join(words[i:]) for i in range(len(words))]
+
+
+# Autocomplete over active service names and business names: a sorted array of
+# (token, kind, id) entries searched with bisect. Each process holds its own copy; it is
+# updated on writes made in this process and rebuilt from the database every
+# suggest_index_refresh_seconds to pick up writes made by other processes. Rebuilds run
+# one at a time in the background while searches keep using the old entries.
+class PrefixIndex:
+    def __init__(self, refresh_seconds: float):
+        self.refresh_seconds = refresh_seconds
+        self._entries = []
+        self._names = {}
+        self._loaded_at = None
+        self._refreshing = False
+        self._changes = None
+        self._lock = Lock()
+
+    def load(self, db: Session):
+        started = time.perf_counter()
+        with self._lock:
+            self._changes = []
+        try:
+            names = {("service", service_id): name for service_id, name in (
+                db.query(models.Service.service_id, models.Service.name).filter(models.Service.status == "active")
+            )}
+            names.update({("business", business_id): name for business_id, name in (
+                db.query(models.Business.business_id, models.Business.name)
+            )})
+            entries = sorted((token, kind, id) for (kind, id), name in names.items() for token in tokens(name))
+
+            with self._lock:
+                self._entries, self._names = entries, names
+                # Writes made in this process while the rows were read may be missing from them
+                for key, name in self._changes:
+                    self._apply(key, name)
+                self._loaded_at = time.monotonic()
+        finally:
+            with self._lock:
+                self._changes = None
+        logger.info(f"Suggest index: {len(names)} names, {len(entries)} entries in {time.perf_counter() - started:.2f}s")
+
+    def is_stale(self) -> bool:
+        return self._loaded_at is None or time.monotonic() - self._loaded_at > self.refresh_seconds
+
+    def claim_refresh(self) -> bool:
+        # True for the one caller that should rebuild a stale index; the rest keep searching
+        # the old one until refresh_finished()
+        with self._lock:
+            if self._refreshing or not self.is_stale():
+                return False
+            self._refreshing = True
+            return True
+
+    def refresh_finished(self):
+        with self._lock:
+            self._refreshing = False
+
+    def add(self, kind: str, id: int, name: str):
+        self._change((kind, id), name)
+
+    def remove(self, kind: str, id: int):
+        self._change((kind, id), None)
+
+    def _change(self, key, name):
+        with self._lock:
+            self._apply(key, name)
+            if self._changes is not None:
+                self._changes.append((key, name))
+
+    def _apply(self, key, name):
+        self._remove(key)
+        if name is not None:
+            self._names[key] = name
+            for token in tokens(name):
+                insort(self._entries, (token, *key))
+
+    def _remove(self, key):
+        name = self._names.pop(key, None)
+        if name is None:
+            return
+        for token in tokens(name):
+            entry = (token, *key)
+            i = bisect_left(self._entries, entry)
+            if i < len(self._entries) and self._entries[i] == entry:
+                del self._entries[i]
+
+    def search(self, prefix: str, limit: int = 10):
+        prefix = " ".join(re.findall(r"\w+", prefix.casefold()))
+        if not prefix:
+            return []
+
+        results, seen = [], set()
+        with self._lock:
+            i = bisect_left(self._entries, (prefix,))
+            while i < len(self._entries) and len(results) < limit:
+                token, kind, id = self._entries[i]
+                if not token.startswith(prefix):
+                    break
+                if (kind, id) not in seen:
+                    seen.add((kind, id))
+                    results.append({"type": kind, "id": id, "name": self._names[(kind, id)]})
+                i += 1
+        return results
+
+
+index = PrefixIndex(settings.suggest_index_refresh_seconds)
+
+
+def load_index():
+    db = SessionLocal()
+    try:
+        index.load(db)
+    finally:
+        db.close()
+
+
+def refresh_index():
+    # Background task for a claimed refresh (PrefixIndex.claim_refresh)
+    try:
+        load_index()
+    finally:
+        index.refresh_finished()
+
+
+def service_changed(service: models.Service):
+    if service.status == "active":
+        index.add("service", service.service_id, service.name)
+    else:
+        index.remove("service", service.service_id)
+
+
+def service_deleted(service_id: int):
+    index.remove("service", service_id)
+
+
+def business_changed(business: models.Business):
+    index.add("business", business.business_id, business.name)
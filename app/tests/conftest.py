@@ -0,0 +1,39 @@
+import pytest
+from contextlib import contextmanager
+from fastapi.testclient import TestClient
+from sqlalchemy import event
+
+
+@pytest.fixture(scope="module", autouse=True)
+def client_lifespan(request):
+    # Runs each module's TestClient inside a with block: one event loop for the module, so
+    # pooled asyncpg connections are reused across requests and closed at shutdown
+    client = getattr(request.module, "client", None)
+    if isinstance(client, TestClient):
+        with client:
+            yield
+    else:
+        yield
+
+
+@pytest.fixture
+def capture_statements():
+    # SQL sent to the given engines (every app engine by default) while the block runs
+    from app import database
+
+    @contextmanager
+    def capture(*engines):
+        engines = engines or (*database.engines.values(), database.async_engine.sync_engine)
+        statements = []
+
+        def listener(conn, cursor, statement, *args):
+            statements.append(statement)
+
+        for engine in engines:
+            event.listen(engine, "before_cursor_execute", listener)
+        try:
+            yield statements
+        finally:
+            for engine in engines:
+                event.remove(engine, "before_cursor_execute", listener)
+    return capture
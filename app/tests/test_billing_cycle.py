@@ -0,0 +1,52 @@
+from datetime import datetime, timedelta
+from app import billing_cycle
+from app.database import get_db
+from sqlalchemy import select, literal
+from pytz import UTC
+import random
+
+
+def loop_days_till_next_payment(subscription_date, now):
+    # Reference implementation: the original per-row while loop
+    next_payment_date = subscription_date + timedelta(days=30)
+    while next_payment_date < now:
+        next_payment_date += timedelta(days=30)
+    return (next_payment_date - now).days
+
+
+def random_dates(now, count=500):
+    rng = random.Random(42)
+    return [now - timedelta(seconds=rng.randint(0, 10 * 365 * 86400)) for _ in range(count)]
+
+
+def test_closed_form_matches_loop():
+    now = datetime(2024, 11, 26, 16, 40, tzinfo=UTC)
+    for subscription_date in random_dates(now) + [now, now - timedelta(days=30), now - timedelta(days=60, seconds=1)]:
+        expected = loop_days_till_next_payment(subscription_date, now)
+        assert billing_cycle.days_till_next_payment(subscription_date, now) == expected
+
+
+def test_naive_dates_are_treated_as_utc():
+    now = datetime(2024, 11, 26, 12, 0, tzinfo=UTC)
+    naive = datetime(2024, 11, 20, 12, 0)
+
+    assert billing_cycle.days_till_next_payment(naive, now) == 24
+    assert billing_cycle.next_payment_date(naive, now) == datetime(2024, 12, 20, 12, 0, tzinfo=UTC)
+
+
+def test_sql_expression_matches_scalar():
+    db = next(get_db())
+    now = datetime(2024, 11, 26, 16, 40, tzinfo=UTC)
+
+    for subscription_date in random_dates(now, count=50):
+        expr = billing_cycle.days_till_next_payment_expr(literal(subscription_date), now)
+        assert db.execute(select(expr)).scalar() == billing_cycle.days_till_next_payment(subscription_date, now)
+
+
+def test_next_payment_date_expr_matches_scalar():
+    db = next(get_db())
+    now = datetime(2024, 11, 26, 16, 40, tzinfo=UTC)
+
+    for subscription_date in random_dates(now, count=50):
+        expr = billing_cycle.next_payment_date_expr(literal(subscription_date), now)
+        assert db.execute(select(expr)).scalar() == billing_cycle.next_payment_date(subscription_date, now)
@@ -3,10 +3,11 @@ from fastapi.testclient import TestClient
 from app.main import app
 from app.oauth2 import create_access_token
 from app.database import get_db
-from app import models
+from app import models, stats
 from sqlalchemy.orm import Session
 import random
 import string
+from datetime import date, datetime
 
 client = TestClient(app)
 
@@ -248,3 +249,200 @@ def test_get_users_with_subscriptions(db):
     )
     assert response.status_code == 200
     assert isinstance(response.json(), list)
+
+
+def test_get_current_business_graph_data(db):
+    business = models.Business(
+        email=random_email(),
+        name="Test Business",
+        password="hashedpassword",
+        phone="1234567890",
+        description="A test business",
+        country="Testland",
+        city="Test City",
+        address="123 Test St.",
+        bank_account="12345678",
+        bank_account_name="Test Account",
+        bank_name="Test Bank",
+    )
+    user = models.User(email=f"user_{random_email()}", name="Test User", password="hashedpassword")
+    db.add_all([business, user])
+    db.commit()
+    service = models.Service(name="Test Service", description="A service", price=25.0, duration=12, business_id=business.business_id)
+    db.add(service)
+    db.commit()
+    subscription = models.Subscription(
+        service_id=service.service_id,
+        user_id=user.user_id,
+        subscription_date=datetime(2024, 3, 10, 12, 0),
+        expiry_date=date(2025, 3, 10),
+        status="active"
+    )
+    db.add(subscription)
+    db.commit()
+    db.add_all([
+        models.Transaction(amount=25.0, status="Complete", subscription_id=subscription.subscription_id, card_brand="Visa", created_at=datetime(2024, 3, 10, 12, 0)),
+        models.Transaction(amount=25.0, status="Complete", subscription_id=subscription.subscription_id, card_brand="Visa", created_at=datetime(2024, 4, 9, 12, 0)),
+    ])
+    db.commit()
+    stats.rebuild_daily_stats(db)
+
+    token = create_access_token(data={"id": business.business_id, "role": "business"})
+    headers = {"Authorization": f"Bearer {token}"}
+
+    response = client.get("/businesses/current/graph-data", headers=headers, params={"from": "2024-03-01", "to": "2024-03-31"})
+    assert response.status_code == 200, response.text
+    graph_data = response.json()["graph_data"]
+    assert len(graph_data) == 31
+    assert graph_data[9] == {"day": 10, "date": "2024-03-10", "new_users": 1, "total_transaction_amount": 25.0}
+    assert sum(point["new_users"] for point in graph_data) == 1
+
+    response = client.get("/businesses/current/graph-data", headers=headers, params={"from": "2024-01-15", "to": "2024-06-30", "bucket": "month"})
+    assert response.status_code == 200, response.text
+    graph_data = response.json()["graph_data"]
+    assert [point["date"] for point in graph_data] == ["2024-01-01", "2024-02-01", "2024-03-01", "2024-04-01", "2024-05-01", "2024-06-01"]
+    assert [point["total_transaction_amount"] for point in graph_data] == [0.0, 0.0, 25.0, 25.0, 0.0, 0.0]
+
+    response = client.get("/businesses/current/graph-data", headers=headers, params={"from": "2024-04-01", "to": "2024-03-01"})
+    assert response.status_code == 400
+
+    # Ranges are capped per bucket size
+    response = client.get("/businesses/current/graph-data", headers=headers, params={"from": "0001-01-01", "to": "2024-03-31"})
+    assert response.status_code == 400
+    response = client.get("/businesses/current/graph-data", headers=headers, params={"from": "2020-01-01", "to": "2024-03-31", "bucket": "day"})
+    assert response.status_code == 400
+    response = client.get("/businesses/current/graph-data", headers=headers, params={"from": "2020-01-01", "to": "2024-03-31", "bucket": "month"})
+    assert response.status_code == 200, response.text
+    assert len(response.json()["graph_data"]) == 51
+
+
+def test_daily_stats_follow_subscription_writes(db):
+    business = models.Business(
+        email=random_email(),
+        name="Test Business",
+        password="hashedpassword",
+        phone="1234567890",
+        description="A test business",
+        country="Testland",
+        city="Test City",
+        address="123 Test St.",
+        bank_account="12345678",
+        bank_account_name="Test Account",
+        bank_name="Test Bank",
+    )
+    user = models.User(email=f"user_{random_email()}", name="Test User", password="hashedpassword")
+    db.add_all([business, user])
+    db.commit()
+    service = models.Service(name="Test Service", description="A service", price=40.0, duration=12, business_id=business.business_id)
+    db.add_all([service, models.Card(user_id=user.user_id, card_number="4111 1111 1111 1111", card_expiry="12/30", card_brand="Visa")])
+    db.commit()
+
+    user_token = create_access_token(data={"id": user.user_id, "role": "user"})
+    response = client.post(f"/subscriptions/create/{service.service_id}", headers={"Authorization": f"Bearer {user_token}"})
+    assert response.status_code == 201, response.text
+
+    row = db.query(models.BusinessDailyStats).filter(models.BusinessDailyStats.service_id == service.service_id).one()
+    assert (row.day, row.new_subscribers, row.revenue, row.active_subscriptions) == (datetime.utcnow().date(), 1, 40.0, 1)
+
+    token = create_access_token(data={"id": business.business_id, "role": "business"})
+    today = datetime.utcnow().date()
+    response = client.get(
+        "/businesses/current/graph-data",
+        headers={"Authorization": f"Bearer {token}"},
+        params={"from": today.isoformat(), "to": today.isoformat()},
+    )
+    assert response.json()["graph_data"] == [
+        {"day": today.day, "date": today.isoformat(), "new_users": 1, "total_transaction_amount": 40.0}
+    ]
+
+    # A rebuild from history reproduces the incrementally maintained row
+    stats.rebuild_daily_stats(db)
+    db.expire_all()
+    rebuilt = db.query(models.BusinessDailyStats).filter(models.BusinessDailyStats.service_id == service.service_id).one()
+    assert (rebuilt.new_subscribers, rebuilt.revenue, rebuilt.active_subscriptions) == (1, 40.0, 1)
+
+
+def test_get_current_business_services_metrics_and_pagination(db, capture_statements):
+    business = models.Business(
+        email=random_email(),
+        name="Test Business",
+        password="hashedpassword",
+        phone="1234567890",
+        description="A test business",
+        country="Testland",
+        city="Test City",
+        address="123 Test St.",
+        bank_account="12345678",
+        bank_account_name="Test Account",
+        bank_name="Test Bank",
+    )
+    users = [models.User(email=f"user{i}_{random_email()}", name="Test User", password="hashedpassword") for i in range(3)]
+    db.add_all([business, *users])
+    db.commit()
+    services = [
+        models.Service(name=f"Service {i}", description="A service", price=10.0 * (i + 1), duration=12, business_id=business.business_id, status="active")
+        for i in range(3)
+    ]
+    db.add_all(services)
+    db.commit()
+    # Service 0: three subscribers, service 1: one, service 2: none
+    for user, service in [(users[0], services[0]), (users[1], services[0]), (users[2], services[0]), (users[0], services[1])]:
+        db.add(models.Subscription(service_id=service.service_id, user_id=user.user_id, expiry_date=date(2099, 1, 1), status="active"))
+    db.commit()
+
+    token = create_access_token(data={"id": business.business_id, "role": "business"})
+    headers = {"Authorization": f"Bearer {token}"}
+
+    with capture_statements() as statements:
+        response = client.get("/businesses/current/services", headers=headers)
+
+    assert response.status_code == 200, response.text
+    data = response.json()
+    assert [(s["name"], s["mrr"], s["active_users"]) for s in data] == [
+        ("Service 0", 30.0, 3), ("Service 1", 20.0, 1), ("Service 2", 0, 0)
+    ]
+    assert data[0]["business"]["email"] == business.email
+    # One query for the authenticated business, one for the services with their metrics
+    assert len(statements) == 2
+
+    response = client.get("/businesses/current/services", headers=headers, params={"skip": 1, "limit": 1})
+    assert [s["name"] for s in response.json()] == ["Service 1"]
+
+
+def test_get_business_metrics_values_and_invalidation(db):
+    business = models.Business(
+        email=random_email(),
+        name="Test Business",
+        password="hashedpassword",
+        phone="1234567890",
+        description="A test business",
+        country="Testland",
+        city="Test City",
+        address="123 Test St.",
+        bank_account="12345678",
+        bank_account_name="Test Account",
+        bank_name="Test Bank",
+    )
+    users = [models.User(email=f"user{i}_{random_email()}", name="Test User", password="hashedpassword") for i in range(2)]
+    db.add_all([business, *users])
+    db.commit()
+    service = models.Service(name="Test Service", description="A service", price=15.0, duration=12, business_id=business.business_id)
+    db.add(service)
+    db.add_all([models.Card(user_id=user.user_id, card_number="4111 1111 1111 1111", card_expiry="12/30", card_brand="Visa") for user in users])
+    db.commit()
+    # An active subscription from a previous month
+    db.add(models.Subscription(service_id=service.service_id, user_id=users[0].user_id, subscription_date=datetime(2024, 1, 5), expiry_date=date(2099, 1, 1), status="active"))
+    db.commit()
+
+    token = create_access_token(data={"id": business.business_id, "role": "business"})
+    headers = {"Authorization": f"Bearer {token}"}
+    response = client.get("/businesses/current/metrics", headers=headers)
+    assert response.json() == {"MRR": 15.0, "active_users": 1, "new_users": 0, "service_count": 1}
+
+    # Subscribing through the API invalidates the cached metrics
+    user_token = create_access_token(data={"id": users[1].user_id, "role": "user"})
+    response = client.post(f"/subscriptions/create/{service.service_id}", headers={"Authorization": f"Bearer {user_token}"})
+    assert response.status_code == 201, response.text
+
+    response = client.get("/businesses/current/metrics", headers=headers)
+    assert response.json() == {"MRR": 30.0, "active_users": 2, "new_users": 1, "service_count": 1}
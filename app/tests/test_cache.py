@@ -0,0 +1,134 @@
+from app.cache import TTLCache, LRUCache, TaggedCache, LocalBackend, list_scope_tags, entry_scope_tags
+import asyncio
+import threading
+import time
+
+
+def test_ttl_cache_expires_entries():
+    cache = TTLCache(ttl=0.05)
+    cache.set("key", {"MRR": 10})
+    assert cache.get("key") == {"MRR": 10}
+
+    time.sleep(0.06)
+    assert cache.get("key") is None
+
+
+def test_ttl_cache_delete_and_disabled():
+    cache = TTLCache(ttl=60)
+    cache.set("key", 1)
+    cache.delete("key")
+    assert cache.get("key") is None
+
+    disabled = TTLCache(ttl=0)
+    disabled.set("key", 1)
+    assert disabled.get("key") is None
+
+
+def test_ttl_cache_is_bounded():
+    cache = TTLCache(ttl=60, maxsize=3)
+    for key in range(5):
+        cache.set(key, key)
+
+    assert [cache.get(key) for key in range(5)] == [None, None, 2, 3, 4]
+
+
+def test_lru_cache_evicts_least_recently_used():
+    cache = LRUCache(maxsize=2)
+    cache.set("a", 1)
+    cache.set("b", 2)
+    cache.get("a")
+    cache.set("c", 3)
+
+    assert [cache.get(key) for key in "abc"] == [1, None, 3]
+
+
+def build_counter(value, extra_tags=None):
+    calls = []
+
+    def build():
+        calls.append(1)
+        return (value, {}), extra_tags
+    return build, calls
+
+
+def test_tagged_cache_invalidates_by_tag():
+    cache = TaggedCache(LocalBackend(max_bytes=1024), ttl=60)
+    build, calls = build_counter(b"page", extra_tags=["business:1"])
+
+    assert cache.cached("services:all", ["catalog"], build) == (b"page", {})
+    assert cache.cached("services:all", ["catalog"], build) == (b"page", {})
+    assert len(calls) == 1
+
+    cache.invalidate("category:1")
+    cache.cached("services:all", ["catalog"], build)
+    assert len(calls) == 1
+
+    cache.invalidate("business:1")
+    cache.cached("services:all", ["catalog"], build)
+    assert len(calls) == 2
+
+
+def test_blocking_backend_is_called_off_the_event_loop():
+    threads = set()
+
+    class RemoteBackend(LocalBackend):
+        # Stands in for Redis: every call is a network round trip
+        blocking = True
+
+        def get(self, key):
+            threads.add(threading.get_ident())
+            return super().get(key)
+
+        def set(self, key, entry, size, ttl):
+            threads.add(threading.get_ident())
+            super().set(key, entry, size, ttl)
+
+    cache = TaggedCache(RemoteBackend(max_bytes=1024), ttl=60)
+
+    async def build():
+        return (b"page", {}), None
+
+    async def fetch_twice():
+        assert await cache.cached_async("services:1", ["service:1"], build) == (b"page", {})
+        assert await cache.cached_async("services:1", ["service:1"], build) == (b"page", {})
+        return threading.get_ident()
+
+    loop_thread = asyncio.run(fetch_twice())
+    assert threads and loop_thread not in threads
+
+
+def test_local_backend_is_bounded_by_bytes():
+    cache = TaggedCache(LocalBackend(max_bytes=10), ttl=60)
+    builds = {key: build_counter(b"1234") for key in "abc"}
+    for key in "abc":
+        cache.cached(key, [], builds[key][0])
+    # "a" was least recently used and was evicted to make room for "c"
+    for key in "abc":
+        cache.cached(key, [], builds[key][0])
+    assert [len(builds[key][1]) for key in "abc"] == [2, 2, 2]
+
+    cache.cached("b", [], builds["b"][0])
+    assert len(builds["b"][1]) == 2
+
+
+def test_local_backend_tag_overflow_starts_new_epoch():
+    cache = TaggedCache(LocalBackend(max_bytes=1024, max_tags=2), ttl=60)
+    build, calls = build_counter(b"page")
+    cache.cached("key", ["a"], build)
+
+    cache.invalidate("b", "c")
+    cache.invalidate("d")
+    cache.cached("key", ["a"], build)
+    assert len(calls) == 2
+
+
+def test_list_scope_tags_cover_the_services_that_can_enter():
+    assert list_scope_tags() == ["catalog"]
+    assert list_scope_tags(category="Gym", search="yoga") == ["catalog"]
+    assert list_scope_tags(category="Fitness Gym", city="ta") == ["category:fit", "city:ta"]
+
+    entering = entry_scope_tags("Fitness", "Tashkent")
+    assert entering == ["catalog", "category:f", "category:fi", "category:fit", "city:t", "city:ta", "city:tas"]
+    for tag in list_scope_tags(city="tash") + list_scope_tags(city="T") + list_scope_tags(category="fit"):
+        assert tag in entering
+    assert "city:sa" not in entering
@@ -0,0 +1,55 @@
+import pytest
+from fastapi.testclient import TestClient
+from app.main import app
+from app.database import get_db
+from app import models
+from app.ranking import rank_categories
+from datetime import date
+import uuid
+
+client = TestClient(app)
+
+
+@pytest.fixture
+def db():
+    db = next(get_db())
+    yield db
+    db.close()
+
+
+def test_rank_categories_orders_top_by_active_subscriptions(db):
+    suffix = uuid.uuid4().hex[:8]
+    categories = [models.Category(name=f"Rank {name} {suffix}") for name in ("low", "high", "none")]
+    db.add_all(categories)
+    business = models.Business(
+        email=f"business_{suffix}@example.com", name="Ranking Business", password="hashedpassword",
+        phone="1234567890", description="A test business", country="Testland", city="Test City",
+        address="123 Test St.", bank_account="12345678", bank_account_name="Test Account", bank_name="Test Bank"
+    )
+    users = [models.User(email=f"user_{i}_{suffix}@example.com", name="Test User", password="hashedpassword") for i in range(3)]
+    db.add_all([business, *users])
+    db.commit()
+
+    low, high, none = categories
+    services = [
+        models.Service(name=f"Service {category.name}", description="A service", price=10.0, duration=12,
+                       business_id=business.business_id, category_id=category.category_id, status="active")
+        for category in (low, high)
+    ]
+    db.add_all(services)
+    db.commit()
+    # high: two active subscriptions, low: one active and one cancelled
+    for user, service, status in [(users[0], services[1], "active"), (users[1], services[1], "active"),
+                                  (users[2], services[0], "active"), (users[0], services[0], "cancelled")]:
+        db.add(models.Subscription(service_id=service.service_id, user_id=user.user_id, expiry_date=date(2099, 1, 1), status=status))
+    db.commit()
+
+    rank_categories(db)
+    db.expire_all()
+    assert high.ranking < low.ranking < none.ranking
+    assert rank_categories(db) == 0
+
+    response = client.get("/categories/top", params={"limit": 1000})
+    assert response.status_code == 200, response.text
+    names = [category["name"] for category in response.json()]
+    assert names.index(high.name) < names.index(low.name) < names.index(none.name)
@@ -0,0 +1,235 @@
+import pytest
+from fastapi.testclient import TestClient
+from sqlalchemy import create_engine, exc, text
+from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import NullPool
+from app.main import app
+from app.database import engine, instrument_pool, TimedQueuePool, TimedAsyncQueuePool, SQLALCHEMY_DATABASE_URL, ASYNC_DATABASE_URL
+from app.oauth2 import create_access_token
+from app.config import settings
+from app import database, metrics, models, oauth2
+import uuid
+
+client = TestClient(app)
+
+OLTP = {"pool": "oltp"}
+
+
+def test_pool_publishes_checkout_gauges_and_wait_time(monkeypatch):
+    waits = metrics.get("db_pool_wait_seconds_count", labels=OLTP)
+    with engine.connect() as first, engine.connect() as second:
+        first.execute(text("SELECT 1"))
+        second.execute(text("SELECT 1"))
+        assert metrics.get("db_pool_checked_out", labels=OLTP) >= 2
+    assert metrics.get("db_pool_checked_out", labels=OLTP) == engine.pool.checkedout()
+    assert metrics.get("db_pool_wait_seconds_count", labels=OLTP) == waits + 2
+    assert metrics.get("db_pool_size", labels=OLTP) == engine.pool.size()
+
+    monkeypatch.setattr(settings, "metrics_token", "scrape-token")
+    response = client.get("/metrics", headers={"Authorization": "Bearer scrape-token"})
+    assert 'db_pool_checked_out{pool="oltp"}' in response.text
+    assert 'db_pool_wait_seconds_sum{pool="oltp"}' in response.text
+
+
+
+def test_metrics_require_the_configured_token(monkeypatch):
+    monkeypatch.setattr(settings, "metrics_token", None)
+    assert client.get("/metrics").status_code == 404
+
+    monkeypatch.setattr(settings, "metrics_token", "scrape-token")
+    assert client.get("/metrics").status_code == 401
+    assert client.get("/metrics", headers={"Authorization": "Bearer wrong"}).status_code == 401
+    assert client.get("/metrics", headers={"Authorization": "Bearer scrape-token"}).status_code == 200
+
+def test_async_pool_reuses_connections_and_publishes_metrics():
+    labels = {"pool": "oltp-async"}
+    assert isinstance(database.async_engine.pool, TimedAsyncQueuePool)
+    client.get("/services/0")
+    waits, connections = metrics.get("db_pool_wait_seconds_count", labels=labels), metrics.get("db_pool_connections_total", labels=labels)
+
+    for _ in range(3):
+        assert client.get("/services/0").status_code == 404
+    assert metrics.get("db_pool_wait_seconds_count", labels=labels) == waits + 3
+    assert metrics.get("db_pool_connections_total", labels=labels) == connections
+    assert metrics.get("db_pool_checked_out", labels=labels) == 0
+
+
+def test_pool_overflow_and_timeout_are_counted():
+    small = create_engine(
+        SQLALCHEMY_DATABASE_URL, poolclass=TimedQueuePool, pool_logging_name="test-small",
+        pool_size=1, max_overflow=1, pool_timeout=0.05
+    )
+    instrument_pool(small, "test-small")
+    labels = {"pool": "test-small"}
+    try:
+        with small.connect(), small.connect():
+            assert metrics.get("db_pool_overflow", labels=labels) == 1
+            with pytest.raises(exc.TimeoutError):
+                small.connect()
+        assert metrics.get("db_pool_timeouts_total", labels=labels) == 1
+        assert metrics.get("db_pool_checked_out", labels=labels) == 0
+        assert metrics.get("db_pool_connections_total", labels=labels) == 2
+    finally:
+        small.dispose()
+
+
+# The primary database stands in for a healthy replica; port 1 for an unreachable one
+DOWN_URL = SQLALCHEMY_DATABASE_URL.replace(f":{engine.url.port}/", ":1/")
+
+
+def reads(target: str) -> float:
+    return metrics.get("db_read_sessions_total", labels={"target": target})
+
+
+@pytest.fixture
+def replica(monkeypatch):
+    def use(url: str, async_url: str):
+        monkeypatch.setattr(database, "_replica_down_until", 0.0)
+        for workload in ("oltp", "analytics"):
+            monkeypatch.setitem(database.read_sessions, workload, sessionmaker(bind=create_engine(url, poolclass=NullPool)))
+        async_replica = create_async_engine(async_url, poolclass=NullPool)
+        monkeypatch.setattr(database, "AsyncReadSessionLocal", async_sessionmaker(async_replica))
+        return async_replica
+    return use
+
+
+def test_reads_go_to_replica_unless_primary_is_requested(replica):
+    replica(SQLALCHEMY_DATABASE_URL, ASYNC_DATABASE_URL)
+    before_replica, before_primary = reads("replica"), reads("primary")
+
+    assert client.get("/categories/all").status_code == 200
+    assert client.get("/services/0").status_code == 404
+    assert reads("replica") == before_replica + 2
+
+    response = client.get("/categories/all", headers={database.PRIMARY_HEADER: "true"})
+    assert response.status_code == 200
+    assert reads("primary") == before_primary + 1
+
+
+def test_unreachable_replica_falls_back_to_primary(replica):
+    replica(DOWN_URL, DOWN_URL.replace("postgresql://", "postgresql+asyncpg://"))
+    fallbacks, before_primary = metrics.get("db_replica_fallback_total"), reads("primary")
+
+    assert client.get("/services/0").status_code == 404
+    assert metrics.get("db_replica_fallback_total") == fallbacks + 1
+
+    # The replica is skipped until the retry interval has passed
+    assert client.get("/categories/all").status_code == 200
+    assert metrics.get("db_replica_fallback_total") == fallbacks + 1
+    assert reads("primary") == before_primary + 2
+
+
+def test_service_lists_read_on_the_replica_are_not_cached(replica, capture_statements):
+    async_replica = replica(SQLALCHEMY_DATABASE_URL, ASYNC_DATABASE_URL)
+    db = database.SessionLocal()
+    user = models.User(email=f"user_{uuid.uuid4().hex[:8]}@example.com", name="Replica User", password="hashedpassword")
+    db.add(user)
+    db.commit()
+    headers = {"Authorization": f"Bearer {create_access_token(data={'id': user.user_id, 'role': 'user'})}"}
+    db.close()
+
+    # The replica may lag behind a write that already bumped the page's tags
+    for _ in range(2):
+        with capture_statements(async_replica.sync_engine) as statements:
+            assert client.get("/services/all", headers=headers, params={"limit": 5}).status_code == 200
+        assert statements
+
+    headers[database.PRIMARY_HEADER] = "true"
+    client.get("/services/all", headers=headers, params={"limit": 5})
+    with capture_statements() as statements:
+        assert client.get("/services/all", headers=headers, params={"limit": 5}).status_code == 200
+    assert statements == []
+
+
+def test_principals_read_on_the_replica_are_not_cached(replica):
+    replica(SQLALCHEMY_DATABASE_URL, ASYNC_DATABASE_URL)
+    db = database.SessionLocal()
+    business = models.Business(
+        email=f"business_{uuid.uuid4().hex[:8]}@example.com", name="Replica Business", password="hashedpassword",
+        phone="1234567890", description="", country="Testland", city="Test City", address="1 Test St.",
+        bank_account="1", bank_account_name="Test", bank_name="Test Bank",
+    )
+    db.add(business)
+    db.commit()
+    business_id = business.business_id
+    db.close()
+    oauth2.principals.clear()
+
+    # A lagging replica could hand back a profile older than the last update
+    headers = {"Authorization": f"Bearer {create_access_token(data={'id': business_id, 'role': 'business'})}"}
+    assert client.get("/businesses/current/metrics", headers=headers).status_code == 200
+    assert oauth2.principals.get(("business", business_id)) is None
+
+    # An account the replica doesn't have (yet) is not authenticated, rather than a 500
+    headers = {"Authorization": f"Bearer {create_access_token(data={'id': business_id + 10 ** 6, 'role': 'business'})}"}
+    assert client.get("/businesses/current/metrics", headers=headers).status_code == 401
+
+
+def test_workload_pools_have_their_own_statement_timeouts():
+    for workload, expected in [("oltp", "10s"), ("analytics", "30s"), ("batch", "0")]:
+        with database.engines[workload].connect() as connection:
+            assert connection.execute(text("SHOW statement_timeout")).scalar() == expected
+
+
+def test_exhausted_analytics_pool_does_not_block_oltp(monkeypatch):
+    db = database.SessionLocal()
+    business = models.Business(
+        email=f"business_{uuid.uuid4().hex[:8]}@example.com", name="Pool Business", password="hashedpassword",
+        phone="1234567890", description="", country="Testland", city="Test City", address="1 Test St.",
+        bank_account="1", bank_account_name="Test", bank_name="Test Bank",
+    )
+    db.add(business)
+    db.commit()
+    headers = {"Authorization": f"Bearer {create_access_token(data={'id': business.business_id, 'role': 'business'})}"}
+    db.close()
+
+    analytics = create_engine(
+        SQLALCHEMY_DATABASE_URL, poolclass=TimedQueuePool, pool_logging_name="test-analytics",
+        pool_size=1, max_overflow=0, pool_timeout=0.05
+    )
+    monkeypatch.setitem(database.sessions, "analytics", sessionmaker(bind=analytics))
+    try:
+        with analytics.connect():
+            response = client.get("/businesses/current/payouts", headers=headers)
+            assert response.status_code == 503
+            assert response.headers["Retry-After"] == "1"
+
+            assert client.get("/categories/all").status_code == 200
+            response = client.patch("/businesses/current/update", headers=headers, params={"description": "Still writable"})
+            assert response.status_code == 200
+
+        assert client.get("/businesses/current/payouts", headers=headers).status_code == 200
+    finally:
+        analytics.dispose()
+
+
+def test_analytics_routes_do_not_hold_oltp_connections(monkeypatch):
+    db = database.SessionLocal()
+    business = models.Business(
+        email=f"business_{uuid.uuid4().hex[:8]}@example.com", name="Pool Business", password="hashedpassword",
+        phone="1234567890", description="", country="Testland", city="Test City", address="1 Test St.",
+        bank_account="1", bank_account_name="Test", bank_name="Test Bank",
+    )
+    db.add(business)
+    db.commit()
+    headers = {"Authorization": f"Bearer {create_access_token(data={'id': business.business_id, 'role': 'business'})}"}
+    db.close()
+
+    oltp = create_engine(
+        SQLALCHEMY_DATABASE_URL, poolclass=TimedQueuePool, pool_logging_name="test-oltp",
+        pool_size=1, max_overflow=0, pool_timeout=0.05
+    )
+    monkeypatch.setattr(database, "SessionLocal", sessionmaker(bind=oltp))
+    monkeypatch.setitem(database.sessions, "oltp", database.SessionLocal)
+    try:
+        with oltp.connect():
+            assert client.get("/categories/all").status_code == 503
+            # The principal is not cached, so it has to be loaded on the analytics session
+            oauth2.principals.clear()
+            for path in ["/businesses/current/metrics", "/businesses/current/payouts", "/businesses/current/users"]:
+                response = client.get(path, headers=headers)
+                assert response.status_code == 200, (path, response.text)
+    finally:
+        oltp.dispose()
+
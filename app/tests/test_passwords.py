@@ -0,0 +1,74 @@
+import asyncio
+import pytest
+from threading import BoundedSemaphore
+from fastapi import HTTPException
+from fastapi.testclient import TestClient
+from passlib.context import CryptContext
+from app.main import app
+from app.database import get_db
+from app.config import settings
+from app import models, passwords, metrics
+import time
+import uuid
+
+client = TestClient(app)
+
+OLD_POLICY = CryptContext(schemes=["bcrypt"], bcrypt__rounds=4)
+
+
+def test_hash_and_verify_run_in_pool():
+    hashed = passwords.hash("secret")
+    assert hashed.startswith(f"$2b${settings.bcrypt_rounds:02d}$")
+    assert passwords.verify("secret", hashed)
+    assert not passwords.verify("wrong", hashed)
+    assert metrics.get("password_pool_seconds_count", labels={"operation": "hash"}) >= 1
+    assert metrics.get("password_pool_queue_depth") == 0
+
+
+def test_verify_and_update_rehashes_old_cost_factor():
+    valid, new_hash = passwords.verify_and_update("secret", OLD_POLICY.hash("secret"))
+    assert valid
+    assert new_hash.startswith(f"$2b${settings.bcrypt_rounds:02d}$")
+
+    valid, new_hash = passwords.verify_and_update("secret", passwords.hash("secret"))
+    assert valid and new_hash is None
+
+
+def test_full_queue_is_rejected(monkeypatch):
+    monkeypatch.setattr(passwords, "_pending", BoundedSemaphore(1))
+    passwords._pending.acquire()
+    rejected = metrics.get("password_pool_rejected_total", labels={"operation": "hash"})
+
+    # Sync callers hold a request thread, so they are turned away without waiting
+    started = time.monotonic()
+    with pytest.raises(HTTPException) as error:
+        passwords.hash("secret")
+    assert error.value.status_code == 503
+    assert time.monotonic() - started < 0.5
+    assert metrics.get("password_pool_rejected_total", labels={"operation": "hash"}) == rejected + 1
+
+    # Async callers are turned away the same way rather than polling for a slot
+    with pytest.raises(HTTPException) as error:
+        asyncio.run(passwords.verify_and_update_async("secret", "hash"))
+    assert error.value.status_code == 503
+
+
+def test_login_stores_rehash(monkeypatch):
+    email = f"user_{uuid.uuid4().hex[:8]}@example.com"
+    db = next(get_db())
+    user = models.User(email=email, name="Test User", password=OLD_POLICY.hash("password123"))
+    db.add(user)
+    db.commit()
+
+    response = client.post("/login/user", data={"username": email, "password": "password123"})
+    assert response.status_code == 200, response.text
+
+    db.refresh(user)
+    assert user.password.startswith(f"$2b${settings.bcrypt_rounds:02d}$")
+    assert passwords.verify("password123", user.password)
+    db.close()
+
+    monkeypatch.setattr(settings, "metrics_token", "scrape-token")
+    response = client.get("/metrics", headers={"Authorization": "Bearer scrape-token"})
+    assert response.status_code == 200
+    assert "password_pool_queue_depth" in response.text
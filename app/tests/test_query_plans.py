@@ -0,0 +1,199 @@
+import pytest
+from contextlib import contextmanager
+from datetime import datetime, timedelta
+from fastapi.testclient import TestClient
+from sqlalchemy import event, text
+from sqlalchemy.sql import Executable
+from app.main import app
+from app.oauth2 import create_access_token
+from app import database, models, billing, cache, fulltext, oauth2
+import uuid
+
+client = TestClient(app)
+
+# Plan regression suite: each hot query runs against seeded, analyzed tables and its
+# EXPLAIN must use the expected indexes, avoid sequential scans of the large tables and
+# stay within a cost budget. Budgets are about twice the indexed plan's cost at this scale.
+BUSINESSES, SERVICES_PER_BUSINESS, USERS, SUBSCRIPTIONS_PER_USER = 200, 10, 2000, 10
+LARGE_TABLES = {"services", "subscriptions", "transactions", "cards"}
+# Seeded emails and service names carry a token of their own, so the fixture only ever
+# touches its own rows and searches match only the services they are meant to
+RUN = uuid.uuid4().hex[:12]
+
+SEED = [
+    """
+    INSERT INTO businesses (name, description, email, password, phone, country, city, address, bank_account, bank_account_name, bank_name)
+    SELECT 'Plan Business ' || i, 'Seeded for plan tests', 'plan_business_' || :run || '_' || i || '@example.com', 'x', '1',
+           'Testland', 'Plan City', '1 Test St.', '1', 'Test', 'Test Bank'
+    FROM generate_series(1, :businesses) i
+    """,
+    """
+    INSERT INTO services (name, description, price, business_id, duration, status, created_at)
+    SELECT 'Plan Service ' || 'z' || :run || 'x' || b.business_id || 'x' || ' ' || s, 'Seeded for plan tests', s * 3.5, b.business_id, 12,
+           CASE WHEN s % 10 = 0 THEN 'inactive' ELSE 'active' END, now() - s * interval '1 hour'
+    FROM businesses b CROSS JOIN generate_series(1, :services_per_business) s
+    WHERE b.email LIKE 'plan_business_' || :run || '_%'
+    """,
+    """
+    INSERT INTO users (name, email, password)
+    SELECT 'Plan User ' || i, 'plan_user_' || :run || '_' || i || '@example.com', 'x'
+    FROM generate_series(1, :users) i
+    """,
+    """
+    INSERT INTO cards (user_id, card_number, card_expiry, card_brand)
+    SELECT user_id, '4111111111111111', '12/30', 'Visa' FROM users WHERE email LIKE 'plan_user_' || :run || '_%'
+    """,
+    # Every user subscribes to distinct services spread over all businesses
+    """
+    WITH u AS (
+        SELECT user_id, row_number() OVER (ORDER BY user_id) AS n FROM users WHERE email LIKE 'plan_user_' || :run || '_%'
+    ), s AS (
+        SELECT service_id, row_number() OVER (ORDER BY service_id) - 1 AS n, count(*) OVER () AS total
+        FROM services JOIN businesses USING (business_id) WHERE businesses.email LIKE 'plan_business_' || :run || '_%'
+    )
+    INSERT INTO subscriptions (user_id, service_id, subscription_date, expiry_date, status, next_billing_at)
+    SELECT u.user_id, s.service_id, now() - k * interval '3 days', current_date + 300,
+           CASE WHEN k % 5 = 0 THEN 'expired' ELSE 'active' END, now() + ((u.n + k) % 30) * interval '1 day'
+    FROM u CROSS JOIN generate_series(1, :subscriptions_per_user) k
+    JOIN s ON s.n = (u.n * 7 + k * 13) % s.total
+    """,
+    """
+    INSERT INTO transactions (amount, created_at, status, card_brand, subscription_id)
+    SELECT 10, subscription_date + m * interval '1 month', CASE WHEN m = 1 AND subscription_id % 7 = 0 THEN 'Pending' ELSE 'Complete' END,
+           'Visa', subscription_id
+    FROM subscriptions JOIN users USING (user_id) CROSS JOIN generate_series(0, 1) m
+    WHERE users.email LIKE 'plan_user_' || :run || '_%'
+    """,
+]
+
+
+def search_word(business_id: int) -> str:
+    # One word shared by the services of a seeded business and found nowhere else
+    return f"z{RUN}x{business_id}x"
+
+
+@pytest.fixture(scope="module")
+def seeded():
+    # Seeding runs on the batch pool, which has no statement timeout
+    db = database.sessions["batch"]()
+    try:
+        for statement in SEED:
+            db.execute(text(statement), {
+                "businesses": BUSINESSES, "services_per_business": SERVICES_PER_BUSINESS,
+                "users": USERS, "subscriptions_per_user": SUBSCRIPTIONS_PER_USER, "run": RUN,
+            })
+        fulltext.refresh_search_vectors(db, models.Business.email.like(f"plan_business_{RUN}_%"))
+        db.commit()
+        # VACUUM also flushes the GIN pending list, as autovacuum would have by now
+        with database.engines["batch"].connect().execution_options(isolation_level="AUTOCOMMIT") as connection:
+            for table in ["businesses", "users", *LARGE_TABLES]:
+                connection.execute(text(f"VACUUM ANALYZE {table}"))
+
+        user_id = db.execute(text("SELECT min(user_id) FROM users WHERE email LIKE :emails"), {"emails": f"plan_user_{RUN}_%"}).scalar()
+        business_id = db.execute(text("SELECT min(business_id) FROM businesses WHERE email LIKE :emails"), {"emails": f"plan_business_{RUN}_%"}).scalar()
+        # An active service the user has not subscribed to yet
+        service_id = db.execute(text(
+            "SELECT min(service_id) FROM services s WHERE status = 'active' AND business_id = :business_id"
+            " AND NOT EXISTS (SELECT 1 FROM subscriptions WHERE service_id = s.service_id AND user_id = :user_id)"
+        ), {"business_id": business_id, "user_id": user_id}).scalar()
+        yield {
+            "user": {"Authorization": f"Bearer {create_access_token({'id': user_id, 'role': 'user'})}"},
+            "business": {"Authorization": f"Bearer {create_access_token({'id': business_id, 'role': 'business'})}"},
+            "business_id": business_id,
+            "service_id": service_id,
+            "search_word": search_word(business_id),
+        }
+    finally:
+        db.rollback()
+        db.execute(text("DELETE FROM businesses WHERE email LIKE :emails"), {"emails": f"plan_business_{RUN}_%"})
+        db.execute(text("DELETE FROM users WHERE email LIKE :emails"), {"emails": f"plan_user_{RUN}_%"})
+        db.commit()
+        db.close()
+        cache.catalog.clear()
+
+
+@contextmanager
+def captured_statements():
+    # Statements run on any engine while the block runs, to be explained afterwards
+    statements = []
+
+    def capture(conn, clauseelement, multiparams, params, execution_options):
+        if isinstance(clauseelement, Executable) and (clauseelement.is_select or clauseelement.is_dml):
+            statements.append((clauseelement, params or (multiparams[0] if multiparams else {})))
+
+    engines = [*database.engines.values(), database.async_engine.sync_engine]
+    for engine in engines:
+        event.listen(engine, "before_execute", capture)
+    try:
+        yield statements
+    finally:
+        for engine in engines:
+            event.remove(engine, "before_execute", capture)
+
+
+def explain(statement, params):
+    compiled = statement.compile(dialect=database.engine.dialect, compile_kwargs={"render_postcompile": True})
+    with database.engine.connect() as connection:
+        return connection.exec_driver_sql("EXPLAIN (FORMAT JSON) " + str(compiled), {**compiled.params, **params}).scalar()[0]["Plan"]
+
+
+def plan_nodes(plan):
+    yield plan
+    for child in plan.get("Plans", []):
+        yield from plan_nodes(child)
+
+
+def check_plans(statements, indexes, budget):
+    assert statements
+    used = set()
+    for statement, params in statements:
+        plan = explain(statement, params)
+        nodes = list(plan_nodes(plan))
+        used.update(node["Index Name"] for node in nodes if "Index Name" in node)
+        seq_scans = [node["Relation Name"] for node in nodes if node["Node Type"] == "Seq Scan" and node["Relation Name"] in LARGE_TABLES]
+        assert not seq_scans, f"Sequential scan of {seq_scans} in:\n{statement}"
+        assert plan["Total Cost"] <= budget, f"Cost {plan['Total Cost']} over budget {budget} for:\n{statement}"
+    assert indexes <= used, f"Expected {indexes - used} in plans using {used}"
+
+
+# (role, method, path, params, indexes the plans must use, cost budget per statement)
+HOT_QUERIES = {
+    "services newest": ("user", "get", "/services/all", {"limit": "50"}, {"ix_services_active_created_at", "ix_subscriptions_user_id_service_id"}, 100),
+    "services by price": ("user", "get", "/services/all", {"sort_by": "price_asc", "limit": "50"}, {"ix_services_active_price", "ix_subscriptions_user_id_service_id"}, 100),
+    "services search": ("user", "get", "/services/all", {"search": "{search_word}", "limit": "50"}, {"ix_services_search_vector"}, 250),
+    "my services": ("business", "get", "/services/my_services", {}, {"ix_services_business_id"}, 150),
+    "subscribe": ("user", "post", "/subscriptions/create/{service_id}", {}, {"ix_subscriptions_user_id_service_id", "ix_cards_user_id"}, 50),
+    "my subscriptions": ("user", "get", "/subscriptions/my_subscriptions", {}, {"ix_subscriptions_user_id_service_id"}, 300),
+    "subscriptions amount": ("user", "get", "/subscriptions/my_subscriptions_amount", {}, {"ix_subscriptions_user_id_service_id"}, 250),
+    "my transactions": ("user", "get", "/transactions/my_transactions", {}, {"ix_subscriptions_user_id_service_id", "ix_transactions_subscription_id_created_at"}, 500),
+    "business metrics": ("business", "get", "/businesses/current/metrics", {}, {"ix_services_business_id", "ix_subscriptions_service_id_status"}, 750),
+    "business services": ("business", "get", "/businesses/current/services", {}, {"ix_services_business_id", "ix_subscriptions_service_id_status"}, 800),
+    "payouts": ("business", "get", "/businesses/current/payouts", {}, {"ix_services_business_id", "ix_subscriptions_service_id_status", "ix_transactions_subscription_id_created_at"}, 1000),
+    "business users": ("business", "get", "/businesses/current/users", {}, {"ix_services_business_id", "ix_subscriptions_service_id_status"}, 850),
+}
+
+
+@pytest.mark.parametrize("name", HOT_QUERIES)
+def test_hot_query_plan(seeded, name):
+    role, method, path, params, indexes, budget = HOT_QUERIES[name]
+    cache.catalog.clear()
+    cache.business_metrics.clear()
+    oauth2.principals.clear()
+
+    with captured_statements() as statements:
+        response = client.request(
+            method, path.format(**seeded), params={key: value.format(**seeded) for key, value in params.items()}, headers=seeded[role]
+        )
+    assert response.status_code in (200, 201), response.text
+    check_plans(statements, indexes, budget)
+
+
+def test_billing_pending_scan_plan(seeded):
+    db = database.SessionLocal()
+    try:
+        with captured_statements() as statements:
+            billing.create_pending_transactions(db, 100, datetime.utcnow() + timedelta(days=1))
+        check_plans(statements, {"ix_transactions_pending", "ix_subscriptions_next_billing_at"}, 4000)
+    finally:
+        db.rollback()
+        db.close()
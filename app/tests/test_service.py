@@ -3,7 +3,8 @@ from fastapi.testclient import TestClient
 from app.main import app
 from app.oauth2 import create_access_token
 from app.database import get_db
-from app import models
+from app import models, cache, oauth2
+import uuid
 
 client = TestClient(app)
 
@@ -73,6 +74,150 @@ def test_get_all_services(tokens):
     )
     assert response.status_code == 200, response.text
     assert isinstance(response.json(), list)
+    # Without limit or cursor the whole catalog comes back, as before pagination
+    assert "X-Next-Cursor" not in response.headers
+
+@pytest.mark.parametrize("sort_by", ["newest", "price_asc", "price_desc"])
+def test_get_all_services_cursor_pagination(tokens, sort_by):
+    user_token, _ = tokens
+    headers = {"Authorization": f"Bearer {user_token}"}
+    full = client.get("/services/all", headers=headers, params={"sort_by": sort_by})
+    assert full.status_code == 200, full.text
+
+    pages, cursor = [], None
+    while True:
+        params = {"sort_by": sort_by, "limit": 2}
+        if cursor:
+            params["cursor"] = cursor
+        response = client.get("/services/all", headers=headers, params=params)
+        assert response.status_code == 200, response.text
+        pages.extend(service["service_id"] for service in response.json())
+        cursor = response.headers.get("X-Next-Cursor")
+        if not cursor:
+            break
+
+    assert pages == [service["service_id"] for service in full.json()]
+    assert len(pages) == len(set(pages))
+
+def test_get_all_services_excludes_subscribed(tokens, fetch_ids):
+    user_id, _ = fetch_ids
+    user_token, _ = tokens
+    db = next(get_db())
+    subscribed = {row.service_id for row in db.query(models.Subscription.service_id).filter(models.Subscription.user_id == user_id)}
+    db.close()
+
+    response = client.get("/services/all", headers={"Authorization": f"Bearer {user_token}"}, params={"limit": 200})
+    assert response.status_code == 200, response.text
+    assert not subscribed & {service["service_id"] for service in response.json()}
+
+def test_service_lists_query_count(tokens, capture_statements):
+    user_token, business_token = tokens
+    for path, token in [("/services/all", user_token), ("/services/my_services", business_token)]:
+        cache.catalog.clear()
+        oauth2.principals.clear()
+        with capture_statements() as statements:
+            response = client.get(path, headers={"Authorization": f"Bearer {token}"})
+
+        assert response.status_code == 200, response.text
+        # One query for the authenticated principal, one for the services with business and category
+        assert len(statements) == 2, path
+
+def test_suggest_tracks_service_writes(tokens):
+    _, business_token = tokens
+    headers = {"Authorization": f"Bearer {business_token}"}
+    word = "zq" + uuid.uuid4().hex[:8]
+
+    response = client.post(
+        "/services/create",
+        headers=headers,
+        json={"name": f"{word} Suggested", "description": "Autocomplete", "price": 10.0, "duration": 12}
+    )
+    assert response.status_code == 200, response.text
+    service_id = response.json()["service_id"]
+
+    response = client.get("/services/suggest", params={"q": word[:5]})
+    assert response.status_code == 200, response.text
+    assert {"type": "service", "id": service_id, "name": f"{word} Suggested"} in response.json()
+
+    client.put(f"/services/update/{service_id}", headers=headers, params={"name": f"{word} Renamed"})
+    assert [s["name"] for s in client.get("/services/suggest", params={"q": word}).json()] == [f"{word} Renamed"]
+
+    client.put(f"/services/toggle-status/{service_id}", headers=headers)
+    assert client.get("/services/suggest", params={"q": word}).json() == []
+
+    client.put(f"/services/toggle-status/{service_id}", headers=headers)
+    client.delete(f"/services/delete/{service_id}", headers=headers)
+    assert client.get("/services/suggest", params={"q": word}).json() == []
+
+def test_catalog_cache_serves_hits_and_invalidates_on_write(tokens, capture_statements):
+    _, business_token = tokens
+    headers = {"Authorization": f"Bearer {business_token}"}
+    response = client.post(
+        "/services/create",
+        headers=headers,
+        json={"name": "Cached Service", "description": "Cached", "price": 10.0, "duration": 12}
+    )
+    service_id = response.json()["service_id"]
+
+    first = client.get(f"/services/{service_id}")
+    with capture_statements() as statements:
+        second = client.get(f"/services/{service_id}")
+    assert second.status_code == 200, second.text
+    assert second.json() == first.json()
+    # Only the version lookup for the ETag; the body comes from the cache
+    assert len(statements) == 1
+
+    client.put(f"/services/update/{service_id}", headers=headers, params={"price": 20.0})
+    assert client.get(f"/services/{service_id}").json()["price"] == 20.0
+
+    client.patch("/businesses/current/update", headers=headers, params={"phone": "0987654321"})
+    assert client.get(f"/services/{service_id}").json()["business"]["phone"] == "0987654321"
+
+    client.delete(f"/services/delete/{service_id}", headers=headers)
+    assert client.get(f"/services/{service_id}").status_code == 404
+
+def test_conditional_get_returns_304_until_modified(tokens):
+    _, business_token = tokens
+    headers = {"Authorization": f"Bearer {business_token}"}
+    response = client.post(
+        "/services/create",
+        headers=headers,
+        json={"name": "ETag Service", "description": "Conditional", "price": 10.0, "duration": 12}
+    )
+    service_id = response.json()["service_id"]
+    business_id = response.json()["business_id"]
+
+    for path in [f"/services/{service_id}", f"/businesses/id/{business_id}", "/categories/all", "/categories/top"]:
+        response = client.get(path)
+        assert response.status_code == 200, response.text
+        etag = response.headers["ETag"]
+        response = client.get(path, headers={"If-None-Match": etag})
+        assert response.status_code == 304, path
+        assert response.headers["ETag"] == etag
+        assert response.content == b""
+        assert client.get(path, headers={"If-None-Match": '"stale"'}).status_code == 200
+
+    etag = client.get(f"/services/{service_id}").headers["ETag"]
+    client.put(f"/services/update/{service_id}", headers=headers, params={"price": 20.0})
+    response = client.get(f"/services/{service_id}", headers={"If-None-Match": etag})
+    assert response.status_code == 200
+    assert response.json()["price"] == 20.0
+
+    # The service nests its business, so a business update changes the service's ETag too
+    etag = response.headers["ETag"]
+    client.patch("/businesses/current/update", headers=headers, params={"phone": "1234567890"})
+    assert client.get(f"/services/{service_id}", headers={"If-None-Match": etag}).status_code == 200
+
+    client.delete(f"/services/delete/{service_id}", headers=headers)
+
+def test_get_all_services_invalid_cursor(tokens):
+    user_token, _ = tokens
+    response = client.get(
+        "/services/all",
+        headers={"Authorization": f"Bearer {user_token}"},
+        params={"cursor": "not-a-cursor"}
+    )
+    assert response.status_code == 400, response.text
 
 def test_get_my_services(tokens):
     global SERVICE_ID
@@ -149,3 +294,96 @@ def test_get_current_business_services(tokens):
     )
     assert response.status_code == 200, response.text
     assert isinstance(response.json(), list)
+
+def test_search_services_ranked_and_kept_in_sync(tokens):
+    user_token, _ = tokens
+    headers = {"Authorization": f"Bearer {user_token}"}
+    word = "zq" + uuid.uuid4().hex[:8]
+    city = "city" + uuid.uuid4().hex[:8]
+
+    db = next(get_db())
+    category = models.Category(name=f"Cat{word}")
+    db.add(category)
+    db.commit()
+    business = models.Business(
+        email=f"business_{word}@example.com", name="Search Business", password="hashedpassword",
+        phone="1234567890", description="A test business", country="Testland", city=city,
+        address="123 Test St.", bank_account="12345678", bank_account_name="Test Account", bank_name="Test Bank"
+    )
+    db.add(business)
+    db.commit()
+    business_token = create_access_token({"id": business.business_id, "role": "business"})
+    business_headers = {"Authorization": f"Bearer {business_token}"}
+    db.close()
+
+    def create(name, description, category=None):
+        response = client.post(
+            "/services/create",
+            headers=business_headers,
+            params={"category": category} if category else None,
+            json={"name": name, "description": description, "price": 10.0, "duration": 12}
+        )
+        assert response.status_code == 200, response.text
+        return response.json()["service_id"]
+
+    in_description = create("Plain Service", f"Mentions {word} in the description")
+    in_name = create(f"{word} Service", "Nothing else")
+    in_category = create("Categorised Service", "Nothing else", category=f"Cat{word}")
+
+    def search(**params):
+        response = client.get("/services/all", headers=headers, params=params)
+        assert response.status_code == 200, response.text
+        return [service["service_id"] for service in response.json()]
+
+    # Ranked by relevance: a name match outweighs a description match; prefixes match too
+    assert search(search=word) == [in_name, in_description]
+    assert search(search=word[:6]) == [in_name, in_description]
+    assert search(category=word) == []
+    assert search(category=f"cat{word}") == [in_category]
+    assert set(search(city=city)) == {in_description, in_name, in_category}
+
+    # Renaming a service and moving its business re-index it
+    response = client.put(f"/services/update/{in_description}", headers=business_headers, params={"name": f"Renamed {word}"})
+    assert response.status_code == 200, response.text
+    assert set(search(search=f"renamed {word}")) == {in_description}
+
+    new_city = "city" + uuid.uuid4().hex[:8]
+    response = client.patch("/businesses/current/update", headers=business_headers, params={"city": new_city})
+    assert response.status_code == 200, response.text
+    assert search(city=city) == []
+    assert set(search(city=new_city)) == {in_description, in_name, in_category}
+
+def test_service_list_cache_is_invalidated_by_scope(tokens, fetch_ids, capture_statements):
+    user_token, business_token = tokens
+    _, business_id = fetch_ids
+    user_headers = {"Authorization": f"Bearer {user_token}"}
+    headers = {"Authorization": f"Bearer {business_token}"}
+    db = next(get_db())
+    city = db.query(models.Business.city).filter(models.Business.business_id == business_id).scalar()
+    db.close()
+    cache.catalog.clear()
+
+    def city_page():
+        return client.get("/services/all", headers=user_headers, params={"city": city})
+
+    other_city = {"city": "Zqx" + uuid.uuid4().hex[:8]}
+    assert client.get("/services/all", headers=user_headers, params=other_city).json() == []
+    city_page()
+
+    response = client.post("/services/create", headers=headers, json={"name": "Scoped Service", "description": "Scoped", "price": 10.0, "duration": 12})
+    service_id = response.json()["service_id"]
+    assert service_id in [s["service_id"] for s in city_page().json()]
+    # Lists of other cities are still served from the cache
+    with capture_statements() as statements:
+        assert client.get("/services/all", headers=user_headers, params=other_city).json() == []
+    assert statements == []
+
+    # Pages showing the service see edits that don't change which lists it is on
+    client.put(f"/services/update/{service_id}", headers=headers, params={"duration": 6})
+    assert {s["service_id"]: s["duration"] for s in city_page().json()}[service_id] == 6
+
+    client.put(f"/services/toggle-status/{service_id}", headers=headers)
+    assert service_id not in [s["service_id"] for s in city_page().json()]
+    client.put(f"/services/toggle-status/{service_id}", headers=headers)
+    assert service_id in [s["service_id"] for s in city_page().json()]
+    client.delete(f"/services/delete/{service_id}", headers=headers)
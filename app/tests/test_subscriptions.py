@@ -6,6 +6,7 @@ from app import models
 from app.oauth2 import create_access_token
 import random
 import string
+from datetime import datetime, timedelta
 
 client = TestClient(app)
 
@@ -164,3 +165,130 @@ def test_get_my_subscriptions_amount(setup_data):
     assert response.status_code == 200, f"Unexpected status code: {response.status_code}. Response: {response.text}"
     total_amount = response.json()["monthly_payable"]
     assert total_amount == 100.0, f"Expected 100.0, got {total_amount}"
+
+def test_get_my_subscriptions_is_read_only(setup_data):
+    """Test that listing subscriptions computes days left without writing, and hides expired ones."""
+    db = next(get_db())
+    user_id = setup_data["user_id"]
+    user_token = create_access_token(data={"id": user_id, "role": "user"})
+
+    subscription_date = datetime.utcnow() - timedelta(days=40)
+    expired = models.Subscription(
+        service_id=setup_data["service_id"],
+        user_id=user_id,
+        subscription_date=subscription_date,
+        expiry_date=(datetime.utcnow() - timedelta(days=1)).date(),
+        status="active",
+        days_till_next_payment=30
+    )
+    current = models.Subscription(
+        service_id=setup_data["service_id"],
+        user_id=user_id,
+        subscription_date=subscription_date,
+        expiry_date=(datetime.utcnow() + timedelta(days=30)).date(),
+        status="active",
+        days_till_next_payment=30
+    )
+    db.add_all([expired, current])
+    db.commit()
+
+    response = client.get(
+        "/subscriptions/my_subscriptions",
+        headers={"Authorization": f"Bearer {user_token}"}
+    )
+    assert response.status_code == 200, response.text
+    subscriptions = response.json()
+    assert len(subscriptions) == 1
+    assert subscriptions[0]["days_till_next_payment"] == 19
+    assert subscriptions[0]["progress_bar_next_payment"] == 0.4
+
+    db.expire_all()
+    assert db.query(models.Subscription).filter(models.Subscription.user_id == user_id).count() == 2
+    assert db.get(models.Subscription, current.subscription_id).days_till_next_payment == 30
+
+    from app.expiry import expire_subscriptions
+    expire_subscriptions(db)
+    assert db.query(models.Subscription).filter(models.Subscription.user_id == user_id).count() == 1
+
+def test_get_my_subscriptions_query_count(setup_data, capture_statements):
+    """Test that listing subscriptions loads their nested service, business, category and user eagerly."""
+    db = next(get_db())
+    user_id = setup_data["user_id"]
+    user_token = create_access_token(data={"id": user_id, "role": "user"})
+
+    service = db.get(models.Service, setup_data["service_id"])
+    other_service = models.Service(name="Other Service", description="Another service", price=50.0, duration=30, business_id=service.business_id, status="active")
+    db.add(other_service)
+    db.commit()
+    for service_id in [service.service_id, other_service.service_id]:
+        db.add(models.Subscription(service_id=service_id, user_id=user_id, expiry_date=(datetime.utcnow() + timedelta(days=30)).date(), status="active"))
+    db.commit()
+
+    with capture_statements() as statements:
+        response = client.get(
+            "/subscriptions/my_subscriptions",
+            headers={"Authorization": f"Bearer {user_token}"}
+        )
+
+    assert response.status_code == 200, response.text
+    assert {s["service"]["name"] for s in response.json()} == {"Test Service", "Other Service"}
+    # One query for the authenticated user, one for the subscriptions with everything they nest
+    assert len(statements) == 2
+
+def test_expiry_sweeper_archives_transactions(setup_data):
+    """Test that expired subscriptions and their transactions are moved to the archive tables."""
+    db = next(get_db())
+    expired = models.Subscription(
+        service_id=setup_data["service_id"],
+        user_id=setup_data["user_id"],
+        subscription_date=datetime.utcnow() - timedelta(days=90),
+        expiry_date=(datetime.utcnow() - timedelta(days=1)).date(),
+        status="active",
+        days_till_next_payment=30
+    )
+    db.add(expired)
+    db.commit()
+    transaction = models.Transaction(
+        amount=100.0,
+        status="Complete",
+        subscription_id=expired.subscription_id,
+        card_brand="Visa"
+    )
+    db.add(transaction)
+    db.commit()
+    subscription_id, transaction_id = expired.subscription_id, transaction.transaction_id
+
+    from app.expiry import expire_subscriptions
+    expire_subscriptions(db, batch_size=1)
+    db.expire_all()
+
+    assert db.get(models.Subscription, subscription_id) is None
+    assert db.get(models.Transaction, transaction_id) is None
+    assert db.get(models.SubscriptionArchive, subscription_id).user_id == setup_data["user_id"]
+    assert db.get(models.TransactionArchive, transaction_id).amount == 100.0
+
+def test_expiry_sweeper_returns_services_to_cached_lists(setup_data):
+    """Test that archiving a subscription invalidates the user's cached /services/all pages."""
+    db = next(get_db())
+    user_token = create_access_token(data={"id": setup_data["user_id"], "role": "user"})
+    db.add(models.Subscription(
+        service_id=setup_data["service_id"],
+        user_id=setup_data["user_id"],
+        subscription_date=datetime.utcnow() - timedelta(days=90),
+        expiry_date=(datetime.utcnow() - timedelta(days=1)).date(),
+        status="active"
+    ))
+    db.commit()
+
+    def listed_service_ids():
+        response = client.get("/services/all", headers={"Authorization": f"Bearer {user_token}"})
+        assert response.status_code == 200, response.text
+        return {service["service_id"] for service in response.json()}
+
+    # Subscribed services are left out, and the page is now cached
+    assert setup_data["service_id"] not in listed_service_ids()
+
+    from app.expiry import expire_subscriptions
+    expire_subscriptions(db)
+
+    assert setup_data["service_id"] in listed_service_ids()
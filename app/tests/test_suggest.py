@@ -0,0 +1,57 @@
+from app.database import SessionLocal
+from app.suggest import PrefixIndex
+
+
+def test_prefix_index_matches_word_prefixes():
+    index = PrefixIndex(refresh_seconds=60)
+    index.add("service", 1, "Best Gym Tashkent")
+    index.add("service", 2, "Gymnastics Club")
+    index.add("business", 1, "Tashkent Fitness")
+
+    assert [r["id"] for r in index.search("gym")] == [1, 2]
+    assert {(r["type"], r["id"]) for r in index.search("TASH")} == {("service", 1), ("business", 1)}
+    assert index.search("gym tash") == [{"type": "service", "id": 1, "name": "Best Gym Tashkent"}]
+    assert index.search("yoga") == []
+    assert index.search("  ") == []
+    assert len(index.search("t", limit=1)) == 1
+
+
+def test_prefix_index_updates_and_removes():
+    index = PrefixIndex(refresh_seconds=60)
+    index.add("service", 1, "Yoga Studio")
+    index.add("service", 1, "Pilates Studio")
+    assert index.search("yoga") == []
+    assert [r["name"] for r in index.search("studio")] == ["Pilates Studio"]
+
+    index.remove("service", 1)
+    index.remove("service", 1)
+    assert index.search("studio") == []
+
+
+def test_prefix_index_keeps_writes_made_during_a_load():
+    index = PrefixIndex(refresh_seconds=60)
+
+    class WriteDuringLoad:
+        # Another request saves a service between the load's query and the swap
+        def __init__(self, db):
+            self.db = db
+
+        def query(self, *columns):
+            index.add("service", -1, "Racing Write Zqx")
+            return self.db.query(*columns)
+
+    db = SessionLocal()
+    try:
+        index.load(WriteDuringLoad(db))
+    finally:
+        db.close()
+    assert index.search("zqx") == [{"type": "service", "id": -1, "name": "Racing Write Zqx"}]
+
+
+def test_prefix_index_refresh_is_single_flight():
+    index = PrefixIndex(refresh_seconds=60)
+    assert index.is_stale()
+    assert index.claim_refresh()
+    assert not index.claim_refresh()
+    index.refresh_finished()
+    assert index.claim_refresh()
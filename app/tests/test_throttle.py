@@ -0,0 +1,74 @@
+import pytest
+from fastapi.testclient import TestClient
+from pydantic import ValidationError
+from app.main import app
+from app.config import Settings
+from app.throttle import LocalBuckets
+from app import throttle
+import time
+import uuid
+
+client = TestClient(app)
+
+
+def test_bucket_allows_burst_then_refills():
+    buckets = LocalBuckets(max_keys=10)
+    assert [buckets.take("key", capacity=2, rate=100) for _ in range(2)] == [0, 0]
+    assert buckets.take("key", capacity=2, rate=100) > 0
+
+    time.sleep(0.02)
+    assert buckets.take("key", capacity=2, rate=100) == 0
+
+
+def test_buckets_are_bounded():
+    buckets = LocalBuckets(max_keys=2)
+    buckets.take("a", capacity=1, rate=0.001)
+    buckets.take("b", capacity=1, rate=0.001)
+    buckets.take("c", capacity=1, rate=0.001)
+    # "a" was evicted and starts with a full bucket again
+    assert buckets.take("a", capacity=1, rate=0.001) == 0
+    assert buckets.take("c", capacity=1, rate=0.001) > 0
+
+
+def test_login_is_throttled_per_account_before_the_database(monkeypatch, capture_statements):
+    monkeypatch.setattr(throttle, "login_buckets", LocalBuckets(max_keys=100))
+    email = f"user_{uuid.uuid4().hex[:8]}@example.com"
+    credentials = {"username": email, "password": "wrong"}
+
+    for _ in range(throttle.settings.login_account_burst):
+        assert client.post("/login/user", data=credentials).status_code == 403
+
+    with capture_statements() as statements:
+        response = client.post("/login/user", data=credentials)
+    assert response.status_code == 429, response.text
+    assert int(response.headers["Retry-After"]) >= 1
+    assert statements == []
+
+    # Other accounts and the business login are separate buckets
+    assert client.post("/login/user", data={"username": f"other_{email}", "password": "wrong"}).status_code == 403
+    assert client.post("/login/business", data=credentials).status_code == 403
+
+
+def test_login_is_throttled_per_forwarded_client_ip(monkeypatch):
+    monkeypatch.setattr(throttle, "login_buckets", LocalBuckets(max_keys=100))
+    monkeypatch.setattr(throttle.settings, "trusted_proxy_hops", 1)
+    monkeypatch.setattr(throttle.settings, "login_ip_burst", 2)
+    monkeypatch.setattr(throttle.settings, "login_account_burst", 1)
+    accounts = [f"user_{uuid.uuid4().hex[:8]}@example.com" for _ in range(3)]
+
+    def attempt(account, forwarded_for):
+        data = {"username": account, "password": "wrong"}
+        return client.post("/login/user", data=data, headers={"X-Forwarded-For": forwarded_for}).status_code
+
+    # The router appends the real address; the spoofed entries before it are ignored
+    assert attempt(accounts[0], "10.0.0.1, 203.0.113.7") == 403
+    assert attempt(accounts[1], "10.0.0.2, 203.0.113.7") == 403
+    assert attempt(accounts[2], "10.0.0.3, 203.0.113.7") == 429
+    # The refused attempt did not spend the account's bucket
+    assert attempt(accounts[2], "203.0.113.8") == 403
+
+
+def test_login_rates_must_be_positive(monkeypatch):
+    monkeypatch.setenv("LOGIN_ACCOUNT_PER_MINUTE", "0")
+    with pytest.raises(ValidationError):
+        Settings()
@@ -5,6 +5,7 @@ from app.database import get_db
 from app import models
 from app.oauth2 import create_access_token
 from datetime import datetime, timedelta
+from pytz import UTC
 from sqlalchemy.orm import Session
 import random
 import string
@@ -67,15 +68,16 @@ def setup_data():
     db.commit()
     db.refresh(card)
 
-    subscription_date = datetime.utcnow()
-    expiry_date = subscription_date + timedelta(days=30)
+    subscription_date = datetime.utcnow() - timedelta(days=25, hours=12)
+    expiry_date = subscription_date + timedelta(days=60)
     subscription = models.Subscription(
         service_id=service.service_id,
         user_id=user.user_id,
         subscription_date=subscription_date,
         expiry_date=expiry_date,
         status="active",
-        days_till_next_payment=5
+        days_till_next_payment=4,
+        next_billing_at=subscription_date + timedelta(days=30)  # due in 4.5 days
     )
     db.add(subscription)
     db.commit()
@@ -94,7 +96,7 @@ def test_transaction_processing_pending(setup_data):
 
     subscription = db.query(models.Subscription).filter(models.Subscription.subscription_id == subscription_id).first()
 
-    from app.routers.transaction import process_transactions
+    from app.billing import process_transactions
     process_transactions(db)
 
     transaction = db.query(models.Transaction).filter(
@@ -110,7 +112,8 @@ def test_transaction_processing_complete(setup_data):
     subscription_id = setup_data["subscription_id"]
 
     subscription = db.query(models.Subscription).filter(models.Subscription.subscription_id == subscription_id).first()
-    subscription.days_till_next_payment = 0
+    # The payment date has arrived
+    subscription.next_billing_at = datetime.utcnow() - timedelta(minutes=1)
     db.commit()
 
     user_card = db.query(models.Card).filter(models.Card.user_id == subscription.user_id).first()
@@ -125,7 +128,7 @@ def test_transaction_processing_complete(setup_data):
     db.commit()
     db.refresh(transaction)
 
-    from app.routers.transaction import process_transactions
+    from app.billing import process_transactions
     process_transactions(db)
 
     completed_transaction = db.query(models.Transaction).filter(
@@ -135,3 +138,122 @@ def test_transaction_processing_complete(setup_data):
 
     assert completed_transaction is not None, "Expected a transaction to be marked as complete"
     assert completed_transaction.created_at.date() == datetime.utcnow().date()
+
+    db.refresh(subscription)
+    assert subscription.next_billing_at > datetime.utcnow().replace(tzinfo=UTC) + timedelta(days=29), "Expected the next billing date to advance"
+
+def test_overdue_subscription_is_charged_once_and_caught_up(setup_data):
+    db = next(get_db())
+    subscription = db.get(models.Subscription, setup_data["subscription_id"])
+    # Three whole cycles were missed, e.g. while the worker was down
+    missed_at = datetime.utcnow().replace(tzinfo=UTC) - timedelta(days=95)
+    subscription.next_billing_at = missed_at
+    db.commit()
+
+    from app.billing import process_transactions
+    process_transactions(db)
+
+    charges = db.query(models.Transaction).filter(models.Transaction.subscription_id == subscription.subscription_id).all()
+    assert [charge.status for charge in charges] == ["Complete"]
+    db.refresh(subscription)
+    assert subscription.next_billing_at == missed_at + timedelta(days=120)
+    assert subscription.days_left > 0
+
+
+def test_cardless_subscription_is_advanced_without_charge(setup_data):
+    db = next(get_db())
+    db.query(models.Card).filter(models.Card.user_id == setup_data["user_id"]).delete()
+    subscription = db.get(models.Subscription, setup_data["subscription_id"])
+    due_at = datetime.utcnow().replace(tzinfo=UTC) - timedelta(days=1)
+    subscription.next_billing_at = due_at
+    db.commit()
+
+    from app.billing import process_transactions
+    process_transactions(db)
+
+    assert db.query(models.Transaction).filter(models.Transaction.subscription_id == subscription.subscription_id).count() == 0
+    db.refresh(subscription)
+    assert subscription.next_billing_at == due_at + timedelta(days=30)
+
+
+def test_expired_subscription_is_not_billed_before_the_sweep(setup_data):
+    db = next(get_db())
+    subscription = db.get(models.Subscription, setup_data["subscription_id"])
+    # Past its expiry date but not archived yet; billing runs before the expiry sweep
+    due_at = datetime.utcnow().replace(tzinfo=UTC) - timedelta(days=1)
+    subscription.expiry_date = (datetime.utcnow() - timedelta(days=2)).date()
+    subscription.next_billing_at = due_at
+    db.commit()
+
+    from app.billing import process_transactions
+    process_transactions(db)
+
+    assert db.query(models.Transaction).filter(models.Transaction.subscription_id == subscription.subscription_id).count() == 0
+    db.refresh(subscription)
+    assert subscription.next_billing_at == due_at
+
+
+def test_advancing_a_subscription_invalidates_the_users_cached_pages(setup_data):
+    from app import cache
+    db = next(get_db())
+    subscription = db.get(models.Subscription, setup_data["subscription_id"])
+    subscription.next_billing_at = datetime.utcnow().replace(tzinfo=UTC) - timedelta(days=1)
+    db.commit()
+    tag = f"user:{setup_data['user_id']}"
+    before = cache.catalog.backend.versions([tag])
+
+    from app.billing import process_transactions
+    process_transactions(db)
+
+    assert cache.catalog.backend.versions([tag]) != before
+
+
+def test_get_my_transactions_does_not_bill(setup_data):
+    db = next(get_db())
+    user_token = create_access_token(data={"id": setup_data["user_id"], "role": "user"})
+
+    response = client.get(
+        "/transactions/my_transactions",
+        headers={"Authorization": f"Bearer {user_token}"}
+    )
+    assert response.status_code == 200, response.text
+    assert response.json() == []
+
+    pending = db.query(models.Transaction).filter(
+        models.Transaction.subscription_id == setup_data["subscription_id"]
+    ).count()
+    assert pending == 0, "Reading transactions must not create pending transactions"
+
+def test_transaction_processing_is_idempotent_across_chunks(setup_data):
+    db = next(get_db())
+    subscription_id = setup_data["subscription_id"]
+
+    from app.billing import process_transactions
+    process_transactions(db, chunk_size=1)
+    process_transactions(db, chunk_size=1)
+
+    pending = db.query(models.Transaction).filter(
+        models.Transaction.subscription_id == subscription_id,
+        models.Transaction.status == "Pending"
+    ).count()
+    assert pending == 1, "Expected exactly one pending transaction after repeated runs"
+
+def test_get_my_transactions_query_count(setup_data, capture_statements):
+    db = next(get_db())
+    for status in ["Complete", "Complete", "Pending"]:
+        db.add(models.Transaction(amount=100.0, status=status, subscription_id=setup_data["subscription_id"], card_brand="Visa"))
+    db.commit()
+    user_token = create_access_token(data={"id": setup_data["user_id"], "role": "user"})
+
+    with capture_statements() as statements:
+        response = client.get(
+            "/transactions/my_transactions",
+            headers={"Authorization": f"Bearer {user_token}"}
+        )
+
+    assert response.status_code == 200, response.text
+    data = response.json()
+    assert len(data) == 3
+    assert data[0]["subscription"]["service"]["business"]["business_id"] == setup_data["business_id"]
+    # One query for the authenticated user, one for the transactions with everything they nest
+    assert len(statements) == 2
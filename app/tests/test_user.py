@@ -103,3 +103,22 @@ def test_update_user_no_auth(client):
     )
     assert response.status_code == 401
     assert response.json()["detail"] == "Not authenticated"
+
+
+def test_principal_is_cached_until_profile_update(client, capture_statements):
+    db = next(get_db())
+    user_id = get_user_id_by_email(RANDOM_EMAIL, db)
+    db.close()
+    headers = {"Authorization": f"Bearer {create_access_token(data={'id': user_id, 'role': 'user'})}"}
+    assert client.get("/users/current", headers=headers).status_code == 200
+
+    with capture_statements() as statements:
+        response = client.get("/users/current", headers=headers)
+    assert response.status_code == 200, response.text
+    # Only the card and the subscription count; the user row comes from the principal cache
+    assert len(statements) == 2
+    assert not any("FROM users" in statement for statement in statements)
+
+    response = client.patch("/users/update", headers=headers, params={"name": "Renamed User"})
+    assert response.status_code == 200, response.text
+    assert client.get("/users/current", headers=headers).json()["name"] == "Renamed User"
@@ -0,0 +1,117 @@
+from collections import OrderedDict
+from threading import Lock
+from fastapi import HTTPException, Request, status
+from .config import settings
+from . import metrics
+import asyncio
+import math
+import time
+
+
+# Token buckets: each key holds up to `capacity` attempts and regains `rate` per second.
+# take() spends one token and returns 0 when allowed, or the seconds until one is available.
+class LocalBuckets:
+    # Per-process; least recently used keys are dropped beyond max_keys (a dropped key
+    # simply starts again with a full bucket)
+    blocking = False
+
+    def __init__(self, max_keys: int):
+        self.max_keys = max_keys
+        self._buckets = OrderedDict()
+        self._lock = Lock()
+
+    def take(self, key: str, capacity: float, rate: float) -> float:
+        now = time.monotonic()
+        with self._lock:
+            tokens, updated = self._buckets.pop(key, (capacity, now))
+            tokens = min(capacity, tokens + (now - updated) * rate)
+            if tokens >= 1:
+                tokens -= 1
+                retry_after = 0
+            else:
+                retry_after = (1 - tokens) / rate
+            self._buckets[key] = (tokens, now)
+            while len(self._buckets) > self.max_keys:
+                self._buckets.popitem(last=False)
+            return retry_after
+
+    def clear(self):
+        with self._lock:
+            self._buckets.clear()
+
+
+class RedisBuckets:
+    # Shared by every worker process; the bucket update runs atomically in Redis
+    blocking = True
+    SCRIPT = """
+        local capacity, rate, now = tonumber(ARGV[1]), tonumber(ARGV[2]), tonumber(ARGV[3])
+        local bucket = redis.call('HMGET', KEYS[1], 'tokens', 'updated')
+        local tokens = tonumber(bucket[1]) or capacity
+        local updated = tonumber(bucket[2]) or now
+        tokens = math.min(capacity, tokens + math.max(0, now - updated) * rate)
+        local retry_after = 0
+        if tokens >= 1 then
+            tokens = tokens - 1
+        else
+            retry_after = (1 - tokens) / rate
+        end
+        redis.call('HSET', KEYS[1], 'tokens', tokens, 'updated', now)
+        redis.call('EXPIRE', KEYS[1], math.ceil(capacity / rate))
+        return tostring(retry_after)
+    """
+
+    def __init__(self, url: str, prefix: str = "semprefy:throttle:"):
+        import redis
+
+        self._redis = redis.Redis.from_url(url)
+        self._take = self._redis.register_script(self.SCRIPT)
+        self.prefix = prefix
+
+    def take(self, key: str, capacity: float, rate: float) -> float:
+        return float(self._take(keys=[self.prefix + key], args=[capacity, rate, time.time()]))
+
+    def clear(self):
+        for key in self._redis.scan_iter(self.prefix + "*"):
+            self._redis.delete(key)
+
+
+def login_backend():
+    if settings.throttle_redis_url:
+        return RedisBuckets(settings.throttle_redis_url)
+    return LocalBuckets(settings.login_throttle_max_keys)
+
+
+login_buckets = login_backend()
+
+
+def client_ip(request: Request) -> str:
+    # Each trusted proxy appends the address it was connected from to X-Forwarded-For, so
+    # the entry trusted_proxy_hops from the right is the client; anything left of it was
+    # sent by the client and can be spoofed
+    if settings.trusted_proxy_hops > 0:
+        forwarded = [host.strip() for header in request.headers.getlist("x-forwarded-for") for host in header.split(",")]
+        if len(forwarded) >= settings.trusted_proxy_hops:
+            return forwarded[-settings.trusted_proxy_hops]
+    return request.client.host if request.client else "unknown"
+
+
+async def check_login(request: Request, role: str, username: str):
+    # Called before the account lookup, so throttled attempts never reach the database or
+    # bcrypt. The account bucket is only spent when the IP bucket allows the attempt, so a
+    # throttled address can't keep an account locked out.
+    limits = [
+        ("ip", f"login:ip:{client_ip(request)}", settings.login_ip_burst, settings.login_ip_per_minute / 60),
+        ("account", f"login:{role}:{username.strip().lower()}", settings.login_account_burst, settings.login_account_per_minute / 60),
+    ]
+    for scope, key, capacity, rate in limits:
+        if login_buckets.blocking:
+            retry_after = await asyncio.to_thread(login_buckets.take, key, capacity, rate)
+        else:
+            retry_after = login_buckets.take(key, capacity, rate)
+        if retry_after:
+            metrics.inc("login_throttled_total", labels={"scope": scope})
+            raise HTTPException(
+                status_code=status.HTTP_429_TOO_MANY_REQUESTS,
+                detail="Too many login attempts, please retry later",
+                headers={"Retry-After": str(math.ceil(retry_after))}
+            )
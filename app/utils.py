@@ -1,9 +1,8 @@
-from passlib.context import CryptContext
-
 #AWS
 import boto3
 from uuid import uuid4
 from .config import settings
+from . import passwords
 from fastapi import UploadFile, HTTPException, status
 import logging
 import re
@@ -66,14 +65,12 @@ def upload_image_to_s3(file: UploadFile) -> str:
 
 
 
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
-
-
+# bcrypt runs in the password worker pool (app/passwords.py)
 def hash(password: str):
-    return pwd_context.hash(password)
+    return passwords.hash(password)
 
 def verify(plain_password, hashed_password):
-    return pwd_context.verify(plain_password, hashed_password)
+    return passwords.verify(plain_password, hashed_password)
 
 
 
@@ -0,0 +1,56 @@
+import argparse
+import logging
+import time
+from .database import sessions
+from . import billing, expiry, stats, ranking
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# Background jobs. Each job receives its own session on the batch pool and commits its own work.
+# Cache tags they bump only reach the API processes through a shared (Redis) catalog backend;
+# with the local backend those pages stay stale for up to catalog_cache_ttl_seconds.
+JOBS = {
+    "billing": billing.process_transactions,
+    "expiry": expiry.expire_subscriptions,
+    "rebuild-stats": stats.rebuild_daily_stats,
+    "rank-categories": ranking.rank_categories,
+}
+# Jobs run on every scheduled tick; the others only when named on the command line
+SCHEDULED_JOBS = ["billing", "expiry", "rank-categories"]
+
+
+def run_jobs(names):
+    for name in names:
+        db = sessions["batch"]()
+        started = time.perf_counter()
+        try:
+            JOBS[name](db)
+        except Exception:
+            db.rollback()
+            logger.exception(f"Job '{name}' failed")
+        else:
+            logger.info(f"Job '{name}' finished in {time.perf_counter() - started:.2f}s")
+        finally:
+            db.close()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Run Semprefy background jobs")
+    parser.add_argument("jobs", nargs="*", help=f"Jobs to run: {', '.join(JOBS)} (default: {', '.join(SCHEDULED_JOBS)})")
+    parser.add_argument("--interval", type=int, default=0, help="Repeat every N seconds instead of running once")
+    args = parser.parse_args(argv)
+    names = args.jobs or SCHEDULED_JOBS
+    unknown = [name for name in names if name not in JOBS]
+    if unknown:
+        parser.error(f"Unknown job(s): {', '.join(unknown)}")
+
+    while True:
+        run_jobs(names)
+        if not args.interval:
+            break
+        time.sleep(args.interval)
+
+
+if __name__ == "__main__":
+    main()
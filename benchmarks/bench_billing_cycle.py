@@ -0,0 +1,61 @@
+"""Microbenchmark: per-row cost of next-payment computation by subscription age.
+
+The batch column times a NumPy form over a whole array of dates; the app computes
+next payments in SQL instead, so NumPy is only needed here (pip install numpy).
+
+Run from the repository root: python -m benchmarks.bench_billing_cycle
+"""
+from datetime import datetime, timedelta
+from pytz import UTC
+import numpy as np
+import timeit
+from app import billing_cycle
+
+ROWS = 10000
+NOW = datetime(2024, 11, 26, tzinfo=UTC)
+
+
+def loop_days_till_next_payment(subscription_date, now):
+    # The previous per-row implementation
+    next_payment_date = subscription_date + timedelta(days=30)
+    while next_payment_date < now:
+        next_payment_date += timedelta(days=30)
+    return (next_payment_date - now).days
+
+
+def as_datetime64(dates) -> np.ndarray:
+    # NumPy has no timezone support, so aware datetimes are normalised to naive UTC first
+    return np.array([d.astimezone(UTC).replace(tzinfo=None) for d in dates], dtype="datetime64[us]")
+
+
+# Vectorised form of billing_cycle.days_till_next_payment over an array of subscription dates (UTC)
+def days_till_next_payment_batch(dates: np.ndarray, now: datetime) -> np.ndarray:
+    period_us = billing_cycle.BILLING_PERIOD // timedelta(microseconds=1)
+    day_us = timedelta(days=1) // timedelta(microseconds=1)
+    now64 = np.datetime64(now.astimezone(UTC).replace(tzinfo=None), "us")
+
+    elapsed_us = (now64 - dates).astype(np.int64)
+    periods = np.maximum(1, -(-elapsed_us // period_us))
+    return (periods * period_us - elapsed_us) // day_us
+
+
+def per_row_ns(func, dates, repeat=3):
+    best = min(timeit.repeat(lambda: func(dates), number=1, repeat=repeat))
+    return best / len(dates) * 1e9
+
+
+def main():
+    print(f"{'age':>10} {'while loop':>14} {'closed form':>14} {'batch':>14}  (ns/row)")
+    for age_days in (1, 365, 5 * 365, 20 * 365):
+        dates = [NOW - timedelta(days=age_days, seconds=i) for i in range(ROWS)]
+        array = as_datetime64(dates)
+        assert list(days_till_next_payment_batch(array, NOW)) == [billing_cycle.days_till_next_payment(d, NOW) for d in dates]
+
+        loop = per_row_ns(lambda ds: [loop_days_till_next_payment(d, NOW) for d in ds], dates)
+        closed = per_row_ns(lambda ds: [billing_cycle.days_till_next_payment(d, NOW) for d in ds], dates)
+        batch = per_row_ns(lambda ds: days_till_next_payment_batch(ds, NOW), array)
+        print(f"{age_days:>9}d {loop:>14.0f} {closed:>14.0f} {batch:>14.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,31 @@
+"""Microbenchmark: autocomplete lookup latency of the in-process prefix index.
+
+Run from the repository root: python -m benchmarks.bench_suggest
+"""
+import random
+import string
+import timeit
+from app.suggest import PrefixIndex
+
+NAMES = 100000
+
+
+def random_name(rng):
+    return " ".join("".join(rng.choices(string.ascii_lowercase, k=rng.randint(3, 9))) for _ in range(rng.randint(1, 4)))
+
+
+def main():
+    rng = random.Random(42)
+    index = PrefixIndex(refresh_seconds=3600)
+    for i in range(NAMES):
+        index.add("service", i, random_name(rng))
+
+    print(f"{'prefix length':>14} {'lookup':>12}  (us, limit 10, {NAMES} names)")
+    for length in (1, 2, 3, 5):
+        prefixes = ["".join(rng.choices(string.ascii_lowercase, k=length)) for _ in range(1000)]
+        best = min(timeit.repeat(lambda: [index.search(p) for p in prefixes], number=1, repeat=3))
+        print(f"{length:>14} {best / len(prefixes) * 1e6:>12.1f}")
+
+
+if __name__ == "__main__":
+    main()
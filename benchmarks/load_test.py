@@ -0,0 +1,73 @@
+"""Load test: throughput and latency of API routes at a given concurrency.
+
+Start the server first (uvicorn app.main:app --workers 1), then run from the repository root:
+
+    python -m benchmarks.load_test --url http://localhost:8000 --user-id 1 --concurrency 200
+
+Run it against two builds (for example before and after a change) with the same
+arguments to compare them.
+"""
+import argparse
+import asyncio
+import statistics
+import time
+import httpx
+from app.oauth2 import create_access_token
+
+DEFAULT_PATHS = ["/services/all?limit=50", "/subscriptions/my_subscriptions", "/transactions/my_transactions"]
+
+
+async def worker(client, paths, headers, deadline, latencies, errors):
+    i = 0
+    while time.perf_counter() < deadline:
+        path = paths[i % len(paths)]
+        i += 1
+        started = time.perf_counter()
+        try:
+            response = await client.get(path, headers=headers)
+            if response.status_code != 200:
+                errors.append(response.status_code)
+                continue
+        except httpx.HTTPError as error:
+            errors.append(type(error).__name__)
+            continue
+        latencies.append(time.perf_counter() - started)
+
+
+async def run(url, paths, headers, concurrency, duration):
+    latencies, errors = [], []
+    limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+    async with httpx.AsyncClient(base_url=url, limits=limits, timeout=60) as client:
+        deadline = time.perf_counter() + duration
+        started = time.perf_counter()
+        await asyncio.gather(*(worker(client, paths, headers, deadline, latencies, errors) for _ in range(concurrency)))
+        elapsed = time.perf_counter() - started
+    return latencies, errors, elapsed
+
+
+def percentile(values, fraction):
+    return sorted(values)[min(len(values) - 1, int(len(values) * fraction))] if values else 0
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Load test Semprefy API routes")
+    parser.add_argument("--url", default="http://localhost:8000")
+    parser.add_argument("--path", action="append", dest="paths", help=f"Route to request (repeatable, default: {', '.join(DEFAULT_PATHS)})")
+    parser.add_argument("--user-id", type=int, required=True, help="User to authenticate as")
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[10, 50, 200])
+    parser.add_argument("--duration", type=float, default=10, help="Seconds per concurrency level")
+    args = parser.parse_args()
+
+    headers = {"Authorization": f"Bearer {create_access_token({'id': args.user_id, 'role': 'user'})}"}
+    paths = args.paths or DEFAULT_PATHS
+    print(f"{'concurrency':>11} {'req/s':>9} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8} {'errors':>7}")
+    for concurrency in args.concurrency:
+        latencies, errors, elapsed = asyncio.run(run(args.url, paths, headers, concurrency, args.duration))
+        print(
+            f"{concurrency:>11} {len(latencies) / elapsed:>9.0f} {statistics.median(latencies) * 1000 if latencies else 0:>8.1f} "
+            f"{percentile(latencies, 0.95) * 1000:>8.1f} {percentile(latencies, 0.99) * 1000:>8.1f} {len(errors):>7}"
+        )
+
+
+if __name__ == "__main__":
+    main()